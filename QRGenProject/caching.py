@@ -0,0 +1,242 @@
+"""
+HTTP caching policies shared by the scan, download and media routes.
+
+- static codes and stored files never change behind their URL, so they
+  get long-lived public caching
+- dynamic code redirects can be edited at any time, so browsers and a
+  fronting proxy only keep them for a short while and revalidate in the
+  background
+- generated images are written once under a unique name, so they are
+  immutable and served with ETag/Last-Modified validators, in the
+  smallest format the client accepts (QRGenProject.variants)
+- public pages only change with a deployment, anonymous visitors get a
+  copy rendered and compressed once per release (cache_anonymous_page)
+"""
+import gzip
+import hashlib
+import os
+import posixpath
+import re
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import Http404, HttpResponse
+from django.template.utils import get_app_template_dirs
+from django.utils._os import safe_join
+from django.utils.cache import (
+    get_conditional_response,
+    patch_cache_control,
+    patch_vary_headers,
+)
+from django.utils.http import http_date, quote_etag
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+from .media import send_file
+
+ONE_YEAR = 60 * 60 * 24 * 365
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def cache_static(response):
+    patch_cache_control(
+        response, public=True, max_age=_setting("STATIC_CODE_CACHE_MAX_AGE", ONE_YEAR)
+    )
+    return response
+
+
+def cache_dynamic(response):
+    patch_cache_control(
+        response,
+        public=True,
+        max_age=_setting("DYNAMIC_CODE_CACHE_MAX_AGE", 60),
+        stale_while_revalidate=_setting("DYNAMIC_CODE_STALE_WHILE_REVALIDATE", 300),
+    )
+    return response
+
+
+def cache_immutable(response):
+    patch_cache_control(response, public=True, max_age=ONE_YEAR, immutable=True)
+    return response
+
+
+def file_validators(stat):
+    # (etag, last_modified) derived from a stat result, no need to read the file
+    etag = quote_etag(f"{stat.st_mtime_ns:x}-{stat.st_size:x}")
+    return etag, int(stat.st_mtime)
+
+
+def serve_media(request, path, document_root=None):
+    """
+    Serves generated media with ETag/If-None-Match support and immutable
+    caching, the body itself is delivered by QRGenProject.media. PNGs are
+    sent as their smallest accepted variant, varying on Accept.
+    """
+    document_root = document_root or settings.MEDIA_ROOT
+    path = posixpath.normpath(path).lstrip("/")
+    try:
+        fullpath = safe_join(document_root, path)
+        stat = os.stat(fullpath)
+    except (OSError, SuspiciousFileOperation, ValueError):
+        raise Http404(f"{path} does not exist")
+    if not os.path.isfile(fullpath):
+        raise Http404(f"{path} does not exist")
+
+    negotiated = fullpath.endswith(".png") and _setting("IMAGE_VARIANTS_ENABLED", True)
+    content_type = None
+    if negotiated:
+        from .variants import CONTENT_TYPES, choose
+
+        fullpath, stat, name = choose(
+            fullpath, path, stat, request.headers.get("Accept", "")
+        )
+        content_type = CONTENT_TYPES[name or "png"]
+
+    etag, last_modified = file_validators(stat)
+    response = get_conditional_response(
+        request, etag=etag, last_modified=last_modified
+    )
+    if response is None:
+        response = send_file(fullpath, content_type=content_type)
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(last_modified)
+    if negotiated:
+        patch_vary_headers(response, ["Accept"])
+    return cache_immutable(response)
+
+
+# anonymous page cache
+
+_pages = {}
+_release = None
+
+ACCEPTS_BR = re.compile(r"\bbr\b(?!\s*;\s*q=0(\.0*)?\b)")
+ACCEPTS_GZIP = re.compile(r"\bgzip\b(?!\s*;\s*q=0(\.0*)?\b)")
+
+
+def release():
+    """
+    Identifies the deployment: PAGE_CACHE_VERSION when set, otherwise a
+    digest of the templates' names, sizes and modification times.
+    """
+    global _release
+    if _release is None:
+        _release = _setting("PAGE_CACHE_VERSION", "")
+        if not _release:
+            digest = hashlib.md5()
+            template_dirs = [
+                *settings.TEMPLATES[0]["DIRS"],
+                *get_app_template_dirs("templates"),
+            ]
+            for template_dir in template_dirs:
+                for dirpath, dirnames, filenames in sorted(os.walk(template_dir)):
+                    for filename in sorted(filenames):
+                        stat = os.stat(os.path.join(dirpath, filename))
+                        digest.update(f"{filename}{stat.st_size}{stat.st_mtime_ns}".encode())
+            _release = digest.hexdigest()[:12]
+    return _release
+
+
+def _is_anonymous(request):
+    # decided from the headers alone so the session is never loaded
+    return (
+        settings.SESSION_COOKIE_NAME not in request.COOKIES
+        and "Authorization" not in request.headers
+    )
+
+
+def _page_entry(response):
+    body = response.content
+    variants = {"identity": body, "gzip": gzip.compress(body, 9)}
+    if brotli is not None:
+        variants["br"] = brotli.compress(body)
+    return {
+        "etag": hashlib.md5(body).hexdigest()[:16],
+        "content_type": response["Content-Type"],
+        "variants": variants,
+    }
+
+
+def _page_response(request, entry, cache_status):
+    accept_encoding = request.headers.get("Accept-Encoding", "")
+    if "br" in entry["variants"] and ACCEPTS_BR.search(accept_encoding):
+        encoding = "br"
+    elif ACCEPTS_GZIP.search(accept_encoding):
+        encoding = "gzip"
+    else:
+        encoding = "identity"
+    # each encoding is a representation of its own
+    etag = quote_etag(f"{entry['etag']}-{encoding}")
+
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        body = entry["variants"][encoding]
+        response = HttpResponse(
+            b"" if request.method == "HEAD" else body,
+            content_type=entry["content_type"],
+        )
+        response["Content-Length"] = len(body)
+        if encoding != "identity":
+            response["Content-Encoding"] = encoding
+    response["ETag"] = etag
+    response["X-Page-Cache"] = cache_status
+    return response
+
+
+def _finish(response):
+    patch_vary_headers(response, ["Cookie", "Accept-Encoding"])
+    # stored by browsers, but revalidated with the ETag on every visit
+    patch_cache_control(response, no_cache=True)
+    return response
+
+
+def cache_anonymous_page(view):
+    """
+    Full-page cache for anonymous GET/HEAD requests. The rendered page is
+    kept in this process and in the shared cache with gzip and brotli
+    variants, under a key that changes with every release. A hit answers
+    without touching the session, the database or the template engine.
+    Requests with a session cookie or credentials, query strings, and pages
+    that need a CSRF cookie bypass it.
+    """
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if (
+            not _setting("PAGE_CACHE_ENABLED", True)
+            or request.method not in ("GET", "HEAD")
+            or request.GET
+            or not _is_anonymous(request)
+        ):
+            return _finish(view(request, *args, **kwargs))
+
+        key = f"page:{release()}:{request.path}"
+        cache_status = "hit"
+        entry = _pages.get(key)
+        if entry is None:
+            entry = cache.get(key)
+        if entry is None:
+            cache_status = "miss"
+            response = view(request, *args, **kwargs)
+            if (
+                response.status_code != 200
+                or response.streaming
+                or response.cookies
+                or request.META.get("CSRF_COOKIE_NEEDS_UPDATE")
+            ):
+                # per-visitor content, e.g. a form with a CSRF token
+                return _finish(response)
+            entry = _page_entry(response)
+            cache.set(key, entry, _setting("PAGE_CACHE_TIMEOUT", 60 * 60 * 24))
+        _pages[key] = entry
+        return _finish(_page_response(request, entry, cache_status))
+
+    return wrapper
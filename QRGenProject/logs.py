@@ -0,0 +1,169 @@
+"""
+Logging that never blocks the request threads.
+
+Django calls configure() with settings.LOGGING (LOGGING_CONFIG). The
+handlers LOGGING gives the root logger (console, logstash) become sinks
+of a QueueListener thread, the root logger itself only keeps a
+QueueingHandler that puts records on a bounded in-memory queue. When the
+queue is full records are dropped and counted rather than waited on.
+
+Records of the loggers in LOG_SAMPLE_RATES are kept at that rate (0.01
+keeps one scan log in a hundred) before they are queued; warnings and
+errors are always kept.
+
+The listener thread doesn't survive a fork, every child process (gunicorn
+workers) starts its own listener on a new queue.
+"""
+import atexit
+import json
+import logging
+import logging.config
+import os
+import queue
+import random
+import threading
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+# attributes every LogRecord has, anything else came in through `extra`
+RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, `extra` fields included."""
+
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps a `rate` share of the records below WARNING, per logger."""
+
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = rates
+
+    def rate(self, name):
+        # the closest configured logger up the hierarchy
+        while name:
+            if name in self.rates:
+                return self.rates[name]
+            name = name.rpartition(".")[0]
+        return 1.0
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self.rate(record.name)
+        return rate >= 1.0 or random.random() < rate
+
+
+class QueueingHandler(QueueHandler):
+    """QueueHandler that drops records instead of waiting for queue space."""
+
+    def __init__(self, queue):
+        super().__init__(queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # the message is rendered before the call returns, the arguments
+        # may change afterwards. Tracebacks become text, the sinks format
+        # everything else
+        record = logging.makeLogRecord(vars(record))
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+# QueueingHandler -> its running QueueListener
+_listeners = {}
+_lock = threading.Lock()
+
+
+def queue_handlers(logger, sample_rates=None, queue_size=10000):
+    """
+    Moves the handlers of logger to a QueueListener thread, leaving a
+    QueueingHandler in their place. Returns the QueueingHandler.
+    """
+    handler = QueueingHandler(queue.Queue(queue_size))
+    if sample_rates:
+        handler.addFilter(SamplingFilter(sample_rates))
+    sinks = logger.handlers[:]
+    for sink in sinks:
+        logger.removeHandler(sink)
+    logger.addHandler(handler)
+    listener = QueueListener(handler.queue, *sinks, respect_handler_level=True)
+    with _lock:
+        _listeners[handler] = listener
+    listener.start()
+    return handler
+
+
+def stop(handler):
+    """Stops the listener of handler once it has handled every queued record."""
+    with _lock:
+        listener = _listeners.pop(handler, None)
+    if listener is not None:
+        listener.stop()
+
+
+def _stop_all():
+    # handle what is still queued before the interpreter exits
+    for handler in list(_listeners):
+        stop(handler)
+
+
+def _restart_after_fork():
+    # the parent's listener threads are gone in the child, and the queues
+    # may have been locked by them when the fork happened
+    global _lock
+    _lock = threading.Lock()
+    for handler, listener in list(_listeners.items()):
+        handler.queue = queue.Queue(handler.queue.maxsize)
+        _listeners[handler] = QueueListener(
+            handler.queue, *listener.handlers, respect_handler_level=True
+        )
+        _listeners[handler].start()
+
+
+atexit.register(_stop_all)
+os.register_at_fork(after_in_child=_restart_after_fork)
+
+
+def configure(config):
+    from django.conf import settings
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        if isinstance(handler, QueueingHandler):
+            stop(handler)
+            root.removeHandler(handler)
+    logging.config.dictConfig(config)
+    queue_handlers(
+        root,
+        sample_rates=getattr(settings, "LOG_SAMPLE_RATES", {}),
+        queue_size=getattr(settings, "LOG_QUEUE_SIZE", 10000),
+    )
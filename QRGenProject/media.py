@@ -0,0 +1,60 @@
+"""
+Local file delivery for media and downloads.
+
+Python only authorizes and routes the request, the bytes never go
+through it:
+
+- "python" (default) returns a FileResponse, which the WSGI server turns
+  into os.sendfile() through wsgi.file_wrapper (gunicorn does)
+- "nginx" answers with an X-Accel-Redirect header pointing at an
+  internal location of the fronting proxy
+- "apache" answers with an X-Sendfile header carrying the absolute path
+
+For the proxy backends MEDIA_ACCEL_LOCATIONS maps local directories to
+the internal URL prefixes the proxy serves them from; files outside of
+them fall back to a FileResponse.
+"""
+import mimetypes
+import os
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse
+
+
+def _accel_url(fullpath):
+    for root, prefix in getattr(settings, "MEDIA_ACCEL_LOCATIONS", {}).items():
+        root = os.path.join(os.path.abspath(root), "")
+        if fullpath.startswith(root):
+            relative = fullpath[len(root):].replace(os.sep, "/")
+            return prefix.rstrip("/") + "/" + quote(relative)
+    return None
+
+
+def send_file(fullpath, content_type=None):
+    """Response delivering the local file at fullpath."""
+    fullpath = os.path.abspath(fullpath)
+    if content_type is None:
+        content_type = mimetypes.guess_type(fullpath)[0] or "application/octet-stream"
+
+    backend = getattr(settings, "MEDIA_DELIVERY_BACKEND", "python")
+    if backend == "nginx":
+        accel_url = _accel_url(fullpath)
+        if accel_url is not None:
+            response = HttpResponse(content_type=content_type)
+            response["X-Accel-Redirect"] = accel_url
+            return response
+    elif backend == "apache":
+        response = HttpResponse(content_type=content_type)
+        response["X-Sendfile"] = fullpath
+        return response
+
+    return FileResponse(open(fullpath, "rb"), content_type=content_type)
+
+
+def local_path(field_file):
+    # filesystem path of a stored file, None for remote storages
+    try:
+        return field_file.path
+    except NotImplementedError:
+        return None
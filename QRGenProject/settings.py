@@ -10,15 +10,11 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.0/ref/settings/
 """
 
+import hashlib
 import os
 from pathlib import Path
-from decouple import config
-from dotenv import load_dotenv, find_dotenv
-import cloudinary_storage
-import environ
 
-
-load_dotenv(find_dotenv())
+from django.core.exceptions import ImproperlyConfigured
 
 # SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = False
@@ -26,6 +22,14 @@ DEBUG = False
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
+# settings are read from the environment, a .env file next to manage.py is
+# only loaded (and dotenv only imported) when there is one, every worker
+# boot pays for these imports
+if os.path.exists(BASE_DIR / ".env"):
+    from dotenv import load_dotenv
+
+    load_dotenv(BASE_DIR / ".env")
+
 
 if DEBUG:
     # environ.Env.read_env(os.path.join(BASE_DIR, '.env'))
@@ -39,7 +43,9 @@ if DEBUG:
     SECRET_KEY = os.getenv("SECRET_KEY")
 
 else:
-    MEDIA_ROOT = "https://res.cloudinary.com/drnxvi983/image/upload/v1/media/"
+    # media lives on Cloudinary, the local folder only holds the hot tier
+    # of qrgen.storage.TieredStorage
+    MEDIA_ROOT = BASE_DIR / "media/"
     DEFAULT_FILE_STORAGE = "cloudinary_storage.storage.MediaCloudinaryStorage"
 
     CSRF_TRUSTED_ORIGINS = ["https://qrcodeapp.fly.dev", "https://*.127.0.0.1"]
@@ -68,10 +74,12 @@ INSTALLED_APPS = [
     "qrgen",
     "home",
     "handlescan",
-    # 'api',
+    "diagnostics",
+    "api",
     # third-party libraries
     "cloudinary_storage",
-    "cloudinary",
+    # the "cloudinary" app only adds CloudinaryField and template tags, none
+    # of which are used, and its models pull in the whole upload client
     # 'rest_framework',
     "django_prometheus",
 ]
@@ -79,10 +87,13 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     "django_prometheus.middleware.PrometheusBeforeMiddleware",
     "django.middleware.security.SecurityMiddleware",
+    "whitenoise.middleware.WhiteNoiseMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
-    "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "accounts.middleware.CachedAuthenticationMiddleware",
+    "diagnostics.middleware.ProfilingMiddleware",
+    "diagnostics.middleware.MemoryTrackingMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
     "django_prometheus.middleware.PrometheusAfterMiddleware",
@@ -120,6 +131,24 @@ DATABASES = {
     }
 }
 
+# Cache shared by the gunicorn workers: redis when REDIS_URL is set (needs
+# the redis package), a file based cache on this host otherwise
+
+if os.getenv("REDIS_URL"):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": os.getenv("REDIS_URL"),
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django_prometheus.cache.backends.filebased.FileBasedCache",
+            "LOCATION": BASE_DIR / "temp/cache",
+        }
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.0/ref/settings/#auth-password-validators
@@ -167,8 +196,198 @@ STATICFILES_FINDERS = [
     "django.contrib.staticfiles.finders.FileSystemFinder",
 ]
 
+# collectstatic writes content-hashed names plus .gz and .br variants,
+# whitenoise then serves them with far-future immutable caching
+STATICFILES_STORAGE = "whitenoise.storage.CompressedManifestStaticFilesStorage"
+
+TEST_RUNNER = "QRGenProject.test_runner.TestRunner"
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.0/ref/settings/#default-auto-field
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 MEDIA_URL = "/media/"
+
+
+# Per-request profiling (diagnostics.middleware.ProfilingMiddleware)
+# the middleware is dropped from the stack entirely unless enabled
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "False") == "True"
+PROFILING_SAMPLE_RATE = float(os.getenv("PROFILING_SAMPLE_RATE", "0.1"))
+PROFILING_DIR = BASE_DIR / "temp/profiles"
+PROFILING_RING_SIZE = 50
+# seconds a diagnostics.middleware.profile_token() stays valid
+PROFILING_TOKEN_MAX_AGE = int(os.getenv("PROFILING_TOKEN_MAX_AGE", 60 * 60))
+
+# Per-view RSS tracking (diagnostics.middleware.MemoryTrackingMiddleware),
+# reported with the tracemalloc endpoints under /diagnostics/memory/
+MEMORY_TRACKING_ENABLED = os.getenv("MEMORY_TRACKING_ENABLED", "False") == "True"
+
+# HTTP caching policies (QRGenProject.caching)
+STATIC_CODE_CACHE_MAX_AGE = 60 * 60 * 24 * 365
+DYNAMIC_CODE_CACHE_MAX_AGE = 60
+DYNAMIC_CODE_STALE_WHILE_REVALIDATE = 300
+
+# Scans from bots and link previews, and repeats of a client's scan within
+# SCAN_DEDUPE_WINDOW seconds, aren't counted (handlescan.filters)
+SCAN_DEDUPE_WINDOW = 30
+SCAN_DEDUPE_BITS = 1 << 20
+
+# Header holding the client address when the app runs behind a proxy that
+# sets it ("Fly-Client-IP" on fly.io, "X-Forwarded-For" for the first hop),
+# used instead of REMOTE_ADDR (handlescan.filters.client_ip). Leave empty
+# when clients reach the app directly, they could send it themselves
+TRUSTED_PROXY_HEADER = os.getenv("TRUSTED_PROXY_HEADER", "")
+
+# Dashboard and API search (qrgen.search): "qrgen.search.SQLiteFTSBackend"
+# keeps an FTS5 index in the database, "qrgen.search.ElasticsearchBackend"
+# uses SEARCH_ELASTICSEARCH_URL. Fill a new index with rebuild_search_index
+SEARCH_BACKEND = os.getenv("SEARCH_BACKEND", "qrgen.search.SQLiteFTSBackend")
+SEARCH_ELASTICSEARCH_URL = os.getenv("SEARCH_ELASTICSEARCH_URL", "http://localhost:9200")
+SEARCH_ELASTICSEARCH_INDEX = "qrcodes"
+SEARCH_PAGE_SIZE = 50
+
+# Anonymous full-page cache of the home pages (QRGenProject.caching), keyed
+# by release: RELEASE_VERSION, fly's FLY_IMAGE_REF, or a digest of the
+# templates when neither is set
+PAGE_CACHE_ENABLED = os.getenv("PAGE_CACHE_ENABLED", "True") == "True"
+PAGE_CACHE_VERSION = os.getenv("RELEASE_VERSION") or os.getenv("FLY_IMAGE_REF", "")
+PAGE_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Local file delivery (QRGenProject.media): "python" streams through
+# FileResponse/sendfile, "nginx" and "apache" hand the file to the proxy
+MEDIA_DELIVERY_BACKEND = os.getenv("MEDIA_DELIVERY_BACKEND", "python")
+MEDIA_ACCEL_LOCATIONS = {
+    BASE_DIR / "media": "/internal/media/",
+    BASE_DIR / "temp": "/internal/temp/",
+}
+
+# Tiered media storage (qrgen.storage.TieredStorage): uploads land in a
+# local hot tier and are pushed to Cloudinary in the background
+TIERED_STORAGE_ENABLED = os.getenv("TIERED_STORAGE_ENABLED", "False") == "True"
+TIERED_STORAGE_HOT_LOCATION = BASE_DIR / "media"
+TIERED_STORAGE_MAX_HOT_BYTES = int(
+    os.getenv("TIERED_STORAGE_MAX_HOT_BYTES", 512 * 1024 * 1024)
+)
+TIERED_STORAGE_EVICTION = os.getenv("TIERED_STORAGE_EVICTION", "lru")
+
+# Uploads are streamed to disk and hashed (qrgen.uploads), identical
+# content is stored once. Size limits in bytes, per content type or
+# main type ("image/")
+FILE_UPLOAD_HANDLERS = ["qrgen.uploads.HashingUploadHandler"]
+UPLOAD_SIZE_LIMITS = {
+    "application/pdf": 10 * 1024 * 1024,
+    "image/": 5 * 1024 * 1024,
+}
+UPLOAD_DEFAULT_SIZE_LIMIT = 10 * 1024 * 1024
+
+# API tokens (api.tokens) are looked up once per worker and TTL, requests
+# made with a token are rate limited per token and per "METHOD view_name"
+# route (api.ratelimit), as "<count>/<s|m|h|d>" token buckets
+API_TOKEN_CACHE_TTL = 60
+API_RATE_LIMIT = os.getenv("API_RATE_LIMIT", "120/m")
+API_ROUTE_RATE_LIMITS = {
+    "POST api:qrcodes": "20/m",
+}
+# invalid tokens a client address may send before its requests with a
+# token are refused without a lookup
+API_AUTH_FAILURE_RATE = os.getenv("API_AUTH_FAILURE_RATE", "10/m")
+
+# Scan targets (handlescan.lookup) are cached per worker for this many
+# seconds; workers warm up (QRGenProject.warmup) with the most scanned ones
+# and the templates of these apps before taking requests
+SCAN_LOOKUP_CACHE_TTL = 30
+WARMUP_SCAN_TARGETS = 500
+WARMUP_TEMPLATE_APPS = ["handlescan", "qrgen"]
+# seconds the warmup's Cloudinary ping may take
+WARMUP_STORAGE_TIMEOUT = 5
+
+# Sessions are kept in the database behind the cache, reading one needs no
+# query once cached and a session is only written when its data changes.
+# SESSION_BACKEND picks another django.contrib.sessions backend ("cache",
+# "db", "signed_cookies"). Signed cookies are refused with the SECRET_KEY
+# baked into the Dockerfile (sha256 below): anyone could forge a session.
+# Logged in users are cached per worker (accounts.users) for USER_CACHE_TTL
+# seconds, 0 loads them on every request
+SESSION_ENGINE = "django.contrib.sessions.backends." + os.getenv(
+    "SESSION_BACKEND", "cached_db"
+)
+PUBLIC_SECRET_KEY_SHA256 = (
+    "a5bd83e7f400e0a9f7a49d167e4ce392b71896a1c915154907acd52db219604f"
+)
+if (
+    SESSION_ENGINE.endswith(".signed_cookies")
+    and hashlib.sha256((SECRET_KEY or "").encode()).hexdigest()
+    == PUBLIC_SECRET_KEY_SHA256
+):
+    raise ImproperlyConfigured(
+        "signed_cookies sessions need a SECRET_KEY of their own, not the "
+        "Dockerfile's"
+    )
+SESSION_SAVE_EVERY_REQUEST = False
+USER_CACHE_TTL = int(os.getenv("USER_CACHE_TTL", 30))
+
+# Logging (QRGenProject.logs): the root logger's handlers run on a listener
+# thread behind a bounded queue, request threads never wait on log output.
+# Scan logs are sampled per logger, LOGSTASH_HOST adds a logstash TCP sink
+LOGGING_CONFIG = "QRGenProject.logs.configure"
+LOG_QUEUE_SIZE = 10000
+LOG_SAMPLE_RATES = {
+    "handlescan.scans": float(os.getenv("SCAN_LOG_SAMPLE_RATE", 0.01)),
+}
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "formatters": {
+        "json": {"()": "QRGenProject.logs.JsonFormatter"},
+        "text": {"format": "%(asctime)s %(levelname)s %(name)s %(message)s"},
+    },
+    "handlers": {
+        "console": {
+            "class": "logging.StreamHandler",
+            "formatter": os.getenv("LOG_FORMAT", "json"),
+        },
+    },
+    "root": {"handlers": ["console"], "level": os.getenv("LOG_LEVEL", "INFO")},
+}
+if os.getenv("LOGSTASH_HOST"):
+    LOGGING["handlers"]["logstash"] = {
+        "class": "logstash.TCPLogstashHandler",
+        "host": os.getenv("LOGSTASH_HOST"),
+        "port": int(os.getenv("LOGSTASH_PORT", 5959)),
+        "version": 1,
+    }
+    LOGGING["root"]["handlers"].append("logstash")
+
+# Scans and downloads (handlescan.fastpath) run through this middleware only,
+# they use no session, user, CSRF token or message. SCAN_FAST_PATH=False
+# sends them through MIDDLEWARE like everything else
+SCAN_FAST_PATH = os.getenv("SCAN_FAST_PATH", "True") == "True"
+SCAN_MIDDLEWARE = [
+    "django_prometheus.middleware.PrometheusBeforeMiddleware",
+    "django.middleware.security.SecurityMiddleware",
+    "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "django_prometheus.middleware.PrometheusAfterMiddleware",
+]
+
+# Destination health checks (qrgen.linkcheck, manage.py check_destinations):
+# requests in flight overall and per host, seconds per url. Destinations on
+# loopback, private or link-local addresses are only requested with
+# LINK_CHECK_ALLOW_PRIVATE
+LINK_CHECK_CONCURRENCY = 256
+LINK_CHECK_PER_HOST = 8
+LINK_CHECK_TIMEOUT = 10
+LINK_CHECK_ALLOW_PRIVATE = os.getenv("LINK_CHECK_ALLOW_PRIVATE", "False") == "True"
+
+# Large-format downloads (/dashboard/download/<id>/poster/?cm=&dpi=): the
+# default side and resolution, the sides and resolutions a request snaps
+# to (each one is kept on disk once made), and the largest side in pixels
+POSTER_SIZE_CM = float(os.getenv("POSTER_SIZE_CM", 100))
+POSTER_DPI = int(os.getenv("POSTER_DPI", 300))
+POSTER_SIZES_CM = [5, 10, 20, 50, 100]
+POSTER_DPIS = [150, 300, 600]
+POSTER_MAX_SIDE = int(os.getenv("POSTER_MAX_SIDE", 60000))
+
+# Stored PNGs are served as their smallest lossless variant the client
+# accepts (QRGenProject.variants), encoded once into IMAGE_VARIANT_ROOT
+IMAGE_VARIANTS_ENABLED = os.getenv("IMAGE_VARIANTS_ENABLED", "True") == "True"
+IMAGE_VARIANT_ROOT = BASE_DIR / "temp" / "variants"
@@ -17,7 +17,8 @@ from django.contrib import admin
 from django.urls import path, include, re_path
 from django.conf import settings
 from django.conf.urls.static import static
-from django.views.static import serve
+
+from .caching import serve_media
 
 urlpatterns = [
     path("admin/", admin.site.urls),
@@ -25,9 +26,10 @@ urlpatterns = [
     path("accounts/", include("accounts.urls")),
     path("dashboard/", include("qrgen.urls")),
     path("qrcode/", include("handlescan.urls")),
+    path("diagnostics/", include("diagnostics.urls")),
+    path("qrcodes/", include("api.urls")),
     path("", include("django_prometheus.urls")),
-    re_path(r"^media/(?P<path>.*)$", serve, {"document_root": settings.MEDIA_ROOT}),
-    re_path(r"^static/(?P<path>.*)$", serve, {"document_root": settings.STATIC_ROOT}),
+    re_path(r"^media/(?P<path>.*)$", serve_media),
 ]
 if settings.DEBUG:
     urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
@@ -0,0 +1,170 @@
+"""
+Smaller encodings of stored PNG images, picked per request.
+
+A generated code is two colours on a grid, the PNG written by PIL spends
+a byte or more per pixel on it. serve_media asks choose() for the file to
+send instead: the smallest of the original, a re-encoded PNG
+(qrgen.encoding, 1-bit when the image only has two colours) and, when
+the Accept header allows them, lossless WebP and AVIF. AVIF is only
+offered when Pillow can write it (natively, or through the
+pillow-avif-plugin package). This covers the images served from the
+local MEDIA_ROOT only, images on Cloudinary are linked with f_auto
+(qrgen.cold_storage.AutoFormatMixin).
+
+Each variant is encoded once, on first request, and written under
+IMAGE_VARIANT_ROOT next to a name derived from the original's size and
+modification time, so it's delivered like any other local file and a
+rewritten original never gets a stale variant. An empty variant file
+records that the format can't make the image any smaller. Variants of
+deleted or rewritten originals are removed by collect_orphans
+(is_current()).
+"""
+import io
+import logging
+import os
+import re
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# format -> content type, in order of preference between equal sizes
+CONTENT_TYPES = {
+    "png": "image/png",
+    "webp": "image/webp",
+    "avif": "image/avif",
+}
+ACCEPTS = {
+    "webp": re.compile(r"\bimage/webp\b(?!\s*;\s*q=0(\.0*)?\b)"),
+    "avif": re.compile(r"\bimage/avif\b(?!\s*;\s*q=0(\.0*)?\b)"),
+}
+
+_encoders = None
+
+
+def encoders():
+    """Formats Pillow can write here, beside png."""
+    global _encoders
+    if _encoders is None:
+        from PIL import Image
+
+        try:
+            import pillow_avif  # noqa: F401, registers AVIF on older Pillows
+        except ImportError:
+            pass
+        Image.init()
+        _encoders = {name for name in ("webp", "avif") if name.upper() in Image.SAVE}
+    return _encoders
+
+
+def accepted(accept):
+    """Formats the Accept header allows, png always."""
+    return ["png"] + [
+        name
+        for name in ("webp", "avif")
+        if name in encoders() and ACCEPTS[name].search(accept)
+    ]
+
+
+def encode(image, name):
+    # lossless encoding of the PIL image in format name
+    if name == "png":
+        from qrgen.encoding import encode_png
+
+        return encode_png(image)
+    out = io.BytesIO()
+    if name == "webp":
+        # method 6 at quality 100 is libwebp's exhaustive search, a hundred
+        # times slower for the same bytes on these images
+        image.convert("RGB").save(out, "WEBP", lossless=True, quality=100, method=4)
+    else:
+        # quality 100 with full chroma is AVIF's lossless mode
+        image.convert("RGB").save(out, "AVIF", quality=100, subsampling="4:4:4")
+    return out.getvalue()
+
+
+VARIANT_NAME = re.compile(r"^(?P<path>.+)\.(?P<version>[0-9a-f]+-[0-9a-f]+)\.(?:png|webp|avif)$")
+
+
+def variant_root():
+    return os.path.abspath(getattr(settings, "IMAGE_VARIANT_ROOT", "temp/variants"))
+
+
+def _version(stat):
+    return f"{stat.st_mtime_ns:x}-{stat.st_size:x}"
+
+
+def variant_path(path, stat, name):
+    # path is the media path of the original, stat its stat result
+    return os.path.join(variant_root(), f"{path}.{_version(stat)}.{name}")
+
+
+def is_current(name):
+    """
+    Whether the variant at name (relative to IMAGE_VARIANT_ROOT) was made
+    from the original as it is now in MEDIA_ROOT.
+    """
+    match = VARIANT_NAME.match(name.replace(os.sep, "/"))
+    if match is None:
+        return False
+    try:
+        stat = os.stat(os.path.join(settings.MEDIA_ROOT, match["path"]))
+    except (OSError, ValueError):
+        return False
+    return _version(stat) == match["version"]
+
+
+def _write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # written aside and renamed, a concurrent request never sees half of it
+    partial = f"{path}.{os.getpid()}.part"
+    with open(partial, "wb") as f:
+        f.write(data)
+    os.replace(partial, path)
+
+
+def render(fullpath, path, stat, names):
+    """Encodes the image at fullpath in the formats names."""
+    from PIL import Image
+
+    try:
+        with Image.open(fullpath) as image:
+            image.load()
+    except Exception:
+        logger.warning("could not decode %s, no variants", fullpath)
+        image = None
+    for name in names:
+        data = b""
+        if image is not None:
+            try:
+                data = encode(image, name)
+            except Exception:
+                logger.exception("could not encode %s as %s", fullpath, name)
+        if len(data) >= stat.st_size:
+            data = b""
+        _write(variant_path(path, stat, name), data)
+
+
+def choose(fullpath, path, stat, accept):
+    """
+    (fullpath, stat, format) of the smallest encoding of the PNG at
+    fullpath (media path path) the client accepts, format is None for the
+    original.
+    """
+    sizes = {}
+    missing = []
+    for name in accepted(accept):
+        try:
+            sizes[name] = os.stat(variant_path(path, stat, name))
+        except FileNotFoundError:
+            missing.append(name)
+    if missing:
+        render(fullpath, path, stat, missing)
+        for name in missing:
+            sizes[name] = os.stat(variant_path(path, stat, name))
+
+    best = (fullpath, stat, None)
+    for name, variant_stat in sizes.items():
+        if 0 < variant_stat.st_size < best[1].st_size:
+            best = (variant_path(path, stat, name), variant_stat, name)
+    return best
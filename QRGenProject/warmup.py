@@ -0,0 +1,110 @@
+"""
+Warmup run by each worker before it takes its first request (gunicorn's
+post_worker_init hook), so that the first scans and dashboard loads after
+a cold start don't pay for it:
+
+- "database" opens the connection of every configured database
+- "templates" compiles the templates of WARMUP_TEMPLATE_APPS and the
+  project templates into the cached template loader
+- "scan_targets" loads the most scanned codes into the scan lookup cache
+  (handlescan.lookup)
+- "storage" sets up the media storages, importing the Cloudinary client,
+  and when they're Cloudinary's makes one authenticated call (the Admin
+  API ping): DNS, the TLS handshake and the credentials are checked before
+  the first request, and the admin API's pool (exists, size, delete)
+  keeps the connection
+
+A failing step is logged and skipped, the worker still starts. The time
+each step took is exported as the qrgen_warmup_seconds gauge.
+"""
+import logging
+import os
+import sys
+import time
+
+from django.apps import apps
+from django.conf import settings
+from django.db import connections
+from django.template import engines
+from django.utils.functional import LazyObject, empty
+from prometheus_client import Gauge
+
+logger = logging.getLogger(__name__)
+
+warmup_seconds = Gauge(
+    "qrgen_warmup_seconds",
+    "Time spent warming up this worker, per step",
+    ["step"],
+)
+
+
+def open_databases():
+    for connection in connections.all():
+        connection.ensure_connection()
+
+
+def template_names(directory):
+    for root, _, files in os.walk(directory):
+        for name in files:
+            if name.endswith((".html", ".txt")):
+                yield os.path.relpath(os.path.join(root, name), directory)
+
+
+def compile_templates():
+    directories = [os.path.join(settings.BASE_DIR, "templates")]
+    for label in getattr(settings, "WARMUP_TEMPLATE_APPS", ["handlescan", "qrgen"]):
+        directories.append(os.path.join(apps.get_app_config(label).path, "templates"))
+    for engine in engines.all():
+        for directory in directories:
+            for name in template_names(directory):
+                engine.get_template(name)
+
+
+def prime_scan_targets():
+    from handlescan.lookup import prime
+
+    prime(getattr(settings, "WARMUP_SCAN_TARGETS", 500))
+
+
+def open_storages():
+    from qrgen.models import File, QrCode
+
+    for field in (File._meta.get_field("file"), QrCode._meta.get_field("img")):
+        if isinstance(field.storage, LazyObject) and field.storage._wrapped is empty:
+            field.storage._setup()
+
+    # only imported when a storage is Cloudinary's
+    if "cloudinary_storage.storage" in sys.modules:
+        import cloudinary
+        import cloudinary.api
+
+        if cloudinary.config().api_key:
+            cloudinary.api.ping(timeout=getattr(settings, "WARMUP_STORAGE_TIMEOUT", 5))
+
+
+STEPS = [
+    ("database", open_databases),
+    ("templates", compile_templates),
+    ("scan_targets", prime_scan_targets),
+    ("storage", open_storages),
+]
+
+
+def warmup():
+    """Runs every step, returns {step: seconds} (None for failed steps)."""
+    timings = {}
+    started = time.perf_counter()
+    for name, step in STEPS:
+        start = time.perf_counter()
+        try:
+            step()
+        except Exception:
+            logger.exception("warmup step %s failed", name)
+            timings[name] = None
+            continue
+        timings[name] = time.perf_counter() - start
+        warmup_seconds.labels(name).set(timings[name])
+    total = time.perf_counter() - started
+    warmup_seconds.labels("total").set(total)
+    logger.info("worker %s warmed up in %.0f ms", os.getpid(), total * 1000)
+    return timings
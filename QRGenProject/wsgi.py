@@ -9,8 +9,14 @@ https://docs.djangoproject.com/en/4.0/howto/deployment/wsgi/
 
 import os
 
+from django.conf import settings
 from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'QRGenProject.settings')
 
 application = get_wsgi_application()
+
+if settings.SCAN_FAST_PATH:
+    from handlescan.fastpath import ScanDispatcher
+
+    application = ScanDispatcher(application)
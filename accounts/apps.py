@@ -1,6 +1,13 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_delete, post_save
 
 
 class AccountsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'accounts'
+
+    def ready(self):
+        from . import users
+
+        post_save.connect(users.user_changed, sender="auth.User")
+        post_delete.connect(users.user_changed, sender="auth.User")
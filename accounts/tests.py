@@ -1,7 +1,15 @@
-from django.test import TestCase, Client
+import os
+import re
+import subprocess
+import sys
+
+from django.conf import settings
+from django.db import connection
+from django.test import TestCase, Client, override_settings
 from django.urls import reverse
 from django.contrib.auth.models import User
 from django.http import HttpResponseRedirect
+from django.test.utils import CaptureQueriesContext
 
 
 class AccountsViewsTestCase(TestCase):
@@ -84,3 +92,65 @@ class AccountsViewsTestCase(TestCase):
         )
         response = self.client.get(reverse("accounts:logout"))
         self.assertRedirects(response, self.homepage_url)
+
+
+class UserCacheTestCase(TestCase):
+    def setUp(self):
+        self.dashboard_url = reverse("qrgen:dashboard")
+        self.user = User.objects.create_user(username="testuser", password="testpass")
+        self.client.login(username="testuser", password="testpass")
+
+    def dashboard_queries(self):
+        # queries of a repeat dashboard load
+        self.client.get(self.dashboard_url)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.dashboard_url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_repeat_requests_skip_session_and_user(self):
+        cached = self.dashboard_queries()
+        middleware = [
+            "django.contrib.auth.middleware.AuthenticationMiddleware"
+            if name == "accounts.middleware.CachedAuthenticationMiddleware"
+            else name
+            for name in settings.MIDDLEWARE
+        ]
+        with override_settings(
+            SESSION_ENGINE="django.contrib.sessions.backends.db", MIDDLEWARE=middleware
+        ):
+            # a new client loads the middleware with these settings
+            self.client = Client()
+            self.client.login(username="testuser", password="testpass")
+            uncached = self.dashboard_queries()
+        self.assertEqual(cached, uncached - 2)
+
+    def test_signed_cookies_refuse_the_dockerfile_key(self):
+        with open(settings.BASE_DIR / "Dockerfile") as f:
+            baked = re.search(r'ENV SECRET_KEY "(.*)"', f.read()).group(1)
+        env = dict(os.environ, SESSION_BACKEND="signed_cookies")
+        script = "import django; django.setup()"
+        for key, refused in [(baked, True), ("a key of its own", False)]:
+            env["SECRET_KEY"] = key
+            result = subprocess.run(
+                [sys.executable, "-c", script],
+                cwd=settings.BASE_DIR,
+                env=env,
+                capture_output=True,
+                text=True,
+            )
+            self.assertEqual(result.returncode != 0, refused, result.stderr)
+            if refused:
+                self.assertIn("ImproperlyConfigured", result.stderr)
+
+    def test_session_is_not_rewritten(self):
+        self.client.get(self.dashboard_url)
+        response = self.client.get(self.dashboard_url)
+        self.assertNotIn(settings.SESSION_COOKIE_NAME, response.cookies)
+
+    def test_changed_password_ends_cached_session(self):
+        self.client.get(self.dashboard_url)
+        self.user.set_password("other")
+        self.user.save()
+        response = self.client.get(self.dashboard_url)
+        self.assertEqual(response.status_code, 302)
@@ -0,0 +1,64 @@
+import copy
+import threading
+import time
+
+from django.conf import settings
+from django.contrib import auth
+from django.utils.crypto import constant_time_compare
+
+# (user id, backend path) -> (expires, user), kept per process so that a
+# logged in user isn't loaded from the database on every request. A saved or
+# deleted user is dropped here; the other workers may keep the old row, and
+# so accept sessions of a changed password, for at most USER_CACHE_TTL
+_cache = {}
+_lock = threading.Lock()
+
+MAX_CACHED_USERS = 1024
+
+
+def get_user(request):
+    """Like django.contrib.auth.get_user(), from the cache when possible."""
+    try:
+        key = (
+            str(request.session[auth.SESSION_KEY]),
+            request.session[auth.BACKEND_SESSION_KEY],
+        )
+    except KeyError:
+        return auth.get_user(request)
+
+    now = time.monotonic()
+    with _lock:
+        cached = _cache.get(key)
+    if cached is not None and cached[0] > now:
+        session_hash = request.session.get(auth.HASH_SESSION_KEY)
+        if session_hash and constant_time_compare(
+            session_hash, cached[1].get_session_auth_hash()
+        ):
+            # each request gets its own copy to change
+            return copy.copy(cached[1])
+
+    user = auth.get_user(request)
+    ttl = getattr(settings, "USER_CACHE_TTL", 30)
+    if user.is_authenticated and ttl > 0:
+        with _lock:
+            if len(_cache) >= MAX_CACHED_USERS:
+                expired = [k for k, (expires, _) in _cache.items() if expires <= now]
+                for k in expired or list(_cache)[: MAX_CACHED_USERS // 2]:
+                    del _cache[k]
+            _cache[key] = (now + ttl, copy.copy(user))
+    return user
+
+
+def forget(user_id=None):
+    # drop a user (or all of them) from this process' cache
+    with _lock:
+        if user_id is None:
+            _cache.clear()
+        else:
+            for key in [key for key in _cache if key[0] == str(user_id)]:
+                del _cache[key]
+
+
+def user_changed(sender, instance, **kwargs):
+    # post_save / post_delete receiver, connected in AccountsConfig.ready
+    forget(instance.pk)
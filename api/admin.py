@@ -0,0 +1,12 @@
+from django.contrib import admin
+from .models import ApiToken
+
+
+@admin.register(ApiToken)
+class ApiTokenAdmin(admin.ModelAdmin):
+    list_display = ("prefix", "user", "name", "created")
+    readonly_fields = ("prefix", "key_hash", "created")
+
+    def has_add_permission(self, request):
+        # tokens are created with the create_api_token command
+        return False
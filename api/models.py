@@ -0,0 +1,36 @@
+import hashlib
+import secrets
+
+from django.contrib.auth.models import User
+from django.db import models
+
+TOKEN_PREFIX = "qrg_"
+
+
+def hash_token(raw_token):
+    return hashlib.sha256(raw_token.encode()).hexdigest()
+
+
+class ApiToken(models.Model):
+    # only the SHA-256 of the token is stored, the token itself is shown
+    # once when it is created
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="api_tokens")
+    name = models.CharField(max_length=50, default="default")
+    prefix = models.CharField(max_length=12)
+    key_hash = models.CharField(max_length=64, unique=True)
+    created = models.DateTimeField(auto_now_add=True)
+
+    @classmethod
+    def generate(cls, user, name="default"):
+        """Create a token for user, returns (token, raw_token)."""
+        raw_token = TOKEN_PREFIX + secrets.token_urlsafe(32)
+        token = cls.objects.create(
+            user=user,
+            name=name,
+            prefix=raw_token[: len(TOKEN_PREFIX) + 8],
+            key_hash=hash_token(raw_token),
+        )
+        return token, raw_token
+
+    def __str__(self):
+        return f"{self.prefix}... ({self.user}, {self.name})"
@@ -0,0 +1,81 @@
+import math
+import time
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+
+PERIODS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+Limit = namedtuple("Limit", "allowed limit remaining reset retry_after")
+
+
+def parse_rate(rate):
+    # "60/m" -> (60 requests, 60 seconds)
+    count, _, period = rate.partition("/")
+    return int(count), PERIODS[period[:1]]
+
+
+def hit(key, rate, take=True):
+    """
+    Take one request out of the token bucket stored under key. The bucket
+    holds up to count requests and refills at count per period. State lives
+    in the Django cache so all the workers share it; a get/set race between
+    workers can only let a request or two through, never block one.
+    With take=False the bucket is only looked at.
+    """
+    capacity, period = parse_rate(rate)
+    refill = capacity / period
+    now = time.time()
+
+    tokens, stamp = cache.get(key) or (capacity, now)
+    tokens = min(capacity, tokens + (now - stamp) * refill)
+    allowed = tokens >= 1
+    if allowed and take:
+        tokens -= 1
+    if take:
+        cache.set(key, (tokens, now), timeout=period)
+
+    return Limit(
+        allowed=allowed,
+        limit=capacity,
+        remaining=int(tokens),
+        reset=math.ceil((capacity - tokens) / refill),
+        retry_after=0 if allowed else math.ceil((1 - tokens) / refill),
+    )
+
+
+def check(token_id, method, view_name):
+    """
+    Charge a request to the token's bucket and to the bucket of the route
+    if it has its own limit. Returns the most restrictive result.
+    """
+    route = f"{method} {view_name}"
+    buckets = [(f"ratelimit:{token_id}", settings.API_RATE_LIMIT)]
+    route_rate = settings.API_ROUTE_RATE_LIMITS.get(route)
+    if route_rate:
+        buckets.append((f"ratelimit:{token_id}:{method}:{view_name}", route_rate))
+
+    results = [hit(key, rate) for key, rate in buckets]
+    denied = [result for result in results if not result.allowed]
+    if denied:
+        return max(denied, key=lambda result: result.retry_after)
+    return min(results, key=lambda result: result.remaining)
+
+
+def auth_failures(client, failed=False):
+    """
+    Bucket of the failed token authentications of a client address, charged
+    when failed is True. Checked before each token lookup, so guessing
+    tokens stops costing queries once the bucket is empty.
+    """
+    return hit(f"ratelimit:auth:{client}", settings.API_AUTH_FAILURE_RATE, take=failed)
+
+
+def set_headers(response, limit):
+    response["X-RateLimit-Limit"] = limit.limit
+    response["X-RateLimit-Remaining"] = limit.remaining
+    response["X-RateLimit-Reset"] = limit.reset
+    if not limit.allowed:
+        response["Retry-After"] = limit.retry_after
+    return response
@@ -0,0 +1,79 @@
+import base64
+
+from qrgen.models import QrCode
+
+# public field name -> lookup used with QuerySet.values(), related names are
+# followed in the same query so serializing never costs a query per row
+FIELDS = {
+    "id": "id",
+    "title": "title",
+    "type": "type__name",
+    "is_dynamic": "is_dynamic",
+    "is_active": "is_active",
+    "action_type": "action_type",
+    "input_url": "input_url",
+    "action_url": "action_url",
+    "scan_count": "scan_count",
+    "date_gen": "date_gen",
+    "img": "img",
+    "file": "file__name",
+}
+
+MAX_PAGE_SIZE = 200
+DEFAULT_PAGE_SIZE = 50
+
+
+class InvalidParameter(ValueError):
+    """A 400 answer; fields maps field names to their errors, if any."""
+
+    def __init__(self, message, fields=None):
+        super().__init__(message)
+        self.fields = fields
+
+
+def parse_fields(value):
+    # ?fields=id,title -> ["id", "title"], all fields when missing
+    if not value:
+        return list(FIELDS)
+    fields = [field.strip() for field in value.split(",") if field.strip()]
+    unknown = [field for field in fields if field not in FIELDS]
+    if unknown:
+        raise InvalidParameter(f"unknown fields: {', '.join(unknown)}")
+    return fields
+
+
+def parse_limit(value):
+    if not value:
+        return DEFAULT_PAGE_SIZE
+    try:
+        limit = int(value)
+    except ValueError:
+        raise InvalidParameter("limit must be a number")
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+
+def encode_cursor(code_id):
+    return base64.urlsafe_b64encode(str(code_id).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        return int(base64.urlsafe_b64decode(padded.encode()).decode())
+    except (ValueError, UnicodeDecodeError):
+        raise InvalidParameter("invalid cursor")
+
+
+def serialize(queryset, fields):
+    """Rows of queryset restricted to fields, as JSON ready dicts."""
+    lookups = [FIELDS[field] for field in fields]
+    image_storage = QrCode._meta.get_field("img").storage
+    rows = []
+    for values in queryset.values(*lookups):
+        row = {field: values[FIELDS[field]] for field in fields}
+        if "img" in row:
+            row["img"] = image_storage.url(row["img"]) if row["img"] else None
+        if "date_gen" in row:
+            row["date_gen"] = row["date_gen"].isoformat()
+        rows.append(row)
+    return rows
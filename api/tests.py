@@ -0,0 +1,333 @@
+import base64
+import io
+import json
+import os
+import shutil
+import tempfile
+from io import StringIO
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.storage import FileSystemStorage
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from PIL import Image
+
+from api import tokens
+from api.models import ApiToken
+from api.ratelimit import parse_rate
+from api.serializers import decode_cursor, encode_cursor
+from qrgen.models import QrCode, QrType
+from qrgen.search import reindex
+from qrgen.views import create_or_get_types
+
+
+class QrCodeApiTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="apiuser", password="pass")
+        self.client.login(username="apiuser", password="pass")
+        create_or_get_types()
+        dynamic = QrType.objects.get(name="dynamic")
+        self.codes = [
+            QrCode.objects.create(
+                user=self.user,
+                type=dynamic,
+                title=f"code {i}",
+                action_type="web",
+                input_url=f"https://example.com/{i}",
+                action_url=f"https://example.com/{i}",
+            )
+            for i in range(5)
+        ]
+        other = User.objects.create_user(username="other", password="pass")
+        self.foreign = QrCode.objects.create(
+            user=other, type=dynamic, action_type="web", action_url="https://x.com"
+        )
+        self.list_url = reverse("api:qrcodes")
+
+        field = QrCode._meta.get_field("img")
+        self.addCleanup(setattr, field, "storage", field.storage)
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        field.storage = FileSystemStorage(location=self.media_root)
+
+    def tearDown(self):
+        folder_path = os.path.join(settings.BASE_DIR, "temp")
+        if os.path.exists(folder_path):
+            shutil.rmtree(folder_path)
+
+    def test_requires_authentication(self):
+        self.client.logout()
+        response = self.client.get(self.list_url)
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.json()["error"], "authentication required")
+
+    def test_cursor_pagination(self):
+        response = self.client.get(self.list_url, {"limit": 2})
+        data = response.json()
+        self.assertEqual(
+            [row["id"] for row in data["results"]],
+            [self.codes[4].id, self.codes[3].id],
+        )
+        seen = [row["id"] for row in data["results"]]
+        while data["next"]:
+            data = self.client.get(data["next"]).json()
+            seen += [row["id"] for row in data["results"]]
+        self.assertEqual(seen, [code.id for code in reversed(self.codes)])
+
+    def test_sparse_fields(self):
+        response = self.client.get(self.list_url, {"fields": "title,type", "limit": 1})
+        data = response.json()
+        self.assertEqual(data["results"], [{"title": "code 4", "type": "dynamic"}])
+        self.assertIsNotNone(data["next"])
+
+    def test_invalid_parameters(self):
+        self.assertEqual(self.client.get(self.list_url, {"fields": "nope"}).status_code, 400)
+        self.assertEqual(self.client.get(self.list_url, {"limit": "x"}).status_code, 400)
+        self.assertEqual(self.client.get(self.list_url, {"cursor": "!!"}).status_code, 400)
+
+    def test_list_query_count_is_constant(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(self.list_url)
+        # user (the session is cached) and a single query for the page
+        self.assertEqual(len(queries), 2)
+
+    def test_etag_and_not_modified(self):
+        response = self.client.get(self.list_url)
+        etag = response["ETag"]
+        response = self.client.get(self.list_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        QrCode.objects.filter(id=self.codes[0].id).update(title="changed")
+        response = self.client.get(self.list_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_gzip(self):
+        response = self.client.get(self.list_url, HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertIn("Accept-Encoding", response["Vary"])
+
+    def test_create(self):
+        response = self.client.post(
+            self.list_url,
+            json.dumps({"input_url": "https://example.com/new", "title": "new"}),
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 201)
+        data = response.json()
+        self.assertEqual(data["title"], "new")
+        self.assertTrue(data["action_url"].endswith(f"/qrcode/dynamic/{data['id']}"))
+        self.assertIsNotNone(data["img"])
+
+    def test_create_with_style(self):
+        logo = io.BytesIO()
+        Image.new("RGB", (64, 64), "red").save(logo, "PNG")
+        style = {
+            "fill_color": "#1d3557",
+            "module_shape": "rounded",
+            "logo": base64.b64encode(logo.getvalue()).decode(),
+        }
+        response = self.client.post(
+            self.list_url,
+            json.dumps({"input_url": "https://example.com/brand", "style": style}),
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 201)
+        code = QrCode.objects.get(id=response.json()["id"])
+        with code.img.open() as f:
+            self.assertEqual(Image.open(f).getpixel((0, 0))[:3], (255, 255, 255))
+
+        for style in ({"fill_color": "red"}, {"back_color": "#000000"}, {"logo": "???"}):
+            response = self.client.post(
+                self.list_url,
+                json.dumps({"input_url": "https://example.com", "style": style}),
+                content_type="application/json",
+            )
+            self.assertEqual(response.status_code, 400)
+
+    def test_create_rejects_uploads(self):
+        response = self.client.post(
+            self.list_url,
+            json.dumps({"input_url": "x", "action_type": "pdf"}),
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_create_validates_fields(self):
+        for body, field in (
+            ({"input_url": "https://example.com", "title": 5}, "title"),
+            ({"input_url": "javascript:alert(1)"}, "input_url"),
+            ({"input_url": ["https://example.com"]}, "input_url"),
+            ({"input_url": "https://example.com/" + "a" * 255}, "input_url"),
+            ({"input_url": "https://example.com", "action_type": "eml"}, "input_url"),
+        ):
+            response = self.client.post(
+                self.list_url, json.dumps(body), content_type="application/json"
+            )
+            self.assertEqual(response.status_code, 400, body)
+            self.assertIn(field, response.json()["fields"])
+
+        response = self.client.post(
+            self.list_url,
+            json.dumps({"input_url": "hello@example.com", "action_type": "eml"}),
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 201)
+
+    def test_patch_validates_fields(self):
+        url = reverse("api:qrcode", args=[self.codes[0].id])
+        for body in (
+            {"input_url": "javascript:alert(1)"},
+            {"input_url": 42},
+            {"title": ""},
+            {"title": 5},
+            {"is_active": "no"},
+        ):
+            response = self.client.patch(
+                url, json.dumps(body), content_type="application/json"
+            )
+            self.assertEqual(response.status_code, 400, body)
+            self.assertEqual(list(response.json()["fields"]), list(body))
+        self.codes[0].refresh_from_db()
+        self.assertEqual(self.codes[0].input_url, "https://example.com/0")
+
+    def test_detail_is_scoped_to_the_user(self):
+        url = reverse("api:qrcode", args=[self.codes[0].id])
+        self.assertEqual(self.client.get(url).json()["title"], "code 0")
+        url = reverse("api:qrcode", args=[self.foreign.id])
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.assertEqual(self.client.delete(url).status_code, 404)
+        self.assertTrue(QrCode.objects.filter(id=self.foreign.id).exists())
+
+    def test_patch(self):
+        url = reverse("api:qrcode", args=[self.codes[0].id])
+        response = self.client.patch(
+            url,
+            json.dumps({"title": "renamed", "is_active": False}),
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["title"], "renamed")
+        self.assertFalse(response.json()["is_active"])
+
+    def test_delete(self):
+        url = reverse("api:qrcode", args=[self.codes[0].id])
+        response = self.client.delete(url)
+        self.assertEqual(response.json(), {"msg": "OK"})
+        self.assertFalse(QrCode.objects.filter(id=self.codes[0].id).exists())
+
+    def test_search(self):
+        QrCode.objects.filter(id=self.codes[2].id).update(title="lunch menu")
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(
+                reverse("api:qrcode", args=[self.codes[3].id]),
+                json.dumps({"title": "dinner menu"}),
+                content_type="application/json",
+            )
+        with self.captureOnCommitCallbacks(execute=True):
+            reindex([self.codes[2].id])
+        response = self.client.get(self.list_url, {"q": "menu", "limit": 1})
+        data = response.json()
+        self.assertEqual(len(data["results"]), 1)
+        data = self.client.get(data["next"]).json()
+        self.assertEqual(len(data["results"]), 1)
+        self.assertIsNone(data["next"])
+
+    def test_cursor_round_trip(self):
+        self.assertEqual(decode_cursor(encode_cursor(1234)), 1234)
+
+
+@override_settings(API_RATE_LIMIT="3/m", API_ROUTE_RATE_LIMITS={"POST api:qrcodes": "1/m"})
+class TokenAuthTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        tokens.forget()
+        self.user = User.objects.create_user(username="tokenuser", password="pass")
+        self.token, self.raw_token = ApiToken.generate(self.user)
+        self.auth = {"HTTP_AUTHORIZATION": f"Bearer {self.raw_token}"}
+        self.list_url = reverse("api:qrcodes")
+
+    def test_token_is_stored_hashed(self):
+        self.assertNotIn(self.raw_token, self.token.key_hash)
+        self.assertTrue(self.raw_token.startswith(self.token.prefix))
+
+    def test_token_authenticates(self):
+        response = self.client.get(self.list_url, **self.auth)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["X-RateLimit-Limit"], "3")
+        self.assertEqual(response["X-RateLimit-Remaining"], "2")
+
+    def test_invalid_token(self):
+        response = self.client.get(self.list_url, HTTP_AUTHORIZATION="Bearer nope")
+        self.assertEqual(response.status_code, 401)
+
+    @override_settings(API_AUTH_FAILURE_RATE="2/m")
+    def test_failed_authentications_are_limited(self):
+        for guess in ["nope1", "nope2"]:
+            response = self.client.get(self.list_url, HTTP_AUTHORIZATION=f"Bearer {guess}")
+            self.assertEqual(response.status_code, 401)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.list_url, HTTP_AUTHORIZATION="Bearer nope3")
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(len(queries), 0)
+        self.assertEqual(response["Retry-After"], "30")
+        # valid tokens from that address are refused too, others aren't
+        self.assertEqual(self.client.get(self.list_url, **self.auth).status_code, 429)
+        response = self.client.get(self.list_url, REMOTE_ADDR="10.0.0.2", **self.auth)
+        self.assertEqual(response.status_code, 200)
+
+    def test_token_lookup_is_cached(self):
+        self.client.get(self.list_url, **self.auth)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(self.list_url, **self.auth)
+        # the page query only, no token, session or user lookups
+        self.assertEqual(len(queries), 1)
+
+    def test_rate_limited_requests_skip_the_database(self):
+        for _ in range(3):
+            self.assertEqual(self.client.get(self.list_url, **self.auth).status_code, 200)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.list_url, **self.auth)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(len(queries), 0)
+        self.assertEqual(response["X-RateLimit-Remaining"], "0")
+        self.assertEqual(response["Retry-After"], "20")
+
+    def test_route_limit(self):
+        create_or_get_types()
+        body = json.dumps({"input_url": "https://example.com", "action_type": "pdf"})
+        response = self.client.post(
+            self.list_url, body, content_type="application/json", **self.auth
+        )
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(
+            self.list_url, body, content_type="application/json", **self.auth
+        )
+        self.assertEqual(response.status_code, 429)
+        # the other routes still have their budget
+        self.assertEqual(self.client.get(self.list_url, **self.auth).status_code, 200)
+
+    def test_tokens_skip_csrf(self):
+        client = self.client_class(enforce_csrf_checks=True)
+        response = client.delete(reverse("api:qrcode", args=[1]), **self.auth)
+        self.assertEqual(response.status_code, 404)
+
+    def test_sessions_need_csrf(self):
+        client = self.client_class(enforce_csrf_checks=True)
+        client.login(username="tokenuser", password="pass")
+        response = client.delete(reverse("api:qrcode", args=[1]))
+        self.assertEqual(response.status_code, 403)
+
+    def test_parse_rate(self):
+        self.assertEqual(parse_rate("60/m"), (60, 60))
+        self.assertEqual(parse_rate("1000/hour"), (1000, 3600))
+
+    def test_create_api_token_command(self):
+        out = StringIO()
+        call_command("create_api_token", "tokenuser", "--name", "ci", stdout=out)
+        raw_token = out.getvalue().strip()
+        self.assertEqual(tokens.authenticate(raw_token)[1], self.user)
@@ -0,0 +1,60 @@
+import threading
+import time
+
+from django.conf import settings
+
+from .models import ApiToken, hash_token
+
+# key hash -> (expires, (token_id, user) or None), kept per process so that
+# repeated requests with the same token don't query the database. A revoked
+# token stays usable in the other workers for at most API_TOKEN_CACHE_TTL
+_cache = {}
+_lock = threading.Lock()
+
+MAX_CACHED_TOKENS = 1024
+
+
+def token_from_request(request):
+    # "Authorization: Bearer <token>", None when the header is missing
+    header = request.headers.get("Authorization", "")
+    scheme, _, raw_token = header.partition(" ")
+    if scheme.lower() != "bearer" or not raw_token.strip():
+        return None
+    return raw_token.strip()
+
+
+def authenticate(raw_token):
+    """(token_id, user) for a valid token, None otherwise."""
+    key_hash = hash_token(raw_token)
+    now = time.monotonic()
+    with _lock:
+        cached = _cache.get(key_hash)
+    if cached is not None and cached[0] > now:
+        return cached[1]
+
+    token = (
+        ApiToken.objects.select_related("user")
+        .filter(key_hash=key_hash, user__is_active=True)
+        .first()
+    )
+    # unknown tokens are cached too, so a client retrying a revoked token
+    # costs one query per TTL. Each guess is a new token and a query: those
+    # are throttled per client address before the lookup (api.ratelimit)
+    result = (token.id, token.user) if token is not None else None
+    ttl = getattr(settings, "API_TOKEN_CACHE_TTL", 60)
+    with _lock:
+        if len(_cache) >= MAX_CACHED_TOKENS:
+            expired = [key for key, (expires, _) in _cache.items() if expires <= now]
+            for key in expired or list(_cache)[: MAX_CACHED_TOKENS // 2]:
+                del _cache[key]
+        _cache[key_hash] = (now + ttl, result)
+    return result
+
+
+def forget(key_hash=None):
+    # drop a token (or all of them) from this process' cache
+    with _lock:
+        if key_hash is None:
+            _cache.clear()
+        else:
+            _cache.pop(key_hash, None)
@@ -0,0 +1,9 @@
+from django.urls import path
+from .views import QrCodeListView, QrCodeDetailView
+
+app_name = 'api'
+
+urlpatterns = [
+    path('', QrCodeListView.as_view(), name='qrcodes'),
+    path('<int:code_id>/', QrCodeDetailView.as_view(), name='qrcode'),
+]
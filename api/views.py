@@ -0,0 +1,312 @@
+import base64
+import binascii
+import json
+
+from django.core.exceptions import ValidationError
+from django.core.validators import EmailValidator, URLValidator
+from django.http import JsonResponse
+from django.middleware.csrf import CsrfViewMiddleware
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.gzip import gzip_page
+from django.views.decorators.http import conditional_page
+
+from handlescan import lookup
+from handlescan.filters import client_ip
+from qrgen.models import QrCode, QrType, ACTION_TYPE
+from qrgen.search import reindex, search
+from qrgen.views import delete_codes, save_qrcode_image
+
+from . import ratelimit
+from .serializers import (
+    InvalidParameter,
+    decode_cursor,
+    encode_cursor,
+    parse_fields,
+    parse_limit,
+    serialize,
+)
+from .tokens import authenticate, token_from_request
+
+UPLOAD_TYPES = ["pdf", "img", "biz"]
+# the scan view redirects to input_url, except for emails which it shows
+validate_url = URLValidator(schemes=["http", "https"])
+validate_email = EmailValidator()
+
+# ETags are computed from the response body, gzip runs after so that the
+# validators are the same for compressed and plain responses
+cacheable = method_decorator([gzip_page, conditional_page], name="get")
+
+
+def error(message, status):
+    return JsonResponse({"error": message}, status=status)
+
+
+def parse_body(request):
+    if request.content_type == "application/json":
+        try:
+            data = json.loads(request.body or b"{}")
+        except ValueError:
+            raise InvalidParameter("invalid JSON body")
+        if not isinstance(data, dict):
+            raise InvalidParameter("the body must be a JSON object")
+        return data
+    return request.POST.dict()
+
+
+def parse_style(data):
+    # {"fill_color", "back_color", "module_shape", "logo" (base64)}, all optional
+    if data is None:
+        return None
+    if not isinstance(data, dict):
+        raise InvalidParameter("style must be an object")
+    from qrgen.rendering import InvalidStyle, make_style
+
+    try:
+        logo = base64.b64decode(data["logo"], validate=True) if data.get("logo") else None
+        return make_style(
+            fill=data.get("fill_color"),
+            back=data.get("back_color"),
+            shape=data.get("module_shape"),
+            logo=logo,
+        )
+    except (InvalidStyle, binascii.Error, TypeError) as exc:
+        raise InvalidParameter(f"invalid style: {exc}")
+
+
+def clean_fields(data, action_type):
+    """
+    The editable fields present in data, checked for type and format,
+    raises InvalidParameter with the errors of each field.
+    """
+    cleaned, errors = {}, {}
+    if "title" in data:
+        title = data["title"]
+        max_length = QrCode._meta.get_field("title").max_length
+        if not isinstance(title, str) or not title.strip():
+            errors["title"] = ["must be a non-empty string"]
+        elif len(title) > max_length:
+            errors["title"] = [f"at most {max_length} characters"]
+        else:
+            cleaned["title"] = title
+    if "input_url" in data:
+        input_url = data["input_url"]
+        max_length = QrCode._meta.get_field("input_url").max_length
+        if not isinstance(input_url, str) or not input_url:
+            errors["input_url"] = ["must be a non-empty string"]
+        elif len(input_url) > max_length:
+            errors["input_url"] = [f"at most {max_length} characters"]
+        else:
+            try:
+                if action_type == "eml":
+                    validate_email(input_url)
+                else:
+                    validate_url(input_url)
+                cleaned["input_url"] = input_url
+            except ValidationError as exc:
+                errors["input_url"] = exc.messages
+    if "is_active" in data:
+        if not isinstance(data["is_active"], bool):
+            errors["is_active"] = ["must be a boolean"]
+        else:
+            cleaned["is_active"] = data["is_active"]
+    if errors:
+        raise InvalidParameter("invalid fields", errors)
+    return cleaned
+
+
+def enforce_csrf(request):
+    # the views are csrf exempt for token clients, sessions still need it
+    check = CsrfViewMiddleware(lambda request: None)
+    check.process_request(request)
+    return check.process_view(request, None, (), {})
+
+
+@method_decorator(csrf_exempt, name="dispatch")
+class ApiView(View):
+    """
+    Base view answering JSON errors instead of redirects and tracebacks.
+
+    Clients authenticate with "Authorization: Bearer <token>" or the
+    session cookie. Token requests are rate limited (see api.ratelimit),
+    and so are failed authentications per client address; a rejected
+    request only costs a cache lookup.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        limit = None
+        raw_token = token_from_request(request)
+        if raw_token is not None:
+            client = client_ip(request)
+            failures = ratelimit.auth_failures(client)
+            if not failures.allowed:
+                return ratelimit.set_headers(
+                    error("too many invalid tokens", 429), failures
+                )
+            auth = authenticate(raw_token)
+            if auth is None:
+                ratelimit.auth_failures(client, failed=True)
+                return error("invalid token", 401)
+            token_id, user = auth
+            limit = ratelimit.check(
+                token_id, request.method, request.resolver_match.view_name
+            )
+            if not limit.allowed:
+                return ratelimit.set_headers(error("rate limit exceeded", 429), limit)
+            request.user = user
+        elif not request.user.is_authenticated:
+            return error("authentication required", 401)
+        else:
+            rejected = enforce_csrf(request)
+            if rejected is not None:
+                return rejected
+
+        try:
+            response = super().dispatch(request, *args, **kwargs)
+        except InvalidParameter as exc:
+            response = error(str(exc), 400)
+            if exc.fields:
+                response = JsonResponse(
+                    {"error": str(exc), "fields": exc.fields}, status=400
+                )
+        if limit is not None:
+            ratelimit.set_headers(response, limit)
+        return response
+
+    def http_method_not_allowed(self, request, *args, **kwargs):
+        return error("method not allowed", 405)
+
+    def user_codes(self, request):
+        return QrCode.objects.filter(user=request.user)
+
+
+@cacheable
+class QrCodeListView(ApiView):
+    def get(self, request):
+        fields = parse_fields(request.GET.get("fields"))
+        limit = parse_limit(request.GET.get("limit"))
+
+        query = request.GET.get("q", "").strip()
+        if query:
+            return self.search(request, query, fields, limit)
+
+        codes = self.user_codes(request).order_by("-id")
+        cursor = request.GET.get("cursor")
+        if cursor:
+            codes = codes.filter(id__lt=decode_cursor(cursor))
+
+        # one extra row tells whether there is a next page, the id is
+        # always fetched to build the cursor
+        rows = serialize(codes[: limit + 1], ["id", *fields] if "id" not in fields else fields)
+        next_url = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            params = request.GET.copy()
+            params["cursor"] = encode_cursor(rows[-1]["id"])
+            next_url = request.build_absolute_uri(f"{request.path}?{params.urlencode()}")
+        if "id" not in fields:
+            for row in rows:
+                del row["id"]
+
+        return JsonResponse({"results": rows, "next": next_url})
+
+    def search(self, request, query, fields, limit):
+        # ranked results, the cursor is the offset of the next page
+        cursor = request.GET.get("cursor")
+        offset = decode_cursor(cursor) if cursor else 0
+        ids = search(request.user, query, limit + 1, offset)
+        rows = serialize(
+            self.user_codes(request).filter(id__in=ids[:limit]),
+            ["id", *fields] if "id" not in fields else fields,
+        )
+        rank = {code_id: position for position, code_id in enumerate(ids)}
+        rows.sort(key=lambda row: rank[row["id"]])
+        if "id" not in fields:
+            for row in rows:
+                del row["id"]
+
+        next_url = None
+        if len(ids) > limit:
+            params = request.GET.copy()
+            params["cursor"] = encode_cursor(offset + limit)
+            next_url = request.build_absolute_uri(f"{request.path}?{params.urlencode()}")
+        return JsonResponse({"results": rows, "next": next_url})
+
+    def post(self, request):
+        data = parse_body(request)
+        try:
+            qr_type = QrType.objects.get(name=data.get("type", "dynamic"))
+        except QrType.DoesNotExist:
+            raise InvalidParameter("type must be dynamic or static")
+        action_type = data.get("action_type", "web")
+        if action_type not in dict(ACTION_TYPE) or action_type in UPLOAD_TYPES:
+            raise InvalidParameter("unsupported action_type")
+        if data.get("input_url") is None:
+            raise InvalidParameter("input_url is required")
+        cleaned = clean_fields(
+            {"input_url": data["input_url"], "title": data.get("title") or "Untitled"},
+            action_type,
+        )
+        input_url, title = cleaned["input_url"], cleaned["title"]
+        style = parse_style(data.get("style"))
+
+        this_qrcode = QrCode.objects.create(
+            user=request.user,
+            type=qr_type,
+            title=title,
+            action_type=action_type,
+            input_url=input_url,
+            action_url=input_url,
+        )
+        if qr_type.name == "dynamic":
+            this_qrcode.action_url = request.build_absolute_uri(
+                f"/qrcode/dynamic/{this_qrcode.id}"
+            )
+        else:
+            this_qrcode.is_dynamic = False
+        this_qrcode.save()
+        save_qrcode_image(this_qrcode, style)
+
+        (row,) = serialize(QrCode.objects.filter(id=this_qrcode.id), parse_fields(None))
+        return JsonResponse(row, status=201)
+
+
+@cacheable
+class QrCodeDetailView(ApiView):
+    editable = ["title", "input_url", "is_active"]
+
+    def get(self, request, code_id):
+        fields = parse_fields(request.GET.get("fields"))
+        rows = serialize(self.user_codes(request).filter(id=code_id), fields)
+        if not rows:
+            return error("not found", 404)
+        return JsonResponse(rows[0])
+
+    def patch(self, request, code_id):
+        data = parse_body(request)
+        changes = {key: value for key, value in data.items() if key in self.editable}
+        if not changes:
+            raise InvalidParameter(f"nothing to change, editable: {', '.join(self.editable)}")
+
+        codes = self.user_codes(request).filter(id=code_id)
+        action_type = None
+        if "input_url" in changes:
+            # the content of a static code is printed in its image
+            codes = codes.filter(is_dynamic=True)
+            action_type = codes.values_list("action_type", flat=True).first()
+            if action_type is None:
+                return error("not found or not editable", 404)
+        # update() skips model validation, everything is checked here
+        changes = clean_fields(changes, action_type)
+        if not codes.update(**changes):
+            return error("not found or not editable", 404)
+        reindex([code_id])
+        # update() sends no signal, this worker must not redirect to the old url
+        lookup.forget([code_id])
+        return JsonResponse(serialize(codes, parse_fields(None))[0])
+
+    def delete(self, request, code_id):
+        if not delete_codes(self.user_codes(request).filter(id=code_id)):
+            return error("not found", 404)
+        return JsonResponse({"msg": "OK"})
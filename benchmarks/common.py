@@ -0,0 +1,39 @@
+import os
+import sys
+import time
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+
+def setup_django():
+    sys.path.insert(0, str(BASE_DIR))
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "QRGenProject.settings")
+    os.environ.setdefault("SECRET_KEY", "benchmark")
+    import django
+
+    django.setup()
+
+
+def measure(label, func, iterations=1000):
+    # runs func `iterations` times and prints the throughput
+    func()  # warm up
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    elapsed = time.perf_counter() - start
+    print(
+        f"{label:<40} {iterations / elapsed:>10.0f} req/s"
+        f" {elapsed / iterations * 1e6:>10.1f} us/req"
+    )
+    return elapsed / iterations
+
+
+def consume(response):
+    # read a response body the way a WSGI server would
+    if hasattr(response, "streaming_content"):
+        for _ in response.streaming_content:
+            pass
+    else:
+        response.content
+    response.close()
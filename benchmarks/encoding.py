@@ -0,0 +1,49 @@
+"""
+Stored image size: `codes` generated codes (half plain, half branded)
+written by PIL's PNG encoder as save_qrcode_image used to, with
+optimize=True, and by qrgen.encoding.encode_png, with the time each
+takes per image.
+
+    python -m benchmarks.encoding [codes]
+"""
+import io
+import sys
+import time
+
+from .common import setup_django
+
+
+def main(codes=200):
+    setup_django()
+    from qrgen import rendering
+    from qrgen.encoding import encode_png
+
+    branded = rendering.Style(fill="#1d3557", back="#f1faee")
+    images = [
+        rendering.render(
+            f"https://qrgen.example.com/qrcode/dynamic/{i}/", branded if i % 2 else None
+        )
+        for i in range(codes)
+    ]
+
+    def pil(image, **options):
+        out = io.BytesIO()
+        image.save(out, "PNG", **options)
+        return out.getvalue()
+
+    for label, encode in (
+        ("PIL", pil),
+        ("PIL optimize=True", lambda image: pil(image, optimize=True)),
+        ("encode_png", encode_png),
+    ):
+        start = time.perf_counter()
+        size = sum(len(encode(image)) for image in images)
+        elapsed = time.perf_counter() - start
+        print(
+            f"{label:<40} {size / codes:>10.0f} B/image"
+            f" {elapsed / codes * 1e3:>8.2f} ms/image"
+        )
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:2]))
@@ -0,0 +1,59 @@
+"""
+Export: time and peak Python memory (tracemalloc) to stream a user's codes
+as CSV, for growing numbers of codes. The peak should stay flat. Runs
+against a throwaway in-memory test database.
+
+    python -m benchmarks.export [max_codes]
+"""
+import sys
+import time
+import tracemalloc
+
+from .common import setup_django
+
+
+def main(max_codes=200000):
+    setup_django()
+    from django.contrib.auth.models import User
+    from django.db import connection
+
+    from qrgen.export import export
+    from qrgen.models import QrCode, QrType
+
+    connection.creation.create_test_db(verbosity=0)
+    user = User.objects.create_user(username="benchmark")
+    qr_type = QrType.objects.create(name="dynamic")
+
+    count = 0
+    size = 1000
+    while size <= max_codes:
+        QrCode.objects.bulk_create(
+            (
+                QrCode(
+                    user=user,
+                    type=qr_type,
+                    title=f"code {i}",
+                    input_url="https://example.com",
+                    action_type="web",
+                )
+                for i in range(count, size)
+            ),
+            batch_size=5000,
+        )
+        count = size
+
+        tracemalloc.start()
+        start = time.perf_counter()
+        total = sum(len(chunk) for chunk in export(user, "csv")[0])
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print(
+            f"{size:>10} codes {total / 1024:>10.0f} KB {elapsed:>8.2f} s"
+            f" peak {peak / 1024:>8.0f} KB"
+        )
+        size *= 10
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:2]))
@@ -0,0 +1,78 @@
+"""
+Image delivery: the bytes a dashboard of `codes` generated images costs
+with each browser's Accept header, against the PNGs as stored, then the
+time to serve a variant once it's encoded. Half of the codes are plain,
+half branded. Runs against throwaway media and variant folders.
+
+    python -m benchmarks.image_variants [codes] [iterations]
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from .common import consume, measure, setup_django
+
+ACCEPT = {
+    "no Accept": "",
+    "Safari 15": "image/png,image/svg+xml,image/*;q=0.8,video/*;q=0.8,*/*;q=0.5",
+    "Chrome": "image/avif,image/webp,image/apng,image/svg+xml,image/*,*/*;q=0.8",
+}
+
+
+def main(codes=50, iterations=2000):
+    setup_django()
+    from django.test import RequestFactory, override_settings
+
+    from QRGenProject.caching import serve_media
+    from qrgen import rendering
+
+    root = tempfile.mkdtemp()
+    try:
+        os.makedirs(os.path.join(root, "qrcodes"))
+        stored = 0
+        for i in range(codes):
+            style = rendering.Style(fill="#1d3557", back="#f1faee") if i % 2 else None
+            path = os.path.join(root, "qrcodes", f"qrcode-{i}.png")
+            data = f"https://qrgen.example.com/qrcode/dynamic/{i}/"
+            image = rendering.render(data, style)
+            image.save(path)
+            stored += os.path.getsize(path)
+        print(f"{'stored':<40} {stored / codes:>10.0f} B/image")
+
+        factory = RequestFactory()
+        with override_settings(
+            MEDIA_ROOT=root, IMAGE_VARIANT_ROOT=os.path.join(root, ".variants")
+        ):
+            for label, accept in ACCEPT.items():
+                sent = 0
+                start = time.perf_counter()
+                for i in range(codes):
+                    request = factory.get(
+                        f"/media/qrcodes/qrcode-{i}.png", HTTP_ACCEPT=accept
+                    )
+                    response = serve_media(request, f"qrcodes/qrcode-{i}.png")
+                    sent += sum(len(chunk) for chunk in response.streaming_content)
+                    response.close()
+                elapsed = time.perf_counter() - start
+                print(
+                    f"{label:<40} {sent / codes:>10.0f} B/image"
+                    f" {stored / sent:>6.1f}x smaller, first requests"
+                    f" {elapsed / codes * 1e3:.1f} ms/image"
+                )
+
+            request = factory.get(
+                "/media/qrcodes/qrcode-1.png", HTTP_ACCEPT=ACCEPT["Chrome"]
+            )
+            measure(
+                "encoded variant",
+                lambda: consume(serve_media(request, "qrcodes/qrcode-1.png")),
+                iterations,
+            )
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:3]))
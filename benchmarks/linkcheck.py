@@ -0,0 +1,60 @@
+"""
+Destination health checks: qrgen.linkcheck.check_all against a local
+stand-in server that answers every request after `latency_ms`. The urls
+are spread over 250 loopback addresses (127.0.0.1-250) so the per-host
+limit applies like it would to real destinations. The server runs in the
+same event loop, its work is included in the time.
+
+    python -m benchmarks.linkcheck [urls] [latency_ms]
+"""
+import asyncio
+import sys
+import time
+
+from .common import setup_django
+
+HOSTS = 250
+
+
+async def serve(latency):
+    async def answer(reader, writer):
+        while (await reader.readline()).strip():
+            pass
+        await asyncio.sleep(latency)
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Length: 0\r\nConnection: close\r\n\r\n")
+        await writer.drain()
+        writer.close()
+
+    return await asyncio.start_server(answer, "0.0.0.0", 0, backlog=4096)
+
+
+async def run(urls, latency):
+    from django.test.utils import override_settings
+
+    from qrgen.linkcheck import check_all
+
+    server = await serve(latency)
+    port = server.sockets[0].getsockname()[1]
+    targets = [
+        (f"http://127.0.0.{i % HOSTS + 1}:{port}/code/{i}", "", "") for i in range(urls)
+    ]
+    start = time.perf_counter()
+    # the stand-in server is on loopback
+    with override_settings(LINK_CHECK_ALLOW_PRIVATE=True):
+        results = await check_all(targets)
+    elapsed = time.perf_counter() - start
+    server.close()
+    failed = sum(1 for result in results if result.status != 200)
+    print(
+        f"{urls} urls in {elapsed:.1f} s ({urls / elapsed:.0f} urls/s),"
+        f" {failed} failed"
+    )
+
+
+def main(urls=100000, latency_ms=50):
+    setup_django()
+    asyncio.run(run(urls, latency_ms / 1000))
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:3]))
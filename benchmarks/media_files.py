@@ -0,0 +1,63 @@
+"""
+Media delivery: reading the whole file into an HttpResponse (what the
+download views used to do) against the QRGenProject.media backends.
+
+The WSGI server is simulated with a wsgi.file_wrapper that, like
+gunicorn's, hands the file descriptor over instead of iterating it, so
+the numbers are the time Python spends per request.
+
+    python -m benchmarks.media_files [size_in_kb] [iterations]
+"""
+import os
+import sys
+import tempfile
+
+from .common import consume, measure, setup_django
+
+
+class FileWrapper:
+    # stands in for the server's sendfile-capable wsgi.file_wrapper
+    def __init__(self, filelike, block_size=8192):
+        self.filelike = filelike
+
+    def close(self):
+        self.filelike.close()
+
+
+def main(size_kb=2048, iterations=500):
+    setup_django()
+    from django.http import HttpResponse
+    from django.test import override_settings
+
+    from QRGenProject.media import send_file
+
+    with tempfile.TemporaryDirectory() as media_root:
+        fullpath = os.path.join(media_root, "poster.png")
+        with open(fullpath, "wb") as fh:
+            fh.write(os.urandom(size_kb * 1024))
+
+        def read_into_memory():
+            with open(fullpath, "rb") as fh:
+                consume(HttpResponse(fh.read(), content_type="image/png"))
+
+        def file_response():
+            response = send_file(fullpath)
+            FileWrapper(response.file_to_stream).close()
+
+        def proxy_header():
+            consume(send_file(fullpath))
+
+        print(f"file size: {size_kb} KB")
+        measure("HttpResponse(fh.read())", read_into_memory, iterations)
+        measure("FileResponse + wsgi.file_wrapper", file_response, iterations)
+        with override_settings(
+            MEDIA_DELIVERY_BACKEND="nginx",
+            MEDIA_ACCEL_LOCATIONS={media_root: "/internal/media/"},
+        ):
+            measure("X-Accel-Redirect", proxy_header, iterations)
+        with override_settings(MEDIA_DELIVERY_BACKEND="apache"):
+            measure("X-Sendfile", proxy_header, iterations)
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:3]))
@@ -0,0 +1,67 @@
+"""
+Large-format codes: a poster PNG `side` pixels wide drawn on a PIL canvas
+(qrcode.make with a large box size) and converted to RGB the way download
+converts images, against qrgen.rendering.write_large_png streaming it row
+by row. Each runs in a forked child so its peak memory can be read from
+the child's resource usage.
+
+    python -m benchmarks.posters [side]
+"""
+import os
+import sys
+import time
+
+from .common import setup_django
+
+DATA = "https://qrgen.example.com/qrcode/dynamic/123456/"
+
+
+def canvas(side, path):
+    import qrcode
+
+    # modules, border included, at the default 10px box size
+    count = qrcode.make(DATA).pixel_size // 10
+    image = qrcode.make(DATA, box_size=max(round(side / count), 1), border=4)
+    image.get_image().convert("RGB").save(path, dpi=(300, 300))
+
+
+def streamed(side, path):
+    from qrgen.rendering import write_large_png
+
+    with open(path, "wb") as f:
+        write_large_png(DATA, f, side, 300)
+
+
+def run(label, func, side):
+    path = f"/tmp/poster-{os.getpid()}.png"
+    start = time.perf_counter()
+    pid = os.fork()
+    if pid == 0:
+        func(side, path)
+        os._exit(0)
+    _, status, usage = os.wait4(pid, 0)
+    elapsed = time.perf_counter() - start
+    if status != 0:
+        # the kernel's OOM killer, usually
+        print(f"{label:<20} {elapsed:>7.2f} s  failed ({os.waitstatus_to_exitcode(status)})")
+        return
+    # ru_maxrss is in kilobytes on linux
+    print(
+        f"{label:<20} {elapsed:>7.2f} s {usage.ru_maxrss / 1024:>9.0f} MB peak"
+        f" {os.path.getsize(path) / 1024:>9.0f} kB file"
+    )
+    os.remove(path)
+
+
+def main(side=10000):
+    setup_django()
+    import qrcode  # noqa: F401, imported once for both children
+    import png  # noqa: F401
+    from PIL import Image  # noqa: F401
+
+    run("PIL canvas", canvas, side)
+    run("streamed rows", streamed, side)
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:2]))
@@ -0,0 +1,39 @@
+"""
+QR code images: the plain black on white code, a coloured code with
+rounded modules, and the same code with a logo, with the prepared logo
+asset cached (repeat renders with one logo) and without (a new logo
+every time).
+
+    python -m benchmarks.rendering [iterations]
+"""
+import io
+import sys
+
+from .common import measure, setup_django
+
+
+def main(iterations=100):
+    setup_django()
+    from PIL import Image
+
+    from qrgen import rendering
+
+    logo = io.BytesIO()
+    Image.new("RGB", (1200, 800), "#e63946").save(logo, "PNG")
+    logo = logo.getvalue()
+    data = "https://qrgen.example.com/qrcode/dynamic/123456/"
+    colored = rendering.make_style(fill="#1d3557", back="#f1faee", shape="rounded")
+    branded = colored._replace(logo=logo)
+
+    def uncached():
+        rendering.forget_logos()
+        rendering.render(data, branded)
+
+    measure("plain", lambda: rendering.render(data), iterations)
+    measure("colours, rounded", lambda: rendering.render(data, colored), iterations)
+    measure("colours, rounded, logo cached", lambda: rendering.render(data, branded), iterations)
+    measure("colours, rounded, logo uncached", uncached, iterations)
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:2]))
@@ -0,0 +1,59 @@
+"""
+Scans: a dynamic code redirect and an email code page through the full
+WSGI application (every MIDDLEWARE) against the scan fast path
+(handlescan.fastpath, SCAN_MIDDLEWARE only). Repeat scans from the same
+client aren't counted, so after the first one neither path writes. Runs
+against a throwaway in-memory test database.
+
+    python -m benchmarks.scans [iterations]
+"""
+import io
+import sys
+
+from .common import measure, setup_django
+
+
+def main(iterations=2000):
+    setup_django()
+    from django.contrib.auth.models import User
+    from django.core.handlers.wsgi import WSGIHandler
+    from django.db import connection
+
+    from handlescan.fastpath import ScanHandler
+    from qrgen.models import QrCode, QrType
+
+    connection.creation.create_test_db(verbosity=0)
+    user = User.objects.create_user(username="benchmark")
+    qr_type = QrType.objects.create(name="dynamic")
+    web = QrCode.objects.create(
+        user=user, type=qr_type, input_url="https://example.com", action_type="web"
+    )
+    email = QrCode.objects.create(
+        user=user, type=qr_type, input_url="scan@example.com", action_type="eml"
+    )
+
+    def scan(application, code):
+        environ = {
+            "REQUEST_METHOD": "GET",
+            # the URL generated codes encode
+            "PATH_INFO": f"/qrcode/dynamic/{code.id}",
+            "QUERY_STRING": "",
+            "SERVER_NAME": "localhost",
+            "SERVER_PORT": "8000",
+            "SERVER_PROTOCOL": "HTTP/1.1",
+            "HTTP_USER_AGENT": "Mozilla/5.0 (iPhone)",
+            "REMOTE_ADDR": "203.0.113.7",
+            "wsgi.url_scheme": "http",
+            "wsgi.input": io.BytesIO(),
+            "wsgi.errors": sys.stderr,
+        }
+        b"".join(application(environ, lambda status, headers: None))
+
+    full, fast = WSGIHandler(), ScanHandler()
+    for label, code in (("redirect", web), ("email page", email)):
+        measure(f"{label}, full stack", lambda: scan(full, code), iterations)
+        measure(f"{label}, fast path", lambda: scan(fast, code), iterations)
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:2]))
@@ -0,0 +1,65 @@
+"""
+Dashboard search: the SQLite FTS5 index (qrgen.search) against a LIKE
+scan over title and input_url, for one user owning `codes` codes. Runs
+against a throwaway in-memory test database.
+
+    python -m benchmarks.search [codes] [iterations]
+"""
+import random
+import sys
+
+from .common import measure, setup_django
+
+WORDS = (
+    "menu lunch dinner flyer poster banner card event ticket wifi survey "
+    "coupon promo invoice catalog brochure resume portfolio gallery review"
+).split()
+
+
+def main(codes=100000, iterations=200):
+    setup_django()
+    from django.contrib.auth.models import User
+    from django.db import connection
+    from django.db.models import Q
+
+    from qrgen.models import QrCode, QrType
+    from qrgen.search import backend, documents, search
+
+    connection.creation.create_test_db(verbosity=0)
+    user = User.objects.create_user(username="benchmark")
+    qr_type = QrType.objects.create(name="dynamic")
+    rng = random.Random(0)
+    QrCode.objects.bulk_create(
+        QrCode(
+            user=user,
+            type=qr_type,
+            title=" ".join(rng.sample(WORDS, 3)),
+            input_url=f"https://example.com/{rng.choice(WORDS)}/{i}",
+            action_type="web",
+        )
+        for i in range(codes)
+    )
+    ids = list(QrCode.objects.values_list("id", flat=True))
+    for start in range(0, len(ids), 5000):
+        backend.index(documents(ids[start : start + 5000]))
+
+    def like_scan():
+        list(
+            QrCode.objects.filter(user=user)
+            .filter(Q(title__icontains="poster") | Q(input_url__icontains="poster"))
+            .values_list("id", flat=True)[:50]
+        )
+
+    print(f"codes: {codes}")
+    measure("LIKE '%poster%' (first 50)", like_scan, iterations)
+    measure("FTS5 'poster', ranked (first 50)", lambda: search(user, "poster", 50), iterations)
+    measure("FTS5 'pos' prefix, ranked", lambda: search(user, "pos", 50), iterations)
+    measure(
+        "FTS5 'poster menu', page 10",
+        lambda: search(user, "poster menu", 50, offset=450),
+        iterations,
+    )
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:3]))
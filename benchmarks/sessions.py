@@ -0,0 +1,53 @@
+"""
+Sessions: queries and time per dashboard load for a logged in user, with
+database sessions and the stock AuthenticationMiddleware against cached
+database (the default) or signed cookie sessions and the per-worker user
+cache (accounts.users). Runs
+against a throwaway in-memory test database.
+
+    python -m benchmarks.sessions [iterations]
+"""
+import sys
+
+from .common import consume, measure, setup_django
+
+
+def main(iterations=500):
+    setup_django()
+    from django.conf import settings
+    from django.contrib.auth.models import User
+    from django.db import connection
+    from django.test import Client
+    from django.test.utils import CaptureQueriesContext, override_settings
+
+    connection.creation.create_test_db(verbosity=0)
+    User.objects.create_user(username="benchmark", password="benchmark")
+
+    stock_middleware = [
+        "django.contrib.auth.middleware.AuthenticationMiddleware"
+        if name == "accounts.middleware.CachedAuthenticationMiddleware"
+        else name
+        for name in settings.MIDDLEWARE
+    ]
+    setups = [
+        ("db sessions, stock auth", "db", stock_middleware),
+        ("cached_db sessions, cached user", "cached_db", settings.MIDDLEWARE),
+        ("signed cookies, cached user", "signed_cookies", settings.MIDDLEWARE),
+    ]
+    for label, backend, middleware in setups:
+        with override_settings(
+            SESSION_ENGINE=f"django.contrib.sessions.backends.{backend}",
+            MIDDLEWARE=middleware,
+            STATICFILES_STORAGE="django.contrib.staticfiles.storage.StaticFilesStorage",
+        ):
+            client = Client()
+            client.login(username="benchmark", password="benchmark")
+            consume(client.get("/dashboard/"))
+            with CaptureQueriesContext(connection) as queries:
+                consume(client.get("/dashboard/"))
+            print(f"{label}: {len(queries)} queries per dashboard load")
+            measure(label, lambda: consume(client.get("/dashboard/")), iterations)
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:2]))
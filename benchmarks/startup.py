@@ -0,0 +1,126 @@
+"""
+Cold start: a fresh interpreter imports the WSGI application and answers
+its first request, the way a worker does after a scale-to-zero machine
+boots. The request is a scan of a dynamic code, at the URL codes encode,
+against a throwaway in-memory database created between the two (not
+timed). Prints the slowest imports (python -X importtime) and the time to
+the first response, and fails when it goes over BUDGET_MS or when one of
+the modules the request path doesn't need got imported.
+
+    python -m benchmarks.startup [runs]
+"""
+import json
+import os
+import subprocess
+import sys
+import time
+
+from .common import BASE_DIR
+
+# interpreter start to first response, generous so slow CI machines pass
+BUDGET_MS = 2500
+
+# only needed to generate images, talk to Cloudinary or Elasticsearch
+HEAVY_MODULES = [
+    "qrcode",
+    "PIL.Image",
+    "cloudinary_storage.storage",
+    "cloudinary.uploader",
+    "requests",
+    "elasticsearch",
+    "decouple",
+    "environ",
+]
+
+FIRST_REQUEST = "/qrcode/dynamic/1"
+
+CHILD = f"""
+import io, json, os, sys, time
+start = time.perf_counter()
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "QRGenProject.settings")
+from QRGenProject.wsgi import application
+loaded = time.perf_counter()
+heavy = [name for name in {HEAVY_MODULES!r} if name in sys.modules]
+
+# the code to scan, in a test database; what this imports isn't counted
+from django.db import connection
+connection.creation.create_test_db(verbosity=0)
+from django.contrib.auth.models import User
+from qrgen.models import QrCode, QrType
+QrCode.objects.create(
+    user=User.objects.create_user(username="startup"),
+    type=QrType.objects.create(name="dynamic"),
+    is_dynamic=True, action_type="web", input_url="https://example.com",
+)
+before = set(sys.modules)
+setup = time.perf_counter()
+
+environ = {{
+    "REQUEST_METHOD": "GET", "PATH_INFO": {FIRST_REQUEST!r}, "QUERY_STRING": "",
+    "SERVER_NAME": "localhost", "SERVER_PORT": "8000", "SERVER_PROTOCOL": "HTTP/1.1",
+    "HTTP_USER_AGENT": "Mozilla/5.0 (iPhone)", "REMOTE_ADDR": "203.0.113.7",
+    "wsgi.url_scheme": "http", "wsgi.input": io.BytesIO(), "wsgi.errors": sys.stderr,
+}}
+status = []
+b"".join(application(environ, lambda s, h, exc_info=None: status.append(s)))
+done = time.perf_counter()
+heavy += [name for name in {HEAVY_MODULES!r} if name in set(sys.modules) - before]
+print(json.dumps({{
+    "load_ms": (loaded - start) * 1000,
+    "setup_ms": (setup - loaded) * 1000,
+    "request_ms": (done - setup) * 1000,
+    "status": status[0],
+    "heavy": heavy,
+}}))
+"""
+
+
+def cold_start(importtime=False):
+    """Runs one cold start, returns its measurements."""
+    env = {**os.environ, "SECRET_KEY": os.environ.get("SECRET_KEY", "benchmark")}
+    command = [sys.executable, *(["-X", "importtime"] if importtime else []), "-c", CHILD]
+    start = time.perf_counter()
+    result = subprocess.run(
+        command, cwd=BASE_DIR, env=env, capture_output=True, text=True, check=True
+    )
+    total_ms = (time.perf_counter() - start) * 1000
+    measurements = json.loads(result.stdout.splitlines()[-1])
+    # a real worker's database already exists
+    measurements["total_ms"] = total_ms - measurements["setup_ms"]
+    if importtime:
+        measurements["imports"] = slowest_imports(result.stderr)
+    return measurements
+
+
+def slowest_imports(importtime_output, count=15):
+    # packages by the time spent importing their own modules, in ms
+    totals = {}
+    for line in importtime_output.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        package = name.strip().split(".")[0]
+        totals[package] = totals.get(package, 0) + int(self_us) / 1000
+    return sorted(totals.items(), key=lambda item: item[1], reverse=True)[:count]
+
+
+def main(runs=5):
+    first = cold_start(importtime=True)
+    print("slowest imports (ms, own modules only):")
+    for package, ms in first["imports"]:
+        print(f"  {package:<30} {ms:>8.1f}")
+
+    samples = [cold_start() for _ in range(runs)]
+    best = min(samples, key=lambda sample: sample["total_ms"])
+    print(f"status of GET {FIRST_REQUEST}: {best['status']}")
+    print(f"app import     {best['load_ms']:>8.1f} ms")
+    print(f"first request  {best['request_ms']:>8.1f} ms")
+    print(f"total          {best['total_ms']:>8.1f} ms (budget {BUDGET_MS} ms)")
+    if best["heavy"]:
+        print(f"imported but not needed: {', '.join(best['heavy'])}")
+    if best["total_ms"] > BUDGET_MS or best["heavy"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:2]))
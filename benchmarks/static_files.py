@@ -0,0 +1,63 @@
+"""
+Static asset serving: django.views.static.serve against the whitenoise
+pipeline over collectstatic output.
+
+    python -m benchmarks.static_files [asset] [iterations]
+"""
+import sys
+import tempfile
+
+from .common import consume, measure, setup_django
+
+
+def main(asset="css/dashboard.css", iterations=2000):
+    setup_django()
+    from django.contrib.staticfiles.storage import staticfiles_storage
+    from django.core.management import call_command
+    from django.test import RequestFactory, override_settings
+    from django.views.static import serve
+    from whitenoise.middleware import WhiteNoiseMiddleware
+
+    with tempfile.TemporaryDirectory() as static_root, override_settings(
+        STATIC_ROOT=static_root
+    ):
+        call_command("collectstatic", "--noinput", verbosity=0)
+        hashed = staticfiles_storage.url(asset)
+        factory = RequestFactory()
+
+        def django_serve():
+            request = factory.get(f"/static/{asset}")
+            consume(serve(request, asset, document_root=static_root))
+
+        whitenoise = WhiteNoiseMiddleware(get_response=None)
+
+        def whitenoise_serve(**headers):
+            response = whitenoise.serve(
+                whitenoise.files[hashed], factory.get(hashed, **headers)
+            )
+            consume(response)
+
+        print(f"asset: {asset} -> {hashed}")
+        for encoding in ("identity", "gzip", "br"):
+            response = whitenoise.serve(
+                whitenoise.files[hashed],
+                factory.get(hashed, HTTP_ACCEPT_ENCODING=encoding),
+            )
+            print(f"  {encoding:<9} {response['Content-Length']:>8} bytes")
+            response.close()
+        measure("django.views.static.serve", django_serve, iterations)
+        measure("whitenoise (identity)", whitenoise_serve, iterations)
+        measure(
+            "whitenoise (gzip)",
+            lambda: whitenoise_serve(HTTP_ACCEPT_ENCODING="gzip"),
+            iterations,
+        )
+        measure(
+            "whitenoise (brotli)",
+            lambda: whitenoise_serve(HTTP_ACCEPT_ENCODING="br, gzip"),
+            iterations,
+        )
+
+
+if __name__ == "__main__":
+    main(*sys.argv[1:2], *map(int, sys.argv[2:3]))
@@ -0,0 +1,127 @@
+import os
+import sys
+import threading
+import tracemalloc
+
+from django.conf import settings
+
+try:
+    import resource
+except ImportError:  # not available on windows
+    resource = None
+
+# state of the tracemalloc session of this worker process
+_lock = threading.Lock()
+_baseline = None
+
+# view name -> memory stats, filled by MemoryTrackingMiddleware
+view_stats = {}
+
+
+def current_rss():
+    # resident set size in bytes, None when it can't be read
+    try:
+        with open("/proc/self/statm") as fh:
+            return int(fh.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return peak_rss()
+
+
+def peak_rss():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # linux reports kilobytes, macOS bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def is_tracing():
+    return tracemalloc.is_tracing()
+
+
+def _snapshot():
+    return tracemalloc.take_snapshot().filter_traces(
+        [tracemalloc.Filter(False, tracemalloc.__file__)]
+    )
+
+
+def start(frames=25):
+    global _baseline
+    with _lock:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+        _baseline = _snapshot()
+
+
+def stop():
+    global _baseline
+    with _lock:
+        _baseline = None
+        tracemalloc.stop()
+
+
+def _project_module(filename):
+    base_dir = str(settings.BASE_DIR)
+    if not filename.startswith(base_dir) or "site-packages" in filename:
+        return None
+    relative = os.path.relpath(filename, base_dir)
+    return os.path.splitext(relative)[0].replace(os.sep, ".")
+
+
+def _owner(traceback):
+    # innermost frame that belongs to our own code
+    for frame in reversed(traceback):
+        module = _project_module(frame.filename)
+        if module is not None:
+            return f"{module}:{frame.lineno}"
+    return "<other>"
+
+
+def diff(limit=20, reset=False):
+    """
+    Compare the live heap with the baseline snapshot, attributing each
+    allocation to the closest frame in our own modules.
+    """
+    global _baseline
+    with _lock:
+        if _baseline is None:
+            return None
+        snapshot = _snapshot()
+        stats = snapshot.compare_to(_baseline, "traceback")
+        if reset:
+            _baseline = snapshot
+
+    sites = {}
+    for stat in stats:
+        if stat.size_diff == 0 and stat.count_diff == 0:
+            continue
+        site = sites.setdefault(
+            _owner(stat.traceback), {"size_diff": 0, "count_diff": 0, "size": 0}
+        )
+        site["size_diff"] += stat.size_diff
+        site["count_diff"] += stat.count_diff
+        site["size"] += stat.size
+
+    top = sorted(sites.items(), key=lambda item: abs(item[1]["size_diff"]), reverse=True)
+    current, peak = tracemalloc.get_traced_memory()
+    return {
+        "traced_current": current,
+        "traced_peak": peak,
+        "top": [dict(site=site, **values) for site, values in top[:limit]],
+    }
+
+
+def record_view(view_name, rss_before, rss_after, peak_before, peak_after):
+    with _lock:
+        stats = view_stats.setdefault(
+            view_name,
+            {"requests": 0, "max_rss_growth": 0, "max_peak_growth": 0, "peak_rss": 0},
+        )
+        stats["requests"] += 1
+        if rss_before is not None and rss_after is not None:
+            stats["max_rss_growth"] = max(stats["max_rss_growth"], rss_after - rss_before)
+        if peak_before is not None and peak_after is not None:
+            stats["max_peak_growth"] = max(
+                stats["max_peak_growth"], peak_after - peak_before
+            )
+            stats["peak_rss"] = max(stats["peak_rss"], peak_after)
@@ -0,0 +1,178 @@
+import cProfile
+import os
+import random
+import re
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core import signing
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+
+from . import memory
+
+PROFILE_HEADER = "HTTP_X_QRGEN_PROFILE"
+PROFILE_QUERY_PARAM = "_profile"
+PROFILE_SALT = "diagnostics.profile"
+
+# literals are stripped so that the same query run with different
+# parameters (the classic N+1 pattern) collapses to a single shape
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+\b")
+
+
+def profile_token():
+    # value to send in the X-QRGen-Profile header to profile a request,
+    # valid for PROFILING_TOKEN_MAX_AGE seconds
+    return signing.TimestampSigner(salt=PROFILE_SALT).sign("profile")
+
+
+def _has_valid_token(request):
+    token = request.META.get(PROFILE_HEADER)
+    if not token:
+        return False
+    max_age = getattr(settings, "PROFILING_TOKEN_MAX_AGE", 60 * 60)
+    try:
+        signer = signing.TimestampSigner(salt=PROFILE_SALT)
+        return signer.unsign(token, max_age=max_age) == "profile"
+    except (signing.BadSignature, ValueError):
+        # expired, or signed without a timestamp
+        return False
+
+
+class QueryRecorder:
+    """Database execute wrapper counting and timing every query."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.shapes = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+            self.shapes[_LITERALS.sub("?", sql)] += 1
+
+    @property
+    def duplicates(self):
+        return sum(n - 1 for n in self.shapes.values() if n > 1)
+
+    def most_repeated(self):
+        if not self.shapes:
+            return None
+        shape, count = self.shapes.most_common(1)[0]
+        return (shape, count) if count > 1 else None
+
+
+class ProfilingMiddleware:
+    """
+    Opt-in per-request profiling.
+
+    A request is profiled when it carries a valid signed X-QRGen-Profile
+    header (see profile_token()) or when a staff user adds ?_profile=1.
+    The summary is returned in X-Profile-* response headers and a sampled
+    share of profiled requests also get a cProfile dump written to a
+    bounded ring of files under PROFILING_DIR.
+
+    Unless PROFILING_ENABLED is set the middleware removes itself from
+    the stack at startup.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, "PROFILING_ENABLED", False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, "PROFILING_SAMPLE_RATE", 0.1)
+        self.profile_dir = getattr(
+            settings, "PROFILING_DIR", os.path.join(settings.BASE_DIR, "temp/profiles")
+        )
+        self.ring_size = getattr(settings, "PROFILING_RING_SIZE", 50)
+
+    def __call__(self, request):
+        if not self.should_profile(request):
+            return self.get_response(request)
+
+        recorder = QueryRecorder()
+        profiler = cProfile.Profile() if random.random() < self.sample_rate else None
+
+        start = time.perf_counter()
+        with connection.execute_wrapper(recorder):
+            if profiler is not None:
+                profiler.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                if profiler is not None:
+                    profiler.disable()
+        elapsed = time.perf_counter() - start
+
+        response["X-Profile-Time-Ms"] = f"{elapsed * 1000:.1f}"
+        response["X-Profile-Queries"] = str(recorder.count)
+        response["X-Profile-Query-Time-Ms"] = f"{recorder.duration * 1000:.1f}"
+        response["X-Profile-Duplicate-Queries"] = str(recorder.duplicates)
+        repeated = recorder.most_repeated()
+        if repeated is not None:
+            shape, count = repeated
+            response["X-Profile-Most-Repeated"] = f"{count}x {shape[:200]}"
+        if profiler is not None:
+            response["X-Profile-Dump"] = self.dump(profiler, request)
+        return response
+
+    def should_profile(self, request):
+        if PROFILE_HEADER in request.META:
+            return _has_valid_token(request)
+        if request.GET.get(PROFILE_QUERY_PARAM) == "1":
+            user = getattr(request, "user", None)
+            return user is not None and user.is_staff
+        return False
+
+    def dump(self, profiler, request):
+        os.makedirs(self.profile_dir, exist_ok=True)
+        slug = re.sub(r"[^A-Za-z0-9]+", "-", request.path).strip("-") or "root"
+        name = f"{time.time_ns()}-{os.getpid()}-{slug[:60]}.prof"
+        profiler.dump_stats(os.path.join(self.profile_dir, name))
+        self.prune()
+        return name
+
+    def prune(self):
+        # keep only the newest ring_size dumps
+        dumps = sorted(
+            entry for entry in os.listdir(self.profile_dir) if entry.endswith(".prof")
+        )
+        for old in dumps[: -self.ring_size]:
+            try:
+                os.remove(os.path.join(self.profile_dir, old))
+            except FileNotFoundError:
+                # another worker pruned it first
+                pass
+
+
+class MemoryTrackingMiddleware:
+    """
+    Records RSS growth and peak RSS per resolved view in this worker, see
+    diagnostics.memory.view_stats. Removed from the stack unless
+    MEMORY_TRACKING_ENABLED is set.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, "MEMORY_TRACKING_ENABLED", False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        rss_before, peak_before = memory.current_rss(), memory.peak_rss()
+        response = self.get_response(request)
+        match = getattr(request, "resolver_match", None)
+        if match is not None:
+            memory.record_view(
+                match.view_name,
+                rss_before,
+                memory.current_rss(),
+                peak_before,
+                memory.peak_rss(),
+            )
+        return response
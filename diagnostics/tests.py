@@ -0,0 +1,271 @@
+import json
+import logging
+import os
+import queue
+import shutil
+import socketserver
+import tempfile
+import threading
+import time
+import tracemalloc
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core import signing
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, Client, override_settings
+from django.urls import reverse
+
+from diagnostics import memory
+from QRGenProject import logs
+from diagnostics.middleware import PROFILE_SALT, QueryRecorder, profile_token
+
+PROFILE_DIR = os.path.join(tempfile.gettempdir(), "qrgen-test-profiles")
+
+
+@override_settings(
+    PROFILING_ENABLED=True,
+    PROFILING_SAMPLE_RATE=1.0,
+    PROFILING_DIR=PROFILE_DIR,
+    PROFILING_RING_SIZE=2,
+)
+class ProfilingMiddlewareTestCase(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.dashboard_url = reverse("qrgen:dashboard")
+        self.user = User.objects.create_user(username="testuser", password="testpass")
+
+    def tearDown(self):
+        shutil.rmtree(PROFILE_DIR, ignore_errors=True)
+
+    def test_not_profiled_without_opt_in(self):
+        response = self.client.get("/")
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("X-Profile-Queries", response)
+
+    def test_invalid_token_is_ignored(self):
+        response = self.client.get("/", HTTP_X_QRGEN_PROFILE="profile:forged")
+        self.assertNotIn("X-Profile-Queries", response)
+
+    def test_signed_header_profiles_request(self):
+        self.client.login(username="testuser", password="testpass")
+        response = self.client.get(
+            self.dashboard_url, HTTP_X_QRGEN_PROFILE=profile_token()
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(int(response["X-Profile-Queries"]), 0)
+        self.assertIn("X-Profile-Query-Time-Ms", response)
+        self.assertIn("X-Profile-Duplicate-Queries", response)
+        dump = os.path.join(PROFILE_DIR, response["X-Profile-Dump"])
+        self.assertTrue(os.path.exists(dump))
+
+    def test_token_expires(self):
+        token = profile_token()
+        with override_settings(PROFILING_TOKEN_MAX_AGE=60):
+            later = time.time() + 61
+            with mock.patch("django.core.signing.time.time", return_value=later):
+                response = self.client.get("/", HTTP_X_QRGEN_PROFILE=token)
+        self.assertNotIn("X-Profile-Queries", response)
+        # tokens of the old format, without a timestamp, aren't accepted either
+        response = self.client.get(
+            "/", HTTP_X_QRGEN_PROFILE=signing.Signer(salt=PROFILE_SALT).sign("profile")
+        )
+        self.assertNotIn("X-Profile-Queries", response)
+
+    def test_staff_flag_profiles_request(self):
+        self.client.login(username="testuser", password="testpass")
+        response = self.client.get(self.dashboard_url, {"_profile": "1"})
+        self.assertNotIn("X-Profile-Queries", response)
+
+        self.user.is_staff = True
+        self.user.save()
+        response = self.client.get(self.dashboard_url, {"_profile": "1"})
+        self.assertIn("X-Profile-Queries", response)
+
+    def test_profile_ring_is_bounded(self):
+        for _ in range(4):
+            self.client.get("/", HTTP_X_QRGEN_PROFILE=profile_token())
+        dumps = [name for name in os.listdir(PROFILE_DIR) if name.endswith(".prof")]
+        self.assertEqual(len(dumps), 2)
+
+
+class QueryRecorderTestCase(TestCase):
+    def test_repeated_queries_are_reported_as_duplicates(self):
+        for i in range(3):
+            User.objects.create_user(username=f"user{i}", password="testpass")
+        recorder = QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            for user in User.objects.all():
+                User.objects.filter(id=user.id).exists()
+        self.assertEqual(recorder.count, 4)
+        self.assertEqual(recorder.duplicates, 2)
+        shape, count = recorder.most_repeated()
+        self.assertEqual(count, 3)
+
+
+@override_settings(MEMORY_TRACKING_ENABLED=True)
+class MemoryDiagnosticsTestCase(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username="testuser", password="testpass")
+        self.client.login(username="testuser", password="testpass")
+
+    def tearDown(self):
+        if memory.is_tracing():
+            memory.stop()
+
+    def make_staff(self):
+        self.user.is_staff = True
+        self.user.save()
+
+    def test_endpoints_are_staff_only(self):
+        response = self.client.get(reverse("diagnostics:memory"))
+        self.assertEqual(response.status_code, 302)
+        response = self.client.post(reverse("diagnostics:memory_start"))
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(memory.is_tracing())
+
+    def test_diff_before_start(self):
+        self.make_staff()
+        response = self.client.get(reverse("diagnostics:memory_diff"))
+        self.assertEqual(response.status_code, 409)
+
+    def test_diff_reports_our_allocation_sites(self):
+        self.make_staff()
+        response = self.client.post(reverse("diagnostics:memory_start"))
+        self.assertTrue(response.json()["tracing"])
+
+        retained = [bytearray(1024) for _ in range(200)]
+        response = self.client.get(reverse("diagnostics:memory_diff"), {"limit": 50})
+        self.assertEqual(response.status_code, 200)
+        sites = [entry["site"] for entry in response.json()["top"]]
+        self.assertTrue(any(site.startswith("diagnostics.tests:") for site in sites))
+        del retained
+
+        response = self.client.post(reverse("diagnostics:memory_stop"))
+        self.assertFalse(memory.is_tracing())
+
+    def test_parameters_are_checked(self):
+        self.make_staff()
+        response = self.client.post(reverse("diagnostics:memory_start"), {"frames": "x"})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(memory.is_tracing())
+        # out of tracemalloc's range, clamped
+        response = self.client.post(
+            reverse("diagnostics:memory_start"), {"frames": "100000"}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(tracemalloc.get_traceback_limit(), 100)
+        response = self.client.get(reverse("diagnostics:memory_diff"), {"limit": "all"})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(reverse("diagnostics:memory_diff"), {"limit": "-5"})
+        self.assertEqual(response.status_code, 200)
+
+    def test_rss_is_tracked_per_view(self):
+        self.make_staff()
+        self.client.get("/")
+        response = self.client.get(reverse("diagnostics:memory"))
+        views = response.json()["views"]
+        self.assertIn("home:home-page", views)
+        self.assertGreaterEqual(views["home:home-page"]["requests"], 1)
+
+
+class StartupBudgetTestCase(SimpleTestCase):
+    def test_cold_start_within_budget(self):
+        from benchmarks.startup import BUDGET_MS, cold_start
+
+        result = cold_start()
+        self.assertTrue(result["status"].startswith("302"), result["status"])
+        self.assertEqual(result["heavy"], [])
+        # timing a cold start depends on the machine, only checked when asked for
+        if os.getenv("STARTUP_BUDGET_TEST") == "True":
+            self.assertLess(result["total_ms"], BUDGET_MS)
+
+
+class WarmupTestCase(TestCase):
+    def test_warmup_runs_every_step(self):
+        from QRGenProject.warmup import STEPS, warmup
+
+        timings = warmup()
+        self.assertEqual(list(timings), [name for name, _ in STEPS])
+        self.assertNotIn(None, timings.values())
+        response = Client().get("/metrics")
+        self.assertContains(response, 'qrgen_warmup_seconds{step="templates"}')
+        self.assertContains(response, 'qrgen_warmup_seconds{step="total"}')
+
+    def test_storage_step_pings_cloudinary(self):
+        import cloudinary
+        import cloudinary.api
+        import cloudinary_storage.storage  # noqa: F401
+        from QRGenProject.warmup import open_storages
+
+        with mock.patch.object(cloudinary.config(), "api_key", "key"), mock.patch.object(
+            cloudinary.api, "ping"
+        ) as ping:
+            open_storages()
+        ping.assert_called_once_with(timeout=5)
+
+
+class LoggingPipelineTestCase(SimpleTestCase):
+    def setUp(self):
+        self.logger = logging.getLogger("qrgen.tests.logs")
+        self.logger.propagate = False
+        self.logger.setLevel(logging.INFO)
+        self.addCleanup(setattr, self.logger, "propagate", True)
+        self.addCleanup(self.logger.handlers.clear)
+
+    def test_json_lines_carry_extra_fields(self):
+        record = logging.makeLogRecord(
+            {"name": "handlescan.scans", "msg": "scan %s", "args": (7,), "code": 7}
+        )
+        entry = json.loads(logs.JsonFormatter().format(record))
+        self.assertEqual(entry["message"], "scan 7")
+        self.assertEqual(entry["logger"], "handlescan.scans")
+        self.assertEqual(entry["code"], 7)
+
+    def test_sampling_keeps_warnings(self):
+        sampling = logs.SamplingFilter({"handlescan.scans": 0.0})
+        scan = logging.makeLogRecord({"name": "handlescan.scans.web", "levelno": 20})
+        warning = logging.makeLogRecord({"name": "handlescan.scans", "levelno": 30})
+        other = logging.makeLogRecord({"name": "qrgen", "levelno": 20})
+        self.assertFalse(sampling.filter(scan))
+        self.assertTrue(sampling.filter(warning))
+        self.assertTrue(sampling.filter(other))
+
+    def test_full_queue_drops_records(self):
+        handler = logs.QueueingHandler(queue.Queue(1))
+        self.logger.addHandler(handler)
+        self.logger.info("kept")
+        self.logger.info("dropped")
+        self.assertEqual(handler.queue.qsize(), 1)
+        self.assertEqual(handler.dropped, 1)
+
+    def test_logstash_sink(self):
+        from logstash import TCPLogstashHandler
+
+        received = []
+        done = threading.Event()
+
+        class Collector(socketserver.StreamRequestHandler):
+            def handle(self):
+                received.extend(self.rfile.readlines())
+                done.set()
+
+        server = socketserver.TCPServer(("127.0.0.1", 0), Collector)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(server.shutdown)
+
+        sink = TCPLogstashHandler("127.0.0.1", server.server_address[1], version=1)
+        self.logger.addHandler(sink)
+        handler = logs.queue_handlers(self.logger)
+        self.logger.info("scan", extra={"code": 7})
+        logs.stop(handler)
+        sink.close()
+        self.assertTrue(done.wait(5))
+
+        event = json.loads(received[0])
+        self.assertEqual(event["message"], "scan")
+        self.assertEqual(event["code"], 7)
+        self.assertEqual(event["logger_name"], "qrgen.tests.logs")
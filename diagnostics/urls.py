@@ -0,0 +1,11 @@
+from django.urls import path
+from .views import memory_status, memory_start, memory_stop, memory_diff
+
+app_name = 'diagnostics'
+
+urlpatterns = [
+    path('memory/', memory_status, name='memory'),
+    path('memory/start/', memory_start, name='memory_start'),
+    path('memory/stop/', memory_stop, name='memory_stop'),
+    path('memory/diff/', memory_diff, name='memory_diff'),
+]
@@ -0,0 +1,72 @@
+import os
+
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import JsonResponse
+from django.views.decorators.http import require_POST
+
+from . import memory
+
+# tracemalloc state lives in the worker that served the request, so every
+# response carries the pid to tell workers apart
+
+MAX_FRAMES = 100
+MAX_LIMIT = 500
+
+
+def _bounded_int(value, default, highest):
+    # value as an int clamped to 1..highest, None when it isn't a number
+    if value is None:
+        return default
+    try:
+        return min(max(int(value), 1), highest)
+    except ValueError:
+        return None
+
+
+def _bad_parameter(name):
+    return JsonResponse(
+        {"pid": os.getpid(), "error": f"{name} must be a number"}, status=400
+    )
+
+
+@staff_member_required
+def memory_status(request):
+    return JsonResponse(
+        {
+            "pid": os.getpid(),
+            "rss": memory.current_rss(),
+            "peak_rss": memory.peak_rss(),
+            "tracing": memory.is_tracing(),
+            "views": memory.view_stats,
+        }
+    )
+
+
+@staff_member_required
+@require_POST
+def memory_start(request):
+    frames = _bounded_int(request.POST.get("frames"), 25, MAX_FRAMES)
+    if frames is None:
+        return _bad_parameter("frames")
+    memory.start(frames)
+    return JsonResponse({"pid": os.getpid(), "tracing": True})
+
+
+@staff_member_required
+@require_POST
+def memory_stop(request):
+    memory.stop()
+    return JsonResponse({"pid": os.getpid(), "tracing": False})
+
+
+@staff_member_required
+def memory_diff(request):
+    limit = _bounded_int(request.GET.get("limit"), 20, MAX_LIMIT)
+    if limit is None:
+        return _bad_parameter("limit")
+    report = memory.diff(limit=limit, reset=request.GET.get("reset") == "1")
+    if report is None:
+        return JsonResponse(
+            {"pid": os.getpid(), "error": "tracing is not started"}, status=409
+        )
+    return JsonResponse({"pid": os.getpid(), **report})
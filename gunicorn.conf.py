@@ -0,0 +1,50 @@
+"""
+Gunicorn settings, read automatically from the working directory.
+
+The app is imported once in the master (preload_app) and the workers are
+forked from it, so a cold machine imports Django and the project once and
+the workers share those pages copy-on-write. The garbage collector is off
+while the app loads and the preloaded objects are then frozen, so no
+collection writes to the pages they live in and copies them into every
+worker. Each worker then warms up
+(QRGenProject.warmup) before accepting its first request.
+"""
+import gc
+import os
+
+bind = f":{os.getenv('PORT', '8000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+preload_app = True
+accesslog = "-"
+errorlog = "-"
+
+# no collections in the master while the app loads, they would leave holes
+# in pages the workers are about to share
+gc.disable()
+
+
+def when_ready(server):
+    # runs in the master once the app is loaded, before the first fork
+    from django.db import connections
+    from django.urls import get_resolver
+
+    # import the views now rather than on each worker's first request
+    get_resolver().url_patterns
+    # never share a database connection between processes
+    connections.close_all()
+    # move everything loaded so far out of the collector's generations,
+    # collections in the master only look at what it allocates from now on
+    gc.freeze()
+    gc.enable()
+
+
+def post_fork(server, worker):
+    # the frozen objects stay shared, collections only look at new ones
+    gc.enable()
+
+
+def post_worker_init(worker):
+    # the worker only starts accepting connections once this returns
+    from QRGenProject.warmup import warmup
+
+    warmup()
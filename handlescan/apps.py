@@ -1,6 +1,13 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_delete, post_save
 
 
 class HandlescanConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'handlescan'
+
+    def ready(self):
+        from . import lookup
+
+        post_save.connect(lookup.code_changed, sender="qrgen.QrCode")
+        post_delete.connect(lookup.code_changed, sender="qrgen.QrCode")
@@ -0,0 +1,57 @@
+"""
+Scans skip the full middleware stack.
+
+A scan reads no session, user, CSRF token or message, yet through the
+project's application it pays for all of them. ScanDispatcher sends the
+scan and download URLs to a second Django handler built from
+SCAN_MIDDLEWARE (metrics and the security headers), everything else to
+the regular application. URL resolution, the views and their responses
+are the same on both paths.
+"""
+import re
+
+from django.conf import settings
+from django.core.handlers.exception import convert_exception_to_response
+from django.core.handlers.wsgi import WSGIHandler
+from django.utils.module_loading import import_string
+
+# the exact URLs of handlescan.urls, with or without the trailing slash
+# (codes encode them without), anything else goes through the full stack
+SCAN_PATH = re.compile(r"^/qrcode/(?:dynamic|download)/\d+/?$")
+
+
+class ScanHandler(WSGIHandler):
+    """WSGIHandler running settings.SCAN_MIDDLEWARE instead of MIDDLEWARE."""
+
+    def load_middleware(self, is_async=False):
+        # BaseHandler.load_middleware for synchronous middleware only
+        self._view_middleware = []
+        self._template_response_middleware = []
+        self._exception_middleware = []
+
+        handler = convert_exception_to_response(self._get_response)
+        for middleware_path in reversed(settings.SCAN_MIDDLEWARE):
+            instance = import_string(middleware_path)(handler)
+            if hasattr(instance, "process_view"):
+                self._view_middleware.insert(0, instance.process_view)
+            if hasattr(instance, "process_template_response"):
+                self._template_response_middleware.append(
+                    instance.process_template_response
+                )
+            if hasattr(instance, "process_exception"):
+                self._exception_middleware.append(instance.process_exception)
+            handler = convert_exception_to_response(instance)
+        self._middleware_chain = handler
+
+
+class ScanDispatcher:
+    """WSGI application sending scans to ScanHandler, the rest to application."""
+
+    def __init__(self, application):
+        self.application = application
+        self.scan_application = ScanHandler()
+
+    def __call__(self, environ, start_response):
+        if SCAN_PATH.match(environ.get("PATH_INFO", "")):
+            return self.scan_application(environ, start_response)
+        return self.application(environ, start_response)
@@ -0,0 +1,123 @@
+import hashlib
+import re
+import threading
+import time
+
+from django.conf import settings
+
+# link previews, crawlers, uptime checkers and http libraries, by the
+# tokens they announce themselves with; one compiled pattern so a user agent
+# is classified with a single search. Generic words (scanner, preview,
+# okhttp...) also show up in the user agents of QR scanner apps and their
+# web views, whose scans are real
+BOT_USER_AGENT = re.compile(
+    r"\(compatible; [^)]*(?:bot|crawler|spider)|"
+    r"googlebot|bingbot|yandexbot|baiduspider|duckduckbot|applebot|slurp|"
+    r"ahrefsbot|semrushbot|mj12bot|petalbot|dotbot|bytespider|gptbot|"
+    r"facebookexternalhit|facebookcatalog|whatsapp/|telegrambot|twitterbot|"
+    r"linkedinbot|slackbot|slack-imgproxy|discordbot|skypeuripreview|"
+    r"embedly|vkshare|pinterestbot|bitlybot|quora link preview|"
+    r"^curl/|^wget/|^httpie/|^python-requests/|^python-urllib/|^aiohttp/|"
+    r"^go-http-client/|^libwww-perl/|headlesschrome|phantomjs|"
+    r"chrome-lighthouse|pingdom|uptimerobot",
+    re.IGNORECASE,
+)
+
+
+def is_bot(user_agent):
+    # crawlers announce themselves, a missing user agent proves nothing
+    return BOT_USER_AGENT.search(user_agent) is not None
+
+
+class RecentScans:
+    """
+    Remembers which (client, code) pairs scanned recently in a fixed amount
+    of memory: two bloom filters of `bits` bits, the current one is retired
+    every `window` seconds, so a pair is remembered for one to two windows.
+    A false positive only means a real scan isn't counted.
+    """
+
+    def __init__(self, window=30, bits=1 << 20, hashes=4):
+        self.window = window
+        self.bits = bits
+        self.hashes = hashes
+        self.lock = threading.Lock()
+        self.current = bytearray(bits // 8)
+        self.previous = bytearray(bits // 8)
+        self.rotated = time.monotonic()
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode(), digest_size=4 * self.hashes).digest()
+        for i in range(self.hashes):
+            yield int.from_bytes(digest[4 * i : 4 * i + 4], "little") % self.bits
+
+    def _rotate(self, now):
+        elapsed = now - self.rotated
+        if elapsed < self.window:
+            return
+        if elapsed < 2 * self.window:
+            self.previous = self.current
+        else:
+            # idle for more than two windows, nothing recent is left
+            self.previous = bytearray(self.bits // 8)
+        self.current = bytearray(self.bits // 8)
+        self.rotated = now
+
+    def clear(self):
+        with self.lock:
+            self.current = bytearray(self.bits // 8)
+            self.previous = bytearray(self.bits // 8)
+            self.rotated = time.monotonic()
+
+    def seen(self, key):
+        """Whether key was seen within the window, recording it either way."""
+        positions = list(self._positions(key))
+        with self.lock:
+            self._rotate(time.monotonic())
+            found = any(
+                all(bits[p >> 3] & (1 << (p & 7)) for p in positions)
+                for bits in (self.current, self.previous)
+            )
+            for p in positions:
+                self.current[p >> 3] |= 1 << (p & 7)
+        return found
+
+
+recent_scans = RecentScans(
+    window=getattr(settings, "SCAN_DEDUPE_WINDOW", 30),
+    bits=getattr(settings, "SCAN_DEDUPE_BITS", 1 << 20),
+)
+
+
+def client_ip(request):
+    """
+    Address of the client, from the TRUSTED_PROXY_HEADER set by the proxy in
+    front of the app (Fly-Client-IP on fly.io, or the first X-Forwarded-For
+    hop) when there is one, REMOTE_ADDR otherwise. Clients can send these
+    headers too, so they're only read when a proxy is known to set them.
+    """
+    header = getattr(settings, "TRUSTED_PROXY_HEADER", "")
+    if header:
+        value = request.headers.get(header, "")
+        if header.lower() == "x-forwarded-for":
+            value = value.split(",")[0]
+        if value.strip():
+            return value.strip()
+    return request.META.get("REMOTE_ADDR", "")
+
+
+def is_counted(request, code_id):
+    """
+    Whether a hit on a code is a scan worth counting: not a preview or
+    prefetch, not a bot, not a repeat of the same client's last scan.
+    """
+    if request.method != "GET":
+        return False
+    purpose = request.headers.get("Sec-Purpose") or request.headers.get("Purpose", "")
+    if "prefetch" in purpose.lower():
+        return False
+    user_agent = request.headers.get("User-Agent", "")
+    if is_bot(user_agent):
+        return False
+    client = client_ip(request)
+    return not recent_scans.seen(f"{code_id}|{client}|{user_agent}")
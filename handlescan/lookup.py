@@ -0,0 +1,72 @@
+import threading
+import time
+from collections import namedtuple
+
+from django.conf import settings
+
+from qrgen.models import QrCode
+
+# what a scan needs to answer, nothing else is read from the row
+Target = namedtuple(
+    "Target", "id is_dynamic is_active action_type input_url file_id"
+)
+FIELDS = Target._fields
+
+# code id -> (expires, Target), kept per process so that a code scanned
+# again doesn't query the database. Saving or deleting a code drops it here,
+# the other workers keep the old target for at most SCAN_LOOKUP_CACHE_TTL,
+# which is below the max-age scans of dynamic codes are served with
+_cache = {}
+_lock = threading.Lock()
+
+MAX_CACHED_TARGETS = 10000
+
+
+def _store(targets):
+    now = time.monotonic()
+    expires = now + getattr(settings, "SCAN_LOOKUP_CACHE_TTL", 30)
+    with _lock:
+        if len(_cache) + len(targets) > MAX_CACHED_TARGETS:
+            expired = [key for key, (until, _) in _cache.items() if until <= now]
+            for key in expired or list(_cache)[: MAX_CACHED_TARGETS // 2]:
+                del _cache[key]
+        for target in targets[:MAX_CACHED_TARGETS]:
+            _cache[target.id] = (expires, target)
+
+
+def get_target(code_id):
+    """The Target of a code, raises QrCode.DoesNotExist like objects.get()."""
+    with _lock:
+        cached = _cache.get(code_id)
+    if cached is not None and cached[0] > time.monotonic():
+        return cached[1]
+
+    values = QrCode.objects.filter(id=code_id).values_list(*FIELDS).first()
+    if values is None:
+        raise QrCode.DoesNotExist("QrCode matching query does not exist.")
+    target = Target(*values)
+    _store([target])
+    return target
+
+
+def prime(count):
+    """Caches the targets of the `count` most scanned codes, returns how many."""
+    codes = QrCode.objects.filter(scan_count__isnull=False).order_by("-scan_count")
+    targets = [Target(*values) for values in codes.values_list(*FIELDS)[:count]]
+    _store(targets)
+    return len(targets)
+
+
+def forget(code_ids=None):
+    # drop codes (or all of them) from this process' cache
+    with _lock:
+        if code_ids is None:
+            _cache.clear()
+        else:
+            for code_id in code_ids:
+                _cache.pop(code_id, None)
+
+
+def code_changed(sender, instance, **kwargs):
+    # post_save / post_delete receiver, connected in HandlescanConfig.ready
+    forget([instance.id])
@@ -5,11 +5,21 @@ from django.contrib.auth.models import User
 from django.core.files.uploadedfile import SimpleUploadedFile
 from qrgen.models import QrCode, File, QrType
 from qrgen.views import create_or_get_types
+from django.core.signals import request_started
+from django.db import close_old_connections
+from django.test import RequestFactory, override_settings
+from handlescan import lookup
+from handlescan.fastpath import ScanDispatcher
+from handlescan.filters import RecentScans, client_ip, is_bot, recent_scans
+from unittest import mock
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 
 
 class QrCodeViewsTestCase(TestCase):
     def setUp(self):
         self.client = Client()
+        recent_scans.clear()
         self.user = User.objects.create_user(username="testuser", password="testpass")
         # Create QrType objects if they don't exist
         create_or_get_types()
@@ -97,6 +107,8 @@ class QrCodeViewsTestCase(TestCase):
 class QrCodeViewsHttp404TestCase(TestCase):
     def setUp(self):
         self.client = Client()
+        # rolled back codes of earlier tests send no post_delete
+        lookup.forget()
 
     def test_dynamic_code_scan_view_qrcode_not_found(self):
         # Vérifie si la vue de scan dynamique renvoie une erreur QrCode.DoesNotExist pour un code QR non trouvé
@@ -112,3 +124,280 @@ class FileDownloadViewsHttp404TestCase(TestCase):
         # Vérifie si la vue de téléchargement renvoie une erreur File.DoesNotExist pour un fichier non trouvé
         with self.assertRaises(File.DoesNotExist):
             self.client.get(reverse("handlescan:download", args=[1]))
+
+
+class ScanCachingTestCase(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username="testuser", password="testpass")
+        create_or_get_types()
+
+    def create_code(self, type_name):
+        return QrCode.objects.create(
+            user=self.user,
+            action_type="web",
+            input_url="https://example.com",
+            type=QrType.objects.get(name=type_name),
+            is_dynamic=type_name == "dynamic",
+        )
+
+    def test_dynamic_redirect_is_short_lived(self):
+        qrcode = self.create_code("dynamic")
+        response = self.client.get(reverse("handlescan:dynamic", args=[qrcode.id]))
+        self.assertEqual(response.status_code, 302)
+        cache_control = response["Cache-Control"]
+        self.assertIn("max-age=60", cache_control)
+        self.assertIn("stale-while-revalidate=300", cache_control)
+
+    def test_static_code_is_long_lived(self):
+        qrcode = self.create_code("static")
+        response = self.client.get(reverse("handlescan:dynamic", args=[qrcode.id]))
+        self.assertIn("max-age=31536000", response["Cache-Control"])
+        self.assertNotIn("stale-while-revalidate", response["Cache-Control"])
+
+
+class ScanLookupTestCase(TestCase):
+    def setUp(self):
+        recent_scans.clear()
+        lookup.forget()
+        self.user = User.objects.create_user(username="testuser", password="testpass")
+        create_or_get_types()
+        self.qrcode = QrCode.objects.create(
+            user=self.user,
+            action_type="web",
+            input_url="https://example.com",
+            type=QrType.objects.get(name="dynamic"),
+            scan_count=5,
+        )
+        self.url = reverse("handlescan:dynamic", args=[self.qrcode.id])
+
+    def test_repeat_scan_only_counts(self):
+        self.client.get(self.url)
+        recent_scans.clear()
+        # the target comes from the cache, the only query is the count
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url)
+        self.assertEqual(response["Location"], "https://example.com")
+
+    def test_saved_code_is_forgotten(self):
+        self.client.get(self.url)
+        self.qrcode.input_url = "https://example.org"
+        self.qrcode.save()
+        response = self.client.get(self.url)
+        self.assertEqual(response["Location"], "https://example.org")
+
+    def test_deactivated_code_is_gone(self):
+        self.client.get(self.url)
+        self.client.login(username="testuser", password="testpass")
+        self.client.post(
+            reverse("qrgen:bulk"), {"action": "deactivate", "ids": [self.qrcode.id]}
+        )
+        recent_scans.clear()
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 410)
+        self.assertIn("max-age=60", response["Cache-Control"])
+        self.qrcode.refresh_from_db()
+        self.assertEqual(self.qrcode.scan_count, 6)
+
+        self.client.post(
+            reverse("qrgen:bulk"), {"action": "activate", "ids": [self.qrcode.id]}
+        )
+        response = self.client.get(self.url)
+        self.assertEqual(response["Location"], "https://example.com")
+
+    def test_scan_is_logged_not_printed(self):
+        with mock.patch("sys.stdout") as stdout, self.assertLogs(
+            "handlescan.scans", "INFO"
+        ) as captured:
+            self.client.get(self.url)
+        stdout.write.assert_not_called()
+        self.assertEqual(captured.records[0].code, self.qrcode.id)
+        self.assertTrue(captured.records[0].counted)
+
+    def test_prime_loads_most_scanned(self):
+        QrCode.objects.create(
+            user=self.user,
+            action_type="web",
+            input_url="https://example.org",
+            type=QrType.objects.get(name="dynamic"),
+        )
+        lookup.forget()
+        self.assertEqual(lookup.prime(10), 1)
+        with self.assertNumQueries(0):
+            target = lookup.get_target(self.qrcode.id)
+        self.assertEqual(target.input_url, "https://example.com")
+
+
+class ScanFastPathTestCase(TestCase):
+    def setUp(self):
+        recent_scans.clear()
+        self.user = User.objects.create_user(username="testuser", password="testpass")
+        create_or_get_types()
+        self.file = File.objects.create(
+            user=self.user, name="menu", file="user_files/menu.pdf"
+        )
+        self.qrcode = QrCode.objects.create(
+            user=self.user,
+            action_type="web",
+            input_url="https://example.com",
+            type=QrType.objects.get(name="dynamic"),
+            file=self.file,
+        )
+        self.url = reverse("handlescan:dynamic", args=[self.qrcode.id])
+        # paths handed to the full application
+        self.passed = []
+        self.dispatcher = ScanDispatcher(
+            lambda environ, start_response: self.passed.append(environ["PATH_INFO"])
+        )
+
+    def scan(self, path):
+        # straight through the WSGI callable, like the server does. The
+        # connection holds the test transaction, it must not be closed
+        request_started.disconnect(close_old_connections)
+        self.addCleanup(request_started.connect, close_old_connections)
+        environ = RequestFactory().get(path, HTTP_USER_AGENT="Mozilla/5.0").environ
+        started = []
+        body = b"".join(
+            self.dispatcher(environ, lambda status, headers: started.append((status, headers)))
+        )
+        status, headers = started[0]
+        return int(status.split()[0]), dict(headers), body
+
+    def assertSameAsFullStack(self, path):
+        response = self.client.get(path, HTTP_USER_AGENT="Mozilla/5.0")
+        recent_scans.clear()
+        status, headers, body = self.scan(path)
+        self.assertEqual(status, response.status_code)
+        self.assertEqual(headers.get("Location"), response.get("Location"))
+        self.assertEqual(headers.get("Cache-Control"), response.get("Cache-Control"))
+        self.assertEqual(headers.get("X-Frame-Options"), response.get("X-Frame-Options"))
+        self.assertEqual(body, response.content)
+        # nothing session or user related
+        self.assertNotIn("Set-Cookie", headers)
+        self.assertNotIn("Cookie", headers.get("Vary", ""))
+        return status, headers, body
+
+    def test_redirect(self):
+        status, headers, _ = self.assertSameAsFullStack(self.url)
+        self.assertEqual(headers["Location"], "https://example.com")
+        self.assertEqual(self.passed, [])
+
+    def test_email(self):
+        self.qrcode.action_type = "eml"
+        self.qrcode.input_url = "test@example.com"
+        self.qrcode.save()
+        status, _, body = self.assertSameAsFullStack(self.url)
+        self.assertEqual(status, 200)
+        self.assertIn(b"QRGen59 | Email", body)
+
+    def test_upload_redirects_to_download(self):
+        self.qrcode.action_type = "pdf"
+        self.qrcode.save()
+        _, headers, _ = self.assertSameAsFullStack(self.url)
+        self.assertEqual(
+            headers["Location"], reverse("handlescan:download", args=[self.file.id])
+        )
+
+    def test_scan_is_counted(self):
+        self.scan(self.url)
+        self.qrcode.refresh_from_db()
+        self.assertEqual(self.qrcode.scan_count, 1)
+
+    def test_unslashed_url(self):
+        # the URL codes encode, answered directly rather than with a 301
+        status, headers, _ = self.assertSameAsFullStack(self.url.rstrip("/"))
+        self.assertEqual(status, 302)
+        self.assertEqual(headers["Location"], "https://example.com")
+        self.assertEqual(self.passed, [])
+
+    def test_other_paths_use_the_application(self):
+        paths = ["/qrcode/dynamic/1x", "/dashboard/", "/qrcode/dynamic/x/"]
+        for path in paths:
+            self.dispatcher({"PATH_INFO": path}, None)
+        self.assertEqual(self.passed, paths)
+
+
+class ScanFilterTestCase(TestCase):
+    def setUp(self):
+        recent_scans.clear()
+        self.user = User.objects.create_user(username="testuser", password="testpass")
+        create_or_get_types()
+        self.qrcode = QrCode.objects.create(
+            user=self.user,
+            action_type="web",
+            input_url="https://example.com",
+            type=QrType.objects.get(name="dynamic"),
+        )
+        self.url = reverse("handlescan:dynamic", args=[self.qrcode.id])
+
+    def scan_count(self):
+        self.qrcode.refresh_from_db()
+        return self.qrcode.scan_count
+
+    def test_bots_are_redirected_but_not_counted(self):
+        for user_agent in [
+            "facebookexternalhit/1.1 (+http://www.facebook.com/externalhit_uatext.php)",
+            "Mozilla/5.0 (compatible; Googlebot/2.1; +http://www.google.com/bot.html)",
+            "WhatsApp/2.23.20.0",
+            "curl/8.1.2",
+        ]:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(self.url, HTTP_USER_AGENT=user_agent)
+            self.assertEqual(response.status_code, 302)
+            self.assertFalse(
+                [query for query in queries if query["sql"].startswith("UPDATE")]
+            )
+        self.assertIsNone(self.scan_count())
+
+    def test_browsers_are_counted(self):
+        self.assertFalse(
+            is_bot("Mozilla/5.0 (iPhone; CPU iPhone OS 17_0 like Mac OS X) Safari/604.1")
+        )
+        self.client.get(self.url, HTTP_USER_AGENT="Mozilla/5.0 (Linux; Android 14)")
+        self.assertEqual(self.scan_count(), 1)
+
+    def test_repeat_scans_are_counted_once(self):
+        for _ in range(3):
+            self.client.get(self.url, HTTP_USER_AGENT="Mozilla/5.0")
+        self.client.get(self.url, HTTP_USER_AGENT="Mozilla/5.0", REMOTE_ADDR="10.0.0.2")
+        self.assertEqual(self.scan_count(), 2)
+
+    def test_scanner_apps_are_counted(self):
+        for user_agent in [
+            "okhttp/4.9.2",
+            "QR Scanner/3.1 (Android 13)",
+            "Mozilla/5.0 (Linux; Android 9; CUBOT X19) Chrome/120.0 Mobile Safari/537.36",
+        ]:
+            self.assertFalse(is_bot(user_agent), user_agent)
+
+    @override_settings(TRUSTED_PROXY_HEADER="Fly-Client-IP")
+    def test_clients_behind_proxy(self):
+        self.client.get(self.url, HTTP_USER_AGENT="Mozilla/5.0", HTTP_FLY_CLIENT_IP="1.2.3.4")
+        self.client.get(self.url, HTTP_USER_AGENT="Mozilla/5.0", HTTP_FLY_CLIENT_IP="1.2.3.4")
+        self.client.get(self.url, HTTP_USER_AGENT="Mozilla/5.0", HTTP_FLY_CLIENT_IP="5.6.7.8")
+        self.assertEqual(self.scan_count(), 2)
+
+    def test_forwarded_for(self):
+        request = RequestFactory().get(
+            self.url, HTTP_X_FORWARDED_FOR="1.2.3.4, 10.0.0.1"
+        )
+        self.assertEqual(client_ip(request), "127.0.0.1")
+        with self.settings(TRUSTED_PROXY_HEADER="X-Forwarded-For"):
+            self.assertEqual(client_ip(request), "1.2.3.4")
+
+    def test_prefetch_and_head_are_not_counted(self):
+        self.client.get(self.url, HTTP_SEC_PURPOSE="prefetch")
+        self.client.head(self.url)
+        self.assertIsNone(self.scan_count())
+
+    def test_recent_scans_window(self):
+        sketch = RecentScans(window=30, bits=1024)
+        with mock.patch("handlescan.filters.time.monotonic") as monotonic:
+            monotonic.return_value = sketch.rotated
+            self.assertFalse(sketch.seen("a"))
+            self.assertTrue(sketch.seen("a"))
+            # remembered by the previous generation
+            monotonic.return_value += 40
+            self.assertTrue(sketch.seen("b") is False and sketch.seen("a"))
+            monotonic.return_value += 100
+            self.assertFalse(sketch.seen("a"))
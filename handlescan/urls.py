@@ -6,4 +6,7 @@ app_name = 'handlescan'
 urlpatterns = [
     path('dynamic/<int:code_id>/', dynamic_code_scan, name='dynamic'),
     path('download/<int:file_id>/', download, name='download'),
+    # the URLs generated codes encode, answered without APPEND_SLASH's redirect
+    path('dynamic/<int:code_id>', dynamic_code_scan),
+    path('download/<int:file_id>', download),
 ]
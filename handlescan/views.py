@@ -1,46 +1,65 @@
 from django.shortcuts import redirect, render
+import logging
 import os
-from django.http import HttpResponse, Http404, HttpResponseRedirect
+from django.http import HttpResponse, Http404, HttpResponseGone, HttpResponseRedirect
 from django.urls import reverse
+from django.db.models import F
+from django.db.models.functions import Coalesce
 
 from qrgen.models import QrCode, File
+from QRGenProject.caching import cache_dynamic, cache_static
+from QRGenProject.media import local_path, send_file
+from .filters import is_counted
+from .lookup import get_target
 
 # for file download
-import urllib.request
 from urllib.parse import urlparse
 
+# one record per scan, sampled (LOG_SAMPLE_RATES)
+scans = logging.getLogger("handlescan.scans")
+
 
 # Create your views here.
 
 
 def dynamic_code_scan(request, code_id, *args, **kwargs):
-    qrcode = QrCode.objects.get(id=code_id)
-
-    # getting the no of scans
-
-    if qrcode.scan_count is not None:
-        qrcode.scan_count += 1
-    else:
-        qrcode.scan_count = 1
-
-    qrcode.save()
+    qrcode = get_target(code_id)
+    # static codes never change target, dynamic ones may be edited anytime
+    cache_policy = cache_dynamic if qrcode.is_dynamic else cache_static
+    if not qrcode.is_active:
+        # deactivated by its owner, neither redirected nor counted. Short
+        # lived, the code may be activated again
+        return cache_dynamic(HttpResponseGone("This QR code has been deactivated."))
+
+    # getting the no of scans, bots, previews and repeats are redirected
+    # without being counted
+
+    counted = is_counted(request, code_id)
+    if counted:
+        QrCode.objects.filter(id=code_id).update(
+            scan_count=Coalesce(F("scan_count"), 0) + 1
+        )
+    scans.info(
+        "scan",
+        extra={"code": code_id, "action_type": qrcode.action_type, "counted": counted},
+    )
 
     # get the qrcode action_type
     uploads = ["pdf", "biz", "img"]
 
     # if dynamic, these types won't autoredirect, will give us headache instead
     email_txt = ["eml", "txt"]
-    print("type: ", qrcode.type)
     if qrcode.action_type not in uploads and qrcode.action_type not in email_txt:
         # get and redirect to the qrcode action_url
-        print("qrcode.type not in uploads and qrcode.type not in email_txt")
-        return redirect(qrcode.input_url)
+        return cache_policy(redirect(qrcode.input_url))
 
     else:
         if qrcode.action_type == "eml":
             # open the default mail app and compose main to the input email address
 
-            return render(request, "email.html", {"email": qrcode.input_url})
+            return cache_policy(
+                render(request, "email.html", {"email": qrcode.input_url})
+            )
 
         elif qrcode.action_type == "txt":
             # for text input
@@ -50,8 +69,10 @@ def dynamic_code_scan(request, code_id, *args, **kwargs):
 
         else:
             # if it was an uploaded file (if qrcode.type in uploads)
-            return HttpResponseRedirect(
-                reverse("handlescan:download", args=(qrcode.file_id,))
+            return cache_policy(
+                HttpResponseRedirect(
+                    reverse("handlescan:download", args=(qrcode.file_id,))
+                )
             )
 
 
@@ -60,12 +81,20 @@ def download(request, file_id):
 
     if file is not None:
         parse_url = urlparse(file.file.url)
-        path = urllib.request.urlopen(file.file.url)
-        response = HttpResponse(path.read(), content_type="application/adminupload")
+        file_path = local_path(file.file)
+        if file_path is not None:
+            # stored locally, hand the bytes to the server / proxy
+            response = send_file(file_path, content_type="application/adminupload")
+        else:
+            import urllib.request
+
+            path = urllib.request.urlopen(file.file.url)
+            response = HttpResponse(path.read(), content_type="application/adminupload")
         response["Content-Disposition"] = "inline; filename=" + os.path.basename(
             parse_url.path
         )
 
-        return response
+        # a File row is never rewritten, editing a code creates a new one
+        return cache_static(response)
     else:
         return Http404
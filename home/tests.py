@@ -1,4 +1,10 @@
-from django.test import TestCase
+import gzip
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from QRGenProject import caching
 
 class HomePageTest(TestCase):
     def test_view_response(self):
@@ -59,3 +65,63 @@ class NotFoundPageTest(TestCase):
         title = response.context["title"]
         expected_title = "Page not found"
         self.assertEqual(title, expected_title)
+
+class StaticFilesTest(TestCase):
+    def test_static_served_by_whitenoise(self):
+        response = self.client.get('/static/favicon.png')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('max-age', response['Cache-Control'])
+
+@override_settings(PAGE_CACHE_ENABLED=True)
+class PageCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        caching._pages.clear()
+
+    def test_second_visit_is_a_hit(self):
+        response = self.client.get('/learn/')
+        self.assertEqual(response['X-Page-Cache'], 'miss')
+        with self.assertNumQueries(0):
+            response = self.client.get('/learn/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Page-Cache'], 'hit')
+        self.assertEqual(response.templates, [])
+        self.assertIn(b'<html', response.content.lower())
+        self.assertIn('Cookie', response['Vary'])
+        self.assertNotIn('Set-Cookie', str(response.cookies))
+
+    def test_compressed_variants(self):
+        response = self.client.get('/about-us/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn(b'<html', gzip.decompress(response.content).lower())
+        response = self.client.get('/about-us/', HTTP_ACCEPT_ENCODING='gzip, br')
+        self.assertEqual(response['Content-Encoding'], 'br')
+        response = self.client.get('/about-us/', HTTP_ACCEPT_ENCODING='gzip;q=0')
+        self.assertNotIn('Content-Encoding', response)
+
+    def test_etag_not_modified(self):
+        etag = self.client.get('/')['ETag']
+        response = self.client.get('/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_logged_in_users_bypass_the_cache(self):
+        self.client.get('/')
+        User.objects.create_user(username='visitor', password='pass')
+        self.client.login(username='visitor', password='pass')
+        response = self.client.get('/')
+        self.assertNotIn('X-Page-Cache', response)
+        self.assertTemplateUsed(response, 'home/landing_page.html')
+
+    def test_csrf_pages_are_not_cached(self):
+        self.client.get('/contact-us/')
+        response = self.client.get('/contact-us/')
+        self.assertNotIn('X-Page-Cache', response)
+        self.assertIn('csrftoken', response.cookies)
+
+    def test_release_is_part_of_the_key(self):
+        self.client.get('/learn/')
+        with override_settings(PAGE_CACHE_VERSION='next'):
+            caching._release = None
+            self.addCleanup(setattr, caching, '_release', None)
+            response = self.client.get('/learn/')
+        self.assertTemplateUsed(response, 'home/learn_page.html')
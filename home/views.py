@@ -1,23 +1,30 @@
 from django.shortcuts import render
 
+from QRGenProject.caching import cache_anonymous_page
+
 # Create your views here.
 
+@cache_anonymous_page
 def home_page(request):
     # extra context if any
     return render(request, 'home/landing_page.html', {'title': 'Home'})
     
+@cache_anonymous_page
 def learn_page(request):
     # extra context if any
     return render(request, 'home/learn_page.html', {'title': 'Learn'})
     
+@cache_anonymous_page
 def contact_page(request):
     # extra context if any
     return render(request, 'home/contact_us_page.html', {'title': 'Contact Us'})
     
+@cache_anonymous_page
 def about_page(request):
     # extra context if any
     return render(request, 'home/about_us_page.html', {'title': 'About Us'})
 
+@cache_anonymous_page
 def documentation(request):
     # extra context if any
     return render(request, 'home/documentation_page.html', {'title': 'API Documentation'})
@@ -1,8 +1,9 @@
 from django.contrib import admin
-from .models import File, QrCode, QrType
+from .models import File, LinkCheck, QrCode, QrType
 # Register your models here.
 
 admin.site.register(File)
 admin.site.register(QrCode)
 admin.site.register(QrType)
+admin.site.register(LinkCheck)
 
@@ -1,6 +1,14 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_delete, post_migrate, post_save
 
 
 class QrgenConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'qrgen'
+
+    def ready(self):
+        from . import search
+
+        post_save.connect(search.code_saved, sender="qrgen.QrCode")
+        post_delete.connect(search.code_deleted, sender="qrgen.QrCode")
+        post_migrate.connect(search.setup_index, sender=self)
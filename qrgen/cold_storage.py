@@ -0,0 +1,65 @@
+import os
+
+import cloudinary
+import cloudinary.uploader
+from cloudinary_storage.storage import MediaCloudinaryStorage, RawMediaCloudinaryStorage
+from django.utils.deconstruct import deconstructible
+
+
+class PreservedNameMixin:
+    """
+    Cloudinary storages add a random suffix to every upload, a cold tier
+    has to keep the names it is given.
+    """
+
+    def _upload(self, name, content):
+        options = {
+            "use_filename": True,
+            "unique_filename": False,
+            "overwrite": True,
+            "resource_type": self._get_resource_type(name),
+            "tags": self.TAG,
+        }
+        folder = os.path.dirname(name)
+        if folder:
+            options["folder"] = folder
+        return cloudinary.uploader.upload(content, **options)
+
+    def _save(self, name, content):
+        super()._save(name, content)
+        return self._normalise_name(name)
+
+    def delete(self, name):
+        return super().delete(self._prepend_prefix(name))
+
+
+class AutoFormatMixin:
+    """
+    Image urls carry f_auto: Cloudinary answers with the smallest format
+    the browser accepts (WebP, AVIF), the way serve_media negotiates the
+    images stored locally (QRGenProject.variants).
+    """
+
+    def _get_url(self, name):
+        resource = cloudinary.CloudinaryResource(
+            self._prepend_prefix(name),
+            default_resource_type=self._get_resource_type(name),
+        )
+        return resource.build_url(fetch_format="auto")
+
+
+@deconstructible
+class AutoFormatMediaCloudinaryStorage(AutoFormatMixin, MediaCloudinaryStorage):
+    pass
+
+
+@deconstructible
+class ColdMediaCloudinaryStorage(
+    PreservedNameMixin, AutoFormatMixin, MediaCloudinaryStorage
+):
+    pass
+
+
+@deconstructible
+class ColdRawMediaCloudinaryStorage(PreservedNameMixin, RawMediaCloudinaryStorage):
+    pass
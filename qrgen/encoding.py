@@ -0,0 +1,98 @@
+"""
+Minimal PNGs of generated images.
+
+PIL writes a code as an 8-bit greyscale or RGB PNG with its default
+filter and zlib settings. A code only has two colours, so encode_png()
+writes it at 1 bit per pixel: greyscale when black on white, a two entry
+palette for a branded code. It also writes the chunks itself, with nothing
+beside the image data (no gamma, resolution or text).
+
+Filters and zlib settings were picked on qrcode.make() images:
+
+- a module is box_size pixels tall, so most rows repeat the one above.
+  Those get the Up filter and become all zeros; the others are left
+  unfiltered. Sub/Paeth on 1-bit rows only make the module edges noisier.
+- Z_FILTERED at level 9 comes out a little smaller than the default
+  strategy, Z_RLE much larger (it can't reach the repeated rows).
+
+Images with more colours (anti-aliased shapes, logos) are written by PIL
+with optimize=True.
+"""
+import io
+import struct
+import zlib
+
+SIGNATURE = b"\x89PNG\r\n\x1a\n"
+NONE, UP = b"\x00", b"\x02"
+
+
+def _chunk(kind, data):
+    return (
+        struct.pack(">I", len(data))
+        + kind
+        + data
+        + struct.pack(">I", zlib.crc32(kind + data))
+    )
+
+
+def _bilevel(image):
+    """
+    (mode "1" image, palette) of an image of at most two colours, palette
+    None for black on white; (None, None) for any other image.
+    """
+    from PIL import Image
+
+    if image.mode == "1":
+        return image, None
+    if "A" in image.mode or "transparency" in image.info:
+        return None, None
+    rgb = image.convert("RGB")
+    colors = rgb.getcolors(2)
+    if colors is None:
+        return None, None
+    colors = sorted(color for _, color in colors)
+    if set(colors) <= {(0, 0, 0), (255, 255, 255)}:
+        return rgb.convert("1", dither=Image.NONE), None
+    # told apart by their grey level, bit 1 is the second colour
+    swatch = Image.new("RGB", (2, 1))
+    swatch.putdata(colors)
+    levels = list(swatch.convert("L").getdata())
+    if len(colors) < 2 or levels[0] == levels[1]:
+        return None, None
+    lut = [255 if level == levels[1] else 0 for level in range(256)]
+    return rgb.convert("L").point(lut, "1"), colors
+
+
+def _scanlines(bits):
+    # filter byte and packed row of each pixel row
+    width, height = bits.size
+    stride = (width + 7) // 8
+    raw = bits.tobytes()
+    zeros = bytes(stride)
+    previous = None
+    for start in range(0, stride * height, stride):
+        row = raw[start : start + stride]
+        yield UP + zeros if row == previous else NONE + row
+        previous = row
+
+
+def encode_png(image):
+    """PNG bytes of the PIL image, 1 bit per pixel when it has two colours."""
+    bits, palette = _bilevel(image)
+    if bits is None:
+        out = io.BytesIO()
+        image.save(out, "PNG", optimize=True)
+        return out.getvalue()
+
+    width, height = bits.size
+    # bit depth 1, greyscale (0) or palette (3)
+    color_type = 0 if palette is None else 3
+    header = struct.pack(">IIBBBBB", width, height, 1, color_type, 0, 0, 0)
+    compressor = zlib.compressobj(9, zlib.DEFLATED, 15, 9, zlib.Z_FILTERED)
+    data = b"".join(compressor.compress(line) for line in _scanlines(bits))
+    data += compressor.flush()
+    chunks = [_chunk(b"IHDR", header)]
+    if palette is not None:
+        chunks.append(_chunk(b"PLTE", bytes(c for color in palette for c in color)))
+    chunks += [_chunk(b"IDAT", data), _chunk(b"IEND", b"")]
+    return SIGNATURE + b"".join(chunks)
@@ -0,0 +1,88 @@
+import csv
+import json
+import zlib
+
+from .models import QrCode
+
+# column -> values_list() lookup
+COLUMNS = {
+    "id": "id",
+    "title": "title",
+    "type": "type__name",
+    "is_dynamic": "is_dynamic",
+    "is_active": "is_active",
+    "action_type": "action_type",
+    "input_url": "input_url",
+    "action_url": "action_url",
+    "scan_count": "scan_count",
+    "date_gen": "date_gen",
+    "file": "file__name",
+}
+
+CHUNK_SIZE = 2000
+BUFFER_SIZE = 64 * 1024
+
+
+def rows(user):
+    # a server-side cursor read CHUNK_SIZE rows at a time, nothing is cached
+    # on the queryset, so memory doesn't grow with the number of codes
+    codes = QrCode.objects.filter(user=user).order_by("id")
+    for values in codes.values_list(*COLUMNS.values()).iterator(chunk_size=CHUNK_SIZE):
+        row = dict(zip(COLUMNS, values))
+        row["date_gen"] = row["date_gen"].isoformat()
+        yield row
+
+
+class Echo:
+    # csv.writer target that hands back what it is given
+    def write(self, value):
+        return value
+
+
+def csv_lines(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(list(COLUMNS))
+    for row in rows:
+        yield writer.writerow(row.values())
+
+
+def jsonl_lines(rows):
+    for row in rows:
+        yield json.dumps(row) + "\n"
+
+
+def buffered(lines, size=BUFFER_SIZE):
+    # one chunk per line would mean one write to the socket per row
+    buffer, length = [], 0
+    for line in lines:
+        buffer.append(line)
+        length += len(line)
+        if length >= size:
+            yield "".join(buffer).encode()
+            buffer, length = [], 0
+    if buffer:
+        yield "".join(buffer).encode()
+
+
+def gzipped(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+FORMATS = {
+    "csv": (csv_lines, "text/csv"),
+    "jsonl": (jsonl_lines, "application/x-ndjson"),
+}
+
+
+def export(user, format="csv", gzip=False):
+    """Chunks of the user's codes exported as format, and the content type."""
+    lines, content_type = FORMATS[format]
+    chunks = buffered(lines(rows(user)))
+    if gzip:
+        return gzipped(chunks), "application/gzip"
+    return chunks, content_type
@@ -0,0 +1,272 @@
+"""
+Health checks of the urls dynamic codes redirect to.
+
+Every distinct destination is requested once per run with asyncio: at
+most `concurrency` requests in flight, at most `per_host` to one host. A
+HEAD request is sent first, servers refusing it (or answering it with an
+error) get a GET whose body isn't read. The etag and Last-Modified of the
+previous check are sent along, a 304 counts as reachable. Redirects are
+followed up to MAX_REDIRECTS. Hosts are resolved before connecting and
+urls leading to loopback, private or link-local addresses are refused,
+unless LINK_CHECK_ALLOW_PRIVATE is set.
+
+Results are stored per url in LinkCheck, keyed by url_hash(), and
+dead_links() marks the codes whose destination failed its last check on
+the dashboard. Run by the check_destinations management command.
+"""
+import asyncio
+import hashlib
+import ipaddress
+import logging
+import random
+import re
+import socket
+import ssl
+from collections import defaultdict, namedtuple
+from urllib.parse import quote, urljoin, urlsplit
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import LinkCheck, QrCode
+
+logger = logging.getLogger(__name__)
+
+MAX_REDIRECTS = 5
+MAX_HEADER_LINES = 100
+USER_AGENT = "QRGen-LinkCheck/1.0"
+REDIRECTS = {301, 302, 303, 307, 308}
+# action types the scan view redirects to input_url for
+NOT_REDIRECTED = ["pdf", "biz", "img", "eml", "txt"]
+# whitespace and control characters, never valid in a url and a way to
+# smuggle headers into the request line
+UNSAFE = re.compile(r"[\x00-\x20\x7f]")
+
+Result = namedtuple("Result", "url status error etag last_modified")
+
+
+class Refused(ValueError):
+    """A url that isn't requested, the message is the Result error."""
+
+
+def url_hash(url):
+    return int.from_bytes(hashlib.sha1(url.encode()).digest()[:8], "big", signed=True)
+
+
+def is_dead(status):
+    return status == 0 or status >= 400
+
+
+def stored_checks(hashes):
+    # LinkCheck rows of hashes, a few hundred per query
+    hashes = list(hashes)
+    for start in range(0, len(hashes), 500):
+        yield from LinkCheck.objects.filter(url_hash__in=hashes[start : start + 500])
+
+
+def destinations():
+    """Distinct http(s) urls dynamic codes redirect to."""
+    urls = (
+        QrCode.objects.filter(is_dynamic=True, input_url__isnull=False)
+        .exclude(action_type__in=NOT_REDIRECTED)
+        .values_list("input_url", flat=True)
+        .distinct()
+    )
+    return [url for url in urls.iterator() if url.startswith(("http://", "https://"))]
+
+
+def dead_links(urls):
+    """url -> LinkCheck for the urls whose last check failed."""
+    hashes = {url_hash(url): url for url in urls}
+    return {
+        hashes[check.url_hash]: check
+        for check in stored_checks(hashes)
+        if is_dead(check.status)
+    }
+
+
+async def resolve(host, port):
+    """
+    Address to connect to for host, every address it resolves to must be
+    public: a destination never makes the checker reach the internal network.
+    """
+    infos = await asyncio.get_running_loop().getaddrinfo(
+        host, port, type=socket.SOCK_STREAM
+    )
+    if not getattr(settings, "LINK_CHECK_ALLOW_PRIVATE", False):
+        for *_, sockaddr in infos:
+            if not ipaddress.ip_address(sockaddr[0].split("%")[0]).is_global:
+                raise Refused("private address")
+    return infos[0][4][0]
+
+
+async def request(method, url, headers, context):
+    # status and lowercased headers of the response, the body is never read
+    if UNSAFE.search(url):
+        raise Refused("invalid url")
+    parts = urlsplit(url)
+    secure = parts.scheme == "https"
+    if not parts.hostname:
+        raise Refused("no host")
+    host = parts.hostname.encode("idna").decode()
+    host_header = f"[{host}]" if ":" in host else host
+    if parts.port:
+        host_header += f":{parts.port}"
+    # anything outside the url character set is percent-encoded, escapes
+    # already in the url are kept
+    path = quote(parts.path or "/", safe="/%:@!$&'()*+,;=-._~")
+    if parts.query:
+        path += "?" + quote(parts.query, safe="/?%:@!$&'()*+,;=-._~")
+    port = parts.port or (443 if secure else 80)
+    # connect to the address that was checked, not to a new lookup's
+    reader, writer = await asyncio.open_connection(
+        await resolve(host, port),
+        port,
+        ssl=context if secure else None,
+        server_hostname=host if secure else None,
+    )
+    try:
+        lines = [
+            f"{method} {path} HTTP/1.1",
+            f"Host: {host_header}",
+            f"User-Agent: {USER_AGENT}",
+            "Accept: */*",
+            "Connection: close",
+            *(f"{name}: {value}" for name, value in headers.items()),
+        ]
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+        await writer.drain()
+        status_line = (await reader.readline()).decode("latin-1").split()
+        if len(status_line) < 2 or not status_line[1].isdigit():
+            raise ValueError("not an http response")
+        response_headers = {}
+        for _ in range(MAX_HEADER_LINES):
+            line = (await reader.readline()).decode("latin-1").strip()
+            if not line:
+                break
+            name, _, value = line.partition(":")
+            response_headers[name.strip().lower()] = value.strip()
+        return int(status_line[1]), response_headers
+    finally:
+        writer.close()
+
+
+async def check(url, etag="", last_modified="", context=None):
+    """Result of requesting url, HEAD first then GET."""
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+    target = url
+    for _ in range(MAX_REDIRECTS + 1):
+        status, response_headers = await request("HEAD", target, headers, context)
+        if status >= 400:
+            status, response_headers = await request("GET", target, headers, context)
+        if status not in REDIRECTS or "location" not in response_headers:
+            break
+        target = urljoin(target, response_headers["location"])
+        headers = {}
+    if status == 304:
+        return Result(url, status, "", etag, last_modified)
+    return Result(
+        url,
+        status,
+        "too many redirects" if status in REDIRECTS else "",
+        response_headers.get("etag", "")[:255],
+        response_headers.get("last-modified", "")[:40],
+    )
+
+
+async def check_all(targets, concurrency=None, per_host=None, timeout=None):
+    """
+    Checks targets, (url, etag, last_modified) tuples, returns their
+    Results in completion order.
+    """
+    concurrency = concurrency or getattr(settings, "LINK_CHECK_CONCURRENCY", 256)
+    per_host = per_host or getattr(settings, "LINK_CHECK_PER_HOST", 8)
+    timeout = timeout or getattr(settings, "LINK_CHECK_TIMEOUT", 10)
+    context = ssl.create_default_context()
+    slots = asyncio.Semaphore(concurrency)
+    hosts = defaultdict(lambda: asyncio.Semaphore(per_host))
+    results = []
+
+    async def run(url, etag, last_modified):
+        try:
+            async with hosts[urlsplit(url).hostname]:
+                result = await asyncio.wait_for(
+                    check(url, etag, last_modified, context), timeout
+                )
+        except asyncio.TimeoutError:
+            result = Result(url, 0, "timeout", etag, last_modified)
+        except ssl.SSLError:
+            result = Result(url, 0, "tls error", etag, last_modified)
+        except Refused as exc:
+            result = Result(url, 0, str(exc), etag, last_modified)
+        except (OSError, ValueError, UnicodeError):
+            result = Result(url, 0, "connection failed", etag, last_modified)
+        except Exception:
+            # one odd url never stops the run
+            logger.exception("checking %s failed", url)
+            result = Result(url, 0, "check failed", etag, last_modified)
+        finally:
+            slots.release()
+        results.append(result)
+
+    # neighbouring urls often share a host, spreading them keeps the
+    # per-host limit from holding most of the slots
+    targets = list(targets)
+    random.shuffle(targets)
+    tasks = set()
+    for target in targets:
+        await slots.acquire()
+        task = asyncio.create_task(run(*target))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+    await asyncio.gather(*tasks)
+    return results
+
+
+def save(results):
+    hashes = [url_hash(result.url) for result in results]
+    previous = {check.url_hash: check.failures for check in stored_checks(hashes)}
+    now = timezone.now()
+    checks = []
+    for key, result in zip(hashes, results):
+        dead = is_dead(result.status)
+        checks.append(
+            LinkCheck(
+                url_hash=key,
+                status=result.status,
+                error=result.error,
+                etag=result.etag,
+                last_modified=result.last_modified,
+                failures=previous.get(key, 0) + 1 if dead else 0,
+                checked=now,
+            )
+        )
+    LinkCheck.objects.bulk_create(
+        checks,
+        update_conflicts=True,
+        unique_fields=["url_hash"],
+        update_fields=["status", "error", "etag", "last_modified", "failures", "checked"],
+    )
+
+
+def check_destinations(urls, batch_size=5000, **limits):
+    """Checks urls and stores the results, returns how many are dead."""
+    dead = 0
+    for start in range(0, len(urls), batch_size):
+        batch = urls[start : start + batch_size]
+        known = {check.url_hash: check for check in stored_checks(map(url_hash, batch))}
+        targets = []
+        for url in batch:
+            previous = known.get(url_hash(url))
+            if previous is not None and not is_dead(previous.status):
+                targets.append((url, previous.etag, previous.last_modified))
+            else:
+                targets.append((url, "", ""))
+        results = asyncio.run(check_all(targets, **limits))
+        save(results)
+        dead += sum(1 for result in results if is_dead(result.status))
+    return dead
@@ -0,0 +1,79 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from qrgen.linkcheck import check_destinations, destinations, url_hash
+from qrgen.models import LinkCheck
+
+
+class Command(BaseCommand):
+    help = (
+        "Checks the destination of every dynamic code, each distinct url "
+        "once, and stores whether it is reachable for the dashboard."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--max-age",
+            type=float,
+            default=0,
+            help="Skip urls whose last check succeeded less than this many hours ago.",
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            help="Requests in flight (LINK_CHECK_CONCURRENCY).",
+        )
+        parser.add_argument(
+            "--per-host",
+            type=int,
+            help="Requests in flight to one host (LINK_CHECK_PER_HOST).",
+        )
+        parser.add_argument(
+            "--timeout",
+            type=float,
+            help="Seconds a check may take, redirects included (LINK_CHECK_TIMEOUT).",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=5000,
+            help="Urls checked before their results are stored.",
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        urls = destinations()
+        hashes = {url_hash(url): url for url in urls}
+
+        # results of urls no codes point to anymore
+        stale = [
+            key
+            for key in LinkCheck.objects.values_list("url_hash", flat=True).iterator()
+            if key not in hashes
+        ]
+        for start in range(0, len(stale), 500):
+            LinkCheck.objects.filter(url_hash__in=stale[start : start + 500]).delete()
+
+        if options["max_age"]:
+            since = timezone.now() - timedelta(hours=options["max_age"])
+            fresh = LinkCheck.objects.filter(checked__gte=since, failures=0)
+            for key in fresh.values_list("url_hash", flat=True).iterator():
+                hashes.pop(key, None)
+            urls = list(hashes.values())
+
+        dead = check_destinations(
+            urls,
+            batch_size=options["batch_size"],
+            concurrency=options["concurrency"],
+            per_host=options["per_host"],
+            timeout=options["timeout"],
+        )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{len(urls)} urls checked in {time.monotonic() - started:.1f} s, "
+                f"{dead} unreachable, {len(stale)} stale results removed"
+            )
+        )
@@ -0,0 +1,293 @@
+import json
+import os
+import shutil
+import time
+from datetime import datetime, timedelta, timezone
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from QRGenProject import variants
+from qrgen.models import File, QrCode
+from qrgen.storage import list_pages
+
+
+def _stored_names(storage, name):
+    # cloudinary storages may record names with their prefix prepended
+    names = {name}
+    if hasattr(storage, "_prepend_prefix"):
+        names.add(storage._prepend_prefix(name))
+    return names
+
+
+def _modified(path):
+    try:
+        return datetime.fromtimestamp(os.path.getmtime(path), timezone.utc)
+    except OSError:
+        return None
+
+
+def _file_size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _folder_size(path):
+    total = 0
+    for dirpath, dirnames, filenames in os.walk(path):
+        for filename in filenames:
+            try:
+                total += os.path.getsize(os.path.join(dirpath, filename))
+            except OSError:
+                pass
+    return total
+
+
+class Command(BaseCommand):
+    help = (
+        "Deletes stored files, qrcode images and temp/qrcodes/<id>/ folders "
+        "that are no longer referenced by any File or QrCode, and image "
+        "variants whose original is gone or was rewritten. Storages are "
+        "listed page by page and the listing cursor is checkpointed, so an "
+        "interrupted run resumes where it stopped. Objects younger than "
+        "--min-age are left alone, they may belong to a row being saved."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only report what would be deleted and the reclaimable bytes.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Names listed and checked against the database per page.",
+        )
+        parser.add_argument(
+            "--min-age",
+            type=float,
+            default=60,
+            help="Minutes an object must be old before it can be collected.",
+        )
+        parser.add_argument(
+            "--limit",
+            type=int,
+            default=0,
+            help="Stop after this many names per source (0 for no limit).",
+        )
+        parser.add_argument(
+            "--rate",
+            type=float,
+            default=10,
+            help="Maximum deletions per second (0 for no limit).",
+        )
+        parser.add_argument(
+            "--reset",
+            action="store_true",
+            help="Forget the checkpoint and start from the beginning.",
+        )
+        parser.add_argument(
+            "--state",
+            default=os.path.join(settings.BASE_DIR, "temp", "gc-state.json"),
+            help="Checkpoint file.",
+        )
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.state = {} if options["reset"] else self.load_state()
+        self.cutoff = datetime.now(timezone.utc) - timedelta(minutes=options["min_age"])
+
+        file_storage = File._meta.get_field("file").storage
+        image_storage = QrCode._meta.get_field("img").storage
+        sources = [
+            ("files", self.storage_pages(file_storage, "user_files"), self.live_files),
+            ("images", self.storage_pages(image_storage, "qrcodes"), self.live_images),
+            ("temp", self.temp_pages(), self.live_temp_folders),
+            ("variants", self.variant_pages(), self.live_variants),
+        ]
+
+        total_orphans = total_bytes = 0
+        for source, pages, live in sources:
+            orphans, reclaimable = self.collect(source, pages, live)
+            total_orphans += orphans
+            total_bytes += reclaimable
+            self.stdout.write(f"{source}: {orphans} orphans, {reclaimable} bytes")
+
+        verb = "reclaimable" if options["dry_run"] else "reclaimed"
+        self.stdout.write(
+            self.style.SUCCESS(f"{total_orphans} orphans, {total_bytes} bytes {verb}")
+        )
+
+    # checkpoint
+
+    def load_state(self):
+        try:
+            with open(self.options["state"]) as fh:
+                return json.load(fh)
+        except (OSError, ValueError):
+            return {}
+
+    def save_state(self):
+        if self.options["dry_run"]:
+            return
+        os.makedirs(os.path.dirname(self.options["state"]), exist_ok=True)
+        with open(self.options["state"], "w") as fh:
+            json.dump(self.state, fh)
+
+    # listings, as (entries, cursor) pages: entries are (name, modified, size,
+    # delete), cursor resumes after the page, None after the last one
+
+    def storage_pages(self, storage, folder):
+        def pages(cursor):
+            for entries, next_cursor in list_pages(
+                storage, folder, cursor, self.options["batch_size"]
+            ):
+                page = [
+                    (
+                        name,
+                        modified,
+                        lambda name=name: storage.size(name),
+                        lambda name=name: storage.delete(name),
+                    )
+                    for name, modified in entries
+                ]
+                yield page, next_cursor
+
+        return pages
+
+    def temp_pages(self):
+        root = os.path.join(settings.BASE_DIR, "temp", "qrcodes")
+
+        def pages(cursor):
+            try:
+                entries = os.listdir(root)
+            except FileNotFoundError:
+                entries = []
+            ids = sorted(int(entry) for entry in entries if entry.isdigit())
+            if cursor is not None:
+                ids = [code_id for code_id in ids if code_id > cursor]
+            size = self.options["batch_size"]
+            for start in range(0, len(ids), size):
+                page = []
+                for code_id in ids[start : start + size]:
+                    path = os.path.join(root, str(code_id))
+                    page.append(
+                        (
+                            code_id,
+                            _modified(path),
+                            lambda path=path: _folder_size(path),
+                            lambda path=path: shutil.rmtree(path, ignore_errors=True),
+                        )
+                    )
+                yield page, page[-1][0] if start + size < len(ids) else None
+
+        return pages
+
+    def variant_pages(self):
+        root = variants.variant_root()
+
+        def pages(cursor):
+            names = []
+            for dirpath, dirnames, filenames in os.walk(root):
+                for filename in filenames:
+                    path = os.path.join(dirpath, filename)
+                    names.append(os.path.relpath(path, root))
+            names.sort()
+            if cursor is not None:
+                names = [name for name in names if name > cursor]
+            size = self.options["batch_size"]
+            for start in range(0, len(names), size):
+                page = []
+                for name in names[start : start + size]:
+                    path = os.path.join(root, name)
+                    page.append(
+                        (
+                            name,
+                            _modified(path),
+                            lambda path=path: _file_size(path),
+                            lambda path=path: _remove(path),
+                        )
+                    )
+                yield page, page[-1][0] if start + size < len(names) else None
+
+        return pages
+
+    # live references, one query per page
+
+    def live_files(self, names):
+        return self.live_names(File, "file", File._meta.get_field("file").storage, names)
+
+    def live_images(self, names):
+        return self.live_names(QrCode, "img", QrCode._meta.get_field("img").storage, names)
+
+    def live_names(self, model, field, storage, names):
+        variants = {}
+        for name in names:
+            for stored in _stored_names(storage, name):
+                variants[stored] = name
+        stored = model.objects.filter(**{f"{field}__in": list(variants)}).values_list(
+            field, flat=True
+        )
+        return {variants[name] for name in stored}
+
+    def live_temp_folders(self, ids):
+        return set(QrCode.objects.filter(id__in=ids).values_list("id", flat=True))
+
+    def live_variants(self, names):
+        # no query, a variant lives as long as its original is unchanged
+        return {name for name in names if variants.is_current(name)}
+
+    # the diff itself
+
+    def collect(self, source, pages, live):
+        orphans = reclaimable = seen = 0
+        limit = self.options["limit"]
+        for page, cursor in pages(self.state.get(source)):
+            truncated = limit and len(page) > limit - seen
+            if truncated:
+                page = page[: limit - seen]
+            # recent objects may be referenced by a row still being saved
+            old = [
+                entry for entry in page if entry[1] is None or entry[1] < self.cutoff
+            ]
+            live_names = live([name for name, modified, size, delete in old])
+            for name, modified, size, delete in old:
+                if name not in live_names:
+                    orphans += 1
+                    reclaimable += size() or 0
+                    if not self.options["dry_run"]:
+                        delete()
+                        self.throttle()
+                    if self.options["verbosity"] > 1:
+                        self.stdout.write(f"  orphan {source}: {name}")
+            seen += len(page)
+            if truncated:
+                # a cursor only resumes after a whole page, this one is
+                # listed again next time
+                return orphans, reclaimable
+            if cursor is None:
+                break
+            self.state[source] = cursor
+            self.save_state()
+            if limit and seen >= limit:
+                return orphans, reclaimable
+
+        # the whole listing was processed, the next run starts over
+        self.state.pop(source, None)
+        self.save_state()
+        return orphans, reclaimable
+
+    def throttle(self):
+        if self.options["rate"]:
+            time.sleep(1 / self.options["rate"])
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from qrgen.models import QrCode
+from qrgen.search import backend, documents
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the search index of the codes from the database."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Codes indexed per batch.",
+        )
+
+    def handle(self, *args, **options):
+        backend.setup()
+        backend.clear()
+        ids = QrCode.objects.order_by("id").values_list("id", flat=True)
+        batch, total = [], 0
+        for code_id in ids.iterator(chunk_size=options["batch_size"]):
+            batch.append(code_id)
+            if len(batch) == options["batch_size"]:
+                backend.index(documents(batch))
+                total += len(batch)
+                batch = []
+        if batch:
+            backend.index(documents(batch))
+            total += len(batch)
+        self.stdout.write(self.style.SUCCESS(f"{total} codes indexed"))
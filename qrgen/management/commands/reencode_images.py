@@ -0,0 +1,84 @@
+import io
+import time
+
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand
+
+from qrgen.models import QrCode
+from qrgen.storage import cleanup_in_background
+
+
+class Command(BaseCommand):
+    help = (
+        "Re-encodes the stored qrcode images as minimal PNGs (qrgen.encoding) "
+        "and reports the bytes saved against the time spent encoding."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Encode and report, without storing anything.",
+        )
+
+    def handle(self, *args, **options):
+        from PIL import Image
+
+        from qrgen.encoding import encode_png
+
+        storage = QrCode._meta.get_field("img").storage
+        started = time.monotonic()
+        encoding = 0.0
+        images = smaller = unreadable = 0
+        before = after = 0
+        replaced = []
+
+        codes = QrCode.objects.exclude(img="").exclude(img__isnull=True)
+        for code in codes.only("id", "img").iterator(chunk_size=500):
+            try:
+                with code.img.open("rb") as f:
+                    original = f.read()
+                image = Image.open(io.BytesIO(original))
+                image.load()
+            except Exception:
+                unreadable += 1
+                continue
+            images += 1
+            start = time.perf_counter()
+            data = encode_png(image)
+            encoding += time.perf_counter() - start
+            if len(data) >= len(original):
+                before += len(original)
+                after += len(original)
+                continue
+
+            smaller += 1
+            before += len(original)
+            after += len(data)
+            if options["dry_run"]:
+                continue
+            # a new name, the old one is cached as immutable
+            name = storage.save(code.img.name, ContentFile(data))
+            QrCode.objects.filter(id=code.id).update(img=name)
+            if name != code.img.name:
+                replaced.append((storage, code.img.name))
+        cleanup_in_background(replaced)
+
+        saved = before - after
+        self.stdout.write(
+            f"{images} images read, {smaller} smaller re-encoded"
+            f"{' (dry run, nothing stored)' if options['dry_run'] else ''}, "
+            f"{unreadable} unreadable"
+        )
+        self.stdout.write(
+            f"{before / 1024:.1f} kB -> {after / 1024:.1f} kB, "
+            f"{saved / 1024:.1f} kB saved ({saved / max(before, 1):.0%})"
+        )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"encoding took {encoding:.2f} s "
+                f"({encoding / max(images, 1) * 1000:.2f} ms/image, "
+                f"{saved / max(encoding * 1000, 1e-9):.0f} bytes saved per ms), "
+                f"{time.monotonic() - started:.1f} s in all"
+            )
+        )
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from qrgen.models import File, QrCode
+from qrgen.storage import TieredStorage
+
+
+class Command(BaseCommand):
+    help = (
+        "Uploads objects still pending in the local hot tier (e.g. after a "
+        "restart) and applies the eviction policy to the measured size of "
+        "the hot tier, which includes what every worker wrote."
+    )
+
+    def handle(self, *args, **options):
+        storages = {
+            id(field.storage): field.storage
+            for field in (File._meta.get_field("file"), QrCode._meta.get_field("img"))
+            if isinstance(field.storage, TieredStorage)
+        }
+        if not storages:
+            self.stdout.write("Tiered storage is not enabled.")
+            return
+
+        for storage in storages.values():
+            pending = list(storage.pending())
+            storage.upload_pending()
+            evicted = storage.evict(rescan=True)
+            self.stdout.write(
+                f"{storage.hot.location}: {len(pending)} pending uploaded, "
+                f"{evicted} evicted"
+            )
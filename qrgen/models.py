@@ -1,9 +1,9 @@
 from django.db import models
 from django.contrib.auth.models import User
-from cloudinary_storage.storage import RawMediaCloudinaryStorage
 from django.core.files.storage import default_storage
+from .storage import LazyStorage, TieredStorage
 
-from QRGenProject.settings import DEBUG
+from QRGenProject.settings import DEBUG, TIERED_STORAGE_ENABLED
 from django_prometheus.models import ExportModelOperationsMixin
 
 # Create your models here.
@@ -20,16 +20,51 @@ ACTION_TYPE = (
 )
 
 
+# the cloudinary storages are only imported once a file is touched
+
+
+def raw_file_storage():
+    from cloudinary_storage.storage import RawMediaCloudinaryStorage
+
+    return RawMediaCloudinaryStorage()
+
+
+def cloudinary_media_storage():
+    # the default storage's, with format negotiation in the urls
+    from .cold_storage import AutoFormatMediaCloudinaryStorage
+
+    return AutoFormatMediaCloudinaryStorage()
+
+
+def tiered_file_storage():
+    from .cold_storage import ColdRawMediaCloudinaryStorage
+
+    return TieredStorage(cold_storage=ColdRawMediaCloudinaryStorage())
+
+
+def tiered_image_storage():
+    from .cold_storage import ColdMediaCloudinaryStorage
+
+    return TieredStorage(cold_storage=ColdMediaCloudinaryStorage())
+
+
 if DEBUG:
     storage = default_storage
+    image_storage = default_storage
+elif TIERED_STORAGE_ENABLED:
+    storage = LazyStorage(tiered_file_storage)
+    image_storage = LazyStorage(tiered_image_storage)
 else:
-    storage = RawMediaCloudinaryStorage()
+    storage = LazyStorage(raw_file_storage)
+    image_storage = LazyStorage(cloudinary_media_storage)
 
 
 class File(ExportModelOperationsMixin("file"), models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     name = models.CharField(max_length=50)
     file = models.FileField(upload_to="user_files/", storage=storage)
+    # blobs are shared between rows uploading the same content
+    sha256 = models.CharField(max_length=64, blank=True, db_index=True)
 
     def __str__(self):
         return self.name
@@ -47,7 +82,7 @@ class QrCode(ExportModelOperationsMixin("qrcode"), models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     type = models.ForeignKey(QrType, on_delete=models.CASCADE)
     is_dynamic = models.BooleanField(default=True, blank=True)
-    img = models.ImageField(upload_to="qrcodes/")
+    img = models.ImageField(upload_to="qrcodes/", storage=image_storage)
     input_url = models.URLField(max_length=255, blank=True, null=True)
     action_url = models.URLField(max_length=255, blank=True, null=True)
     action_type = models.CharField(max_length=3, choices=ACTION_TYPE)
@@ -60,4 +95,25 @@ class QrCode(ExportModelOperationsMixin("qrcode"), models.Model):
         return f"{self.title} ({self.date_gen})"
 
 
+class LinkCheck(models.Model):
+    # last health check of one distinct destination url (qrgen.linkcheck),
+    # keyed by a 64 bit hash of the url rather than the url itself
+    url_hash = models.BigIntegerField(unique=True)
+    # 0 when no response came back, see error
+    status = models.SmallIntegerField(default=0)
+    error = models.CharField(max_length=20, blank=True)
+    etag = models.CharField(max_length=255, blank=True)
+    last_modified = models.CharField(max_length=40, blank=True)
+    # consecutive failed checks
+    failures = models.PositiveSmallIntegerField(default=0)
+    checked = models.DateTimeField()
+
+    @property
+    def reason(self):
+        return self.error or str(self.status)
+
+    def __str__(self):
+        return f"{self.url_hash}: {self.reason}"
+
+
 # request.build_absolute_uri(f"/download/{file.id}")
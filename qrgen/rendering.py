@@ -0,0 +1,212 @@
+"""
+QR code images, plain or branded.
+
+A branded code has its own dark and light colours, a module shape and
+optionally a logo in its center. The error correction level is raised to
+what the style takes away: shaped modules cover less of their cell
+(level Q) and a logo hides the modules under it (level H).
+
+Modules are drawn black on white by qrcode's StyledPilImage and coloured
+afterwards in one ImageOps.colorize pass, rather than by qrcode's
+per-pixel colour masks. Logos are decoded, scaled and composited onto
+their padding once per (logo hash, size, background) and kept in a small
+per-process LRU cache, so a run of codes with the same logo only pastes
+the prepared asset.
+
+Large-format (poster) PNGs never exist as an image in memory:
+write_large_png() packs each module row into one 1-bit scanline and hands
+pypng the same scanline once per pixel row, so memory stays at about one
+row whatever the size.
+"""
+import hashlib
+import io
+import re
+import threading
+from collections import OrderedDict, namedtuple
+
+import png
+import qrcode
+from qrcode.image.styledpil import StyledPilImage
+from qrcode.image.styles.moduledrawers import pil as drawers
+from PIL import Image, ImageDraw, ImageOps
+
+SHAPES = {
+    "square": drawers.SquareModuleDrawer,
+    "gapped": drawers.GappedSquareModuleDrawer,
+    "circle": drawers.CircleModuleDrawer,
+    "rounded": drawers.RoundedModuleDrawer,
+}
+COLOR = re.compile(r"^#[0-9a-fA-F]{6}$")
+# side of the logo padding, as a share of the image side. 0.25 hides
+# about 6% of the modules, level H restores up to 30%
+LOGO_SCALE = 0.25
+LOGO_MAX_BYTES = 1024 * 1024
+# a small file can still decode to a huge image, the size is read from
+# the header before anything is decoded
+LOGO_MAX_PIXELS = (4096, 4096)
+# dark on light, WCAG's minimum for large text
+MIN_CONTRAST = 3.0
+MAX_CACHED_LOGOS = 64
+INCH = 0.0254
+
+Style = namedtuple(
+    "Style", "fill back shape logo", defaults=("#000000", "#ffffff", "square", None)
+)
+
+
+class InvalidStyle(ValueError):
+    pass
+
+
+def _rgb(color):
+    return tuple(int(color[i : i + 2], 16) for i in (1, 3, 5))
+
+
+def _luminance(rgb):
+    # relative luminance, as in WCAG
+    channels = [c / 255 for c in rgb]
+    channels = [c / 12.92 if c <= 0.03928 else ((c + 0.055) / 1.055) ** 2.4 for c in channels]
+    return 0.2126 * channels[0] + 0.7152 * channels[1] + 0.0722 * channels[2]
+
+
+def make_style(fill=None, back=None, shape=None, logo=None):
+    """Validated Style, raises InvalidStyle."""
+    style = Style(fill or "#000000", back or "#ffffff", shape or "square", logo or None)
+    for color in (style.fill, style.back):
+        if not COLOR.match(color):
+            raise InvalidStyle(f"colours are #rrggbb, not {color!r}")
+    if style.shape not in SHAPES:
+        raise InvalidStyle(f"module_shape must be one of {', '.join(SHAPES)}")
+    # readers look for dark modules on a light background
+    dark, light = _luminance(_rgb(style.fill)), _luminance(_rgb(style.back))
+    if (light + 0.05) / (dark + 0.05) < MIN_CONTRAST:
+        raise InvalidStyle("the fill colour must be much darker than the background")
+    if style.logo is not None:
+        if len(style.logo) > LOGO_MAX_BYTES:
+            raise InvalidStyle("the logo is too large")
+        try:
+            image = Image.open(io.BytesIO(style.logo))
+            width, height = image.size
+        except Exception:
+            raise InvalidStyle("the logo is not an image")
+        if width > LOGO_MAX_PIXELS[0] or height > LOGO_MAX_PIXELS[1]:
+            raise InvalidStyle(
+                "the logo is larger than %dx%d pixels" % LOGO_MAX_PIXELS
+            )
+        try:
+            image.verify()
+        except Exception:
+            raise InvalidStyle("the logo is not an image")
+    return style
+
+
+def error_correction(style):
+    if style.logo is not None:
+        return qrcode.constants.ERROR_CORRECT_H
+    if style.shape != "square":
+        return qrcode.constants.ERROR_CORRECT_Q
+    return qrcode.constants.ERROR_CORRECT_M
+
+
+# (logo sha256, side, background) -> RGBA asset, least recently used first
+_logos = OrderedDict()
+_lock = threading.Lock()
+
+
+def logo_asset(logo, side, back):
+    """The logo scaled into a side x side rounded pad of colour back."""
+    key = (hashlib.sha256(logo).digest(), side, back)
+    with _lock:
+        asset = _logos.get(key)
+        if asset is not None:
+            _logos.move_to_end(key)
+            return asset
+
+    pad = max(side // 10, 1)
+    image = Image.open(io.BytesIO(logo))
+    image.draft("RGB", (side, side))
+    image = image.convert("RGBA")
+    image.thumbnail((side - 2 * pad, side - 2 * pad), Image.LANCZOS)
+    asset = Image.new("RGBA", (side, side), _rgb(back) + (255,))
+    asset.alpha_composite(
+        image, ((side - image.width) // 2, (side - image.height) // 2)
+    )
+    mask = Image.new("L", (side, side), 0)
+    ImageDraw.Draw(mask).rounded_rectangle((0, 0, side - 1, side - 1), pad * 2, fill=255)
+    asset.putalpha(mask)
+
+    with _lock:
+        _logos[key] = asset
+        while len(_logos) > MAX_CACHED_LOGOS:
+            _logos.popitem(last=False)
+    return asset
+
+
+def forget_logos():
+    with _lock:
+        _logos.clear()
+
+
+def render(data, style=None):
+    """PIL image of the QR code of data."""
+    if style is None or style == Style():
+        # the 1-bit image of qrcode.make()
+        return qrcode.make(data).get_image()
+
+    qr = qrcode.QRCode(error_correction=error_correction(style))
+    qr.add_data(data)
+    qr.make(fit=True)
+    modules = qr.make_image(
+        image_factory=StyledPilImage, module_drawer=SHAPES[style.shape]()
+    ).get_image()
+    image = ImageOps.colorize(modules.convert("L"), black=style.fill, white=style.back)
+
+    if style.logo is not None:
+        side = int(image.width * LOGO_SCALE)
+        asset = logo_asset(style.logo, side, style.back)
+        corner = ((image.width - side) // 2, (image.height - side) // 2)
+        image.paste(asset, corner, asset)
+    return image
+
+
+def _scanline(modules, module_px):
+    # one 1-bit greyscale pixel row of a module row, 0 is dark, padded
+    # to whole bytes with light pixels
+    dark, light = "0" * module_px, "1" * module_px
+    bits = "".join(dark if module else light for module in modules)
+    bits += "1" * (-len(bits) % 8)
+    return int(bits, 2).to_bytes(len(bits) // 8, "big")
+
+
+def _scanlines(matrix, module_px):
+    for modules in matrix:
+        scanline = _scanline(modules, module_px)
+        for _ in range(module_px):
+            yield scanline
+
+
+def write_large_png(data, out, side, dpi):
+    """
+    Writes a black on white PNG of the QR code of data to the binary file
+    out, about side pixels wide, with its resolution set to dpi.
+    Returns the actual side, a whole number of pixels per module.
+    """
+    qr = qrcode.QRCode()
+    qr.add_data(data)
+    qr.make(fit=True)
+    matrix = qr.get_matrix()
+    module_px = max(round(side / len(matrix)), 1)
+    side = module_px * len(matrix)
+    pixels_per_meter = round(dpi / INCH)
+    writer = png.Writer(
+        side,
+        side,
+        greyscale=True,
+        bitdepth=1,
+        compression=9,
+        x_pixels_per_unit=pixels_per_meter,
+        y_pixels_per_unit=pixels_per_meter,
+        unit_is_meter=True,
+    )
+    writer.write_packed(out, _scanlines(matrix, module_px))
+    return side
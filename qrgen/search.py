@@ -0,0 +1,270 @@
+"""
+Full-text search over a user's codes (title, input url and file name).
+
+The index is kept up to date from the QrCode save and delete signals (see
+QrgenConfig.ready), writes happen once the transaction commits. Bulk
+``QuerySet.update()`` calls bypass the signals and call ``reindex()``.
+The backend is chosen with SEARCH_BACKEND: SQLite FTS5 in the project
+database by default, or Elasticsearch.
+"""
+import logging
+import re
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils.functional import SimpleLazyObject
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+TERM = re.compile(r"\w+", re.UNICODE)
+
+# search stops at this many terms, longer queries don't rank better
+MAX_TERMS = 8
+
+
+def terms(query):
+    return TERM.findall(query.lower())[:MAX_TERMS]
+
+
+def documents(code_ids):
+    from .models import QrCode
+
+    for values in QrCode.objects.filter(id__in=code_ids).values(
+        "id", "user_id", "title", "input_url", "file__name"
+    ):
+        yield {
+            "id": values["id"],
+            "owner": values["user_id"],
+            "title": values["title"] or "",
+            "input_url": values["input_url"] or "",
+            "file_name": values["file__name"] or "",
+        }
+
+
+class SQLiteFTSBackend:
+    """
+    FTS5 table in the project's SQLite database, its rowid is the code id.
+    The owner is an indexed column so that a user's matches are found
+    through the index instead of filtering every match.
+    """
+
+    table = "qrgen_qrcode_search"
+
+    def setup(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.table} USING fts5("
+                "owner, title, input_url, file_name, "
+                "tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+            )
+
+    def index(self, docs):
+        rows = [
+            (doc["id"], f"u{doc['owner']}", doc["title"], doc["input_url"], doc["file_name"])
+            for doc in docs
+        ]
+        if not rows:
+            return
+        with connection.cursor() as cursor:
+            # fts5 tables have no unique constraint, replace by hand
+            cursor.execute(
+                f"DELETE FROM {self.table} WHERE rowid IN ({', '.join('%s' for _ in rows)})",
+                [row[0] for row in rows],
+            )
+            cursor.executemany(
+                f"INSERT INTO {self.table} (rowid, owner, title, input_url, file_name) "
+                "VALUES (%s, %s, %s, %s, %s)",
+                rows,
+            )
+
+    def remove(self, code_ids):
+        code_ids = list(code_ids)
+        if not code_ids:
+            return
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"DELETE FROM {self.table} WHERE rowid IN ({', '.join('%s' for _ in code_ids)})",
+                code_ids,
+            )
+
+    def clear(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.table}")
+
+    def search(self, user_id, query, limit, offset=0):
+        words = terms(query)
+        if not words:
+            return []
+        # every term must match, the last one may be a prefix of a word
+        match = " AND ".join(f'"{word}"' for word in words[:-1])
+        match = " AND ".join(filter(None, [match, f'"{words[-1]}" *']))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT rowid FROM {self.table} WHERE {self.table} MATCH %s "
+                # bm25 weights: owner, title, input_url, file_name
+                f"ORDER BY bm25({self.table}, 0, 10.0, 2.0, 5.0) LIMIT %s OFFSET %s",
+                [f"owner:u{user_id} AND {{title input_url file_name}}: ({match})", limit, offset],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+
+class ElasticsearchBackend:
+    """Index in an Elasticsearch cluster (SEARCH_ELASTICSEARCH_URL)."""
+
+    def __init__(self):
+        from elasticsearch import Elasticsearch
+
+        self.client = Elasticsearch(settings.SEARCH_ELASTICSEARCH_URL)
+        self.index_name = settings.SEARCH_ELASTICSEARCH_INDEX
+
+    def setup(self):
+        if not self.client.indices.exists(index=self.index_name):
+            self.client.indices.create(
+                index=self.index_name,
+                body={
+                    "mappings": {
+                        "properties": {
+                            "owner": {"type": "keyword"},
+                            "title": {"type": "search_as_you_type"},
+                            "input_url": {"type": "text"},
+                            "file_name": {"type": "search_as_you_type"},
+                        }
+                    }
+                },
+            )
+
+    def index(self, docs):
+        from elasticsearch.helpers import bulk
+
+        bulk(
+            self.client,
+            (
+                {"_index": self.index_name, "_id": doc["id"], "_source": doc}
+                for doc in docs
+            ),
+        )
+
+    def remove(self, code_ids):
+        from elasticsearch.helpers import bulk
+
+        bulk(
+            self.client,
+            (
+                {"_op_type": "delete", "_index": self.index_name, "_id": code_id}
+                for code_id in code_ids
+            ),
+            raise_on_error=False,
+        )
+
+    def clear(self):
+        self.client.delete_by_query(
+            index=self.index_name, body={"query": {"match_all": {}}}
+        )
+
+    def search(self, user_id, query, limit, offset=0):
+        if not terms(query):
+            return []
+        response = self.client.search(
+            index=self.index_name,
+            body={
+                "query": {
+                    "bool": {
+                        "filter": [{"term": {"owner": user_id}}],
+                        "must": {
+                            "multi_match": {
+                                "query": query,
+                                "type": "bool_prefix",
+                                "operator": "and",
+                                "fields": ["title^10", "file_name^5", "input_url^2"],
+                            }
+                        },
+                    }
+                },
+                "from": offset,
+                "size": limit,
+                "_source": False,
+            },
+        )
+        return [int(hit["_id"]) for hit in response["hits"]["hits"]]
+
+
+backend = SimpleLazyObject(
+    lambda: import_string(
+        getattr(settings, "SEARCH_BACKEND", "qrgen.search.SQLiteFTSBackend")
+    )()
+)
+
+
+def _index(code_ids):
+    # a save is never failed by the index, it's caught up with
+    # rebuild_search_index
+    try:
+        backend.index(documents(code_ids))
+    except Exception:
+        logger.exception("could not index codes %s", code_ids)
+
+
+def _remove(code_ids):
+    try:
+        backend.remove(code_ids)
+    except Exception:
+        logger.exception("could not remove codes %s from the index", code_ids)
+
+
+_local = threading.local()
+
+
+@contextmanager
+def bulk_delete():
+    """
+    Deletes in the block leave the index alone, the caller unindexes the
+    codes with one unindex() call instead of one per row.
+    """
+    _local.bulk_delete = True
+    try:
+        yield
+    finally:
+        _local.bulk_delete = False
+
+
+def reindex(code_ids):
+    code_ids = list(code_ids)
+    transaction.on_commit(lambda: _index(code_ids))
+
+
+def unindex(code_ids):
+    code_ids = list(code_ids)
+    transaction.on_commit(lambda: _remove(code_ids))
+
+
+def search(user, query, limit, offset=0):
+    """Ids of the user's codes matching query, best match first."""
+    return backend.search(user.id, query, limit, offset)
+
+
+def search_codes(user, query, limit, offset=0):
+    """The matching QrCode objects, in rank order."""
+    from .models import QrCode
+
+    ids = search(user, query, limit, offset)
+    codes = QrCode.objects.filter(user=user).in_bulk(ids)
+    return [codes[code_id] for code_id in ids if code_id in codes]
+
+
+# signal receivers, connected in QrgenConfig.ready
+
+
+def code_saved(sender, instance, **kwargs):
+    reindex([instance.id])
+
+
+def code_deleted(sender, instance, **kwargs):
+    if not getattr(_local, "bulk_delete", False):
+        unindex([instance.id])
+
+
+def setup_index(sender, **kwargs):
+    backend.setup()
@@ -0,0 +1,399 @@
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage, Storage
+from django.utils.deconstruct import deconstructible
+from django.utils.functional import LazyObject
+
+logger = logging.getLogger(__name__)
+
+PENDING_DIR = ".pending"
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=2, thread_name_prefix="qrgen-storage"
+            )
+        return _executor
+
+
+def _cleanup(blobs, folders):
+    for storage, name in blobs:
+        try:
+            storage.delete(name)
+        except Exception:
+            # collect_orphans will find it again
+            logger.exception("could not delete %s", name)
+    for folder in folders:
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+def cleanup_in_background(blobs=(), folders=()):
+    """
+    Delete stored blobs, given as (storage, name) pairs, and local folders
+    off the request thread.
+    """
+    blobs, folders = list(blobs), list(folders)
+    if blobs or folders:
+        _get_executor().submit(_cleanup, blobs, folders)
+
+
+# eviction policies: order hot tier entries (path, size, atime, mtime) from
+# the first to evict to the last
+
+
+def lru(entries):
+    return sorted(entries, key=lambda entry: entry[2])
+
+
+def fifo(entries):
+    return sorted(entries, key=lambda entry: entry[3])
+
+
+def largest_first(entries):
+    return sorted(entries, key=lambda entry: entry[1], reverse=True)
+
+
+EVICTION_POLICIES = {"lru": lru, "fifo": fifo, "largest": largest_first}
+
+
+class LazyStorage(LazyObject):
+    """
+    Storage built on first use, like django's default_storage, so importing
+    the models doesn't import the Cloudinary SDK and its dependencies.
+    """
+
+    def __init__(self, factory):
+        super().__init__()
+        self.__dict__["_factory"] = factory
+
+    def _setup(self):
+        self._wrapped = self._factory()
+
+    def __bool__(self):
+        # FileField tests `storage or default_storage`
+        return True
+
+
+@deconstructible
+class TieredStorage(Storage):
+    """
+    Local filesystem hot tier in front of a remote cold tier.
+
+    Writes land in the hot tier and are uploaded to the cold tier in the
+    background; until the upload is done the object is marked pending and
+    served locally. Reads are answered from the hot tier, objects missing
+    there are fetched back from the cold tier. Once the hot tier grows
+    past max_hot_bytes, uploaded objects are evicted in the order given by
+    the eviction policy (see EVICTION_POLICIES).
+
+    The hot tier's size is counted as this process writes, fetches and
+    deletes, the directory is only walked when the count goes past
+    max_hot_bytes (to pick what to evict) and by sync_storage, which also
+    catches up with what the other workers wrote.
+    """
+
+    def __init__(
+        self,
+        cold_storage=None,
+        location=None,
+        base_url=None,
+        max_hot_bytes=None,
+        eviction=None,
+        upload_async=True,
+    ):
+        self.hot = FileSystemStorage(
+            location=location or settings.TIERED_STORAGE_HOT_LOCATION,
+            base_url=base_url,
+        )
+        if cold_storage is None:
+            from .cold_storage import ColdRawMediaCloudinaryStorage
+
+            cold_storage = ColdRawMediaCloudinaryStorage()
+        self.cold = cold_storage
+        self.max_hot_bytes = (
+            max_hot_bytes
+            if max_hot_bytes is not None
+            else settings.TIERED_STORAGE_MAX_HOT_BYTES
+        )
+        self.eviction = EVICTION_POLICIES[eviction or settings.TIERED_STORAGE_EVICTION]
+        self.upload_async = upload_async
+        # bytes in the hot tier, None until first measured
+        self.hot_bytes = None
+        self._hot_bytes_lock = threading.Lock()
+
+    # pending uploads are tracked with marker files so they survive restarts
+
+    def _pending_path(self, name):
+        return os.path.join(self.hot.location, PENDING_DIR, name)
+
+    def is_pending(self, name):
+        return os.path.exists(self._pending_path(name))
+
+    def _mark_pending(self, name):
+        marker = self._pending_path(name)
+        os.makedirs(os.path.dirname(marker), exist_ok=True)
+        open(marker, "w").close()
+
+    def _clear_pending(self, name):
+        try:
+            os.remove(self._pending_path(name))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def pending(self):
+        root = os.path.join(self.hot.location, PENDING_DIR)
+        for dirpath, dirnames, filenames in os.walk(root):
+            for filename in filenames:
+                marker = os.path.join(dirpath, filename)
+                yield os.path.relpath(marker, root).replace(os.sep, "/")
+
+    def _hot_exists(self, name):
+        return os.path.isfile(self.hot.path(name))
+
+    def _count(self, delta):
+        with self._hot_bytes_lock:
+            if self.hot_bytes is not None:
+                self.hot_bytes += delta
+
+    def _hot_size(self, name):
+        try:
+            return os.path.getsize(self.hot.path(name))
+        except OSError:
+            return 0
+
+    def _touch(self, name):
+        # record the access time for LRU without changing the mtime
+        path = self.hot.path(name)
+        try:
+            os.utime(path, (time.time(), os.stat(path).st_mtime))
+        except OSError:
+            pass
+
+    # writes
+
+    def _save(self, name, content):
+        name = self.hot._save(name, content)
+        self._count(self._hot_size(name))
+        self._mark_pending(name)
+        if self.upload_async:
+            _get_executor().submit(self.upload, name)
+        else:
+            self.upload(name)
+        return name
+
+    def upload(self, name):
+        try:
+            if self.cold.exists(name):
+                # left over by an interrupted upload of the same object
+                self.cold.delete(name)
+            with self.hot.open(name) as content:
+                cold_name = self.cold.save(name, content)
+        except Exception:
+            logger.exception("upload of %s to the cold tier failed", name)
+            return
+        if cold_name != name:
+            logger.error("cold tier stored %s as %s", name, cold_name)
+            return
+        if not self._clear_pending(name):
+            # deleted while the upload was in flight
+            self.cold.delete(name)
+            return
+        self.evict()
+
+    def upload_pending(self):
+        for name in list(self.pending()):
+            if self._hot_exists(name):
+                self.upload(name)
+            else:
+                self._clear_pending(name)
+
+    # reads
+
+    def _fetch(self, name):
+        path = self.hot.path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self.cold.open(name) as remote:
+            # write next to the target and rename so readers never see a
+            # partial file
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+            with os.fdopen(fd, "wb") as local:
+                for chunk in remote.chunks():
+                    local.write(chunk)
+        os.replace(tmp_path, path)
+        self._count(os.path.getsize(path))
+
+    def _open(self, name, mode="rb"):
+        if self._hot_exists(name):
+            self._touch(name)
+        else:
+            self._fetch(name)
+        return self.hot._open(name, mode)
+
+    def path(self, name):
+        # only objects currently in the hot tier have a local path
+        if self._hot_exists(name):
+            self._touch(name)
+            return self.hot.path(name)
+        raise NotImplementedError("This object is only stored in the cold tier.")
+
+    def exists(self, name):
+        return self._hot_exists(name) or self.cold.exists(name)
+
+    def url(self, name):
+        if self.is_pending(name):
+            return self.hot.url(name)
+        return self.cold.url(name)
+
+    def size(self, name):
+        if self._hot_exists(name):
+            return self.hot.size(name)
+        return self.cold.size(name)
+
+    def listdir(self, path):
+        directories, files = set(), set()
+        if self.hot.exists(path):
+            hot_dirs, hot_files = self.hot.listdir(path)
+            directories.update(d for d in hot_dirs if d != PENDING_DIR)
+            files.update(hot_files)
+        cold_dirs, cold_files = self.cold.listdir(path)
+        directories.update(cold_dirs)
+        files.update(cold_files)
+        return sorted(directories), sorted(files)
+
+    def get_modified_time(self, name):
+        if self._hot_exists(name):
+            return self.hot.get_modified_time(name)
+        return self.cold.get_modified_time(name)
+
+    def delete(self, name):
+        self._clear_pending(name)
+        size = self._hot_size(name)
+        self.hot.delete(name)
+        self._count(-size)
+        self.cold.delete(name)
+
+    # eviction
+
+    def hot_entries(self):
+        pending_root = os.path.join(self.hot.location, PENDING_DIR)
+        for dirpath, dirnames, filenames in os.walk(self.hot.location):
+            if dirpath.startswith(pending_root):
+                continue
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                yield path, stat.st_size, stat.st_atime, stat.st_mtime
+
+    def evict(self, rescan=False):
+        """
+        Evicts uploaded objects until the hot tier fits max_hot_bytes,
+        returns how many. Walks the hot tier only when the counted size
+        (or, with rescan, the measured one) is over the limit.
+        """
+        if self.hot_bytes is not None and not rescan:
+            if self.hot_bytes <= self.max_hot_bytes:
+                return 0
+        entries = list(self.hot_entries())
+        total = sum(entry[1] for entry in entries)
+        self.hot_bytes = total
+        if total <= self.max_hot_bytes:
+            return 0
+        evicted = 0
+        for path, size, atime, mtime in self.eviction(entries):
+            if total <= self.max_hot_bytes:
+                break
+            name = os.path.relpath(path, self.hot.location).replace(os.sep, "/")
+            if self.is_pending(name):
+                # not in the cold tier yet
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            evicted += 1
+        self.hot_bytes = total
+        return evicted
+
+
+# paged listings, for sweeps over a whole folder (collect_orphans)
+
+
+def _cloudinary_pages(storage, folder, cursor, page_size):
+    import cloudinary.api
+
+    prefix = storage._normalize_path(folder)
+    while True:
+        options = {
+            "type": "upload",
+            "prefix": prefix,
+            "resource_type": storage.RESOURCE_TYPE,
+            "max_results": min(page_size, 500),
+            "tags": True,
+        }
+        if cursor is not None:
+            options["next_cursor"] = cursor
+        response = cloudinary.api.resources(**options)
+        entries = []
+        for resource in response["resources"]:
+            tail = resource["public_id"].replace(prefix, "", 1)
+            if storage.TAG in resource["tags"] and "/" not in tail:
+                created = resource["created_at"].replace("Z", "+00:00")
+                entries.append((f"{folder}/{tail}", datetime.fromisoformat(created)))
+        cursor = response.get("next_cursor")
+        yield entries, cursor
+        if cursor is None:
+            return
+
+
+def _local_pages(storage, folder, cursor, page_size):
+    try:
+        directories, files = storage.listdir(folder)
+    except FileNotFoundError:
+        files = []
+    names = [f"{folder}/{filename}" for filename in sorted(files)]
+    if cursor is not None:
+        names = [name for name in names if name > cursor]
+    for start in range(0, len(names), page_size):
+        page = names[start : start + page_size]
+        entries = []
+        for name in page:
+            try:
+                entries.append((name, storage.get_modified_time(name)))
+            except (FileNotFoundError, NotImplementedError):
+                entries.append((name, None))
+        yield entries, page[-1] if start + page_size < len(names) else None
+
+
+def list_pages(storage, folder, cursor=None, page_size=500):
+    """
+    Pages of the files directly in folder, as (entries, cursor) pairs:
+    entries are (name, modified datetime or None), cursor resumes the
+    listing after the page and is None after the last one. Cloudinary is
+    listed page by page with its own cursor, other storages by name. A
+    tiered storage lists its cold tier, objects only in the hot tier are
+    pending uploads.
+    """
+    if isinstance(storage, TieredStorage):
+        storage = storage.cold
+    if hasattr(storage, "RESOURCE_TYPE") and hasattr(storage, "TAG"):
+        return _cloudinary_pages(storage, folder, cursor, page_size)
+    return _local_pages(storage, folder, cursor, page_size)
@@ -1,4 +1,4 @@
-from django.test import TestCase, Client
+from django.test import TestCase, Client, override_settings
 from django.urls import reverse
 from django.contrib.auth.models import User
 from qrgen.models import QrCode, QrType, File
@@ -6,7 +6,26 @@ import os, shutil
 from django.conf import settings
 from django.core.files.uploadedfile import SimpleUploadedFile
 from qrgen.views import create_or_get_types
+from qrgen.storage import TieredStorage, list_pages
+from qrgen.uploads import size_limit
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
 import tempfile
+from io import StringIO
+from django.core.management import call_command
+from qrgen.search import backend, search
+from qrgen import export
+import csv, gzip, json
+import asyncio, threading, time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from qrgen import linkcheck
+from qrgen.models import LinkCheck
+from qrgen import encoding, rendering
+import io
+import qrcode
+import tracemalloc
+from unittest import mock
+from PIL import Image
 
 
 class GenerationDashboardViewTestCase(TestCase):
@@ -34,6 +53,19 @@ class GenerationDashboardViewTestCase(TestCase):
         if os.path.exists(folder_path):
             shutil.rmtree(folder_path)
 
+    def test_generate_view_rejects_unsafe_url(self):
+        form_data = {
+            "generate": "true",
+            "qrcode_type": "dynamic",
+            "action_type": "url",
+            "url": "https://example.com/\r\nX-Injected: 1",
+        }
+        response = self.client.post(
+            self.generate_url, form_data, HTTP_X_REQUESTED_WITH="XMLHttpRequest"
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(QrCode.objects.exists())
+
     def test_generate_view_get(self):
         # Vérifier si la vue génère une réponse HTTP 200 pour une requête GET
         response = self.client.get(self.generate_url)
@@ -253,6 +285,11 @@ class DeleteQrCodeTestCase(TestCase):
     #     self.assertRedirects(response, reverse("qrgen:dashboard"))
 
 
+class NullWriter:
+    def write(self, data):
+        pass
+
+
 class DownloadQrCodeTestCase(TestCase):
     def setUp(self):
         self.client = Client()
@@ -270,6 +307,99 @@ class DownloadQrCodeTestCase(TestCase):
             password=self.user_credentials["password"],
         )
 
+    def test_download_png_is_streamed(self):
+        create_or_get_types()
+        qrcode = QrCode.objects.create(
+            user=self.user, title="Test QR Code", type=QrType.objects.get(name="dynamic")
+        )
+        folder = os.path.join(settings.BASE_DIR, f"temp/qrcodes/{qrcode.id}")
+        os.makedirs(folder, exist_ok=True)
+        self.addCleanup(shutil.rmtree, folder)
+        with open(os.path.join(folder, "Test QR Code.png"), "wb") as f:
+            f.write(b"png content")
+
+        response = self.client.get(
+            reverse("qrgen:download_qrcode", args=[qrcode.id, "png"])
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["Content-Type"], "application/adminupload")
+        self.assertEqual(
+            response["Content-Disposition"], "inline;filename=Test QR Code.png"
+        )
+        self.assertEqual(b"".join(response.streaming_content), b"png content")
+
+    def test_download_poster(self):
+        create_or_get_types()
+        qrcode = QrCode.objects.create(
+            user=self.user,
+            title="Poster",
+            type=QrType.objects.get(name="dynamic"),
+            action_url="https://example.com",
+        )
+        self.addCleanup(
+            shutil.rmtree, os.path.join(settings.BASE_DIR, f"temp/qrcodes/{qrcode.id}")
+        )
+        url = reverse("qrgen:download_qrcode", args=[qrcode.id, "poster"])
+
+        response = self.client.get(url, {"cm": "5", "dpi": "300"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response["Content-Disposition"], "inline;filename=Poster-5cm-300dpi.png"
+        )
+        image = Image.open(io.BytesIO(b"".join(response.streaming_content)))
+        self.assertEqual(image.mode, "1")
+        # 591px asked, 33 modules (border included) of 18px
+        self.assertEqual(image.size, (594, 594))
+        self.assertAlmostEqual(image.info["dpi"][0], 300, places=1)
+        self.assertEqual(image.getpixel((0, 0)), 255)
+        # the top left finder pattern, after a 4 module border
+        self.assertEqual(image.getpixel((80, 80)), 0)
+        self.assertEqual(image.getpixel((135, 135)), 0)
+
+        for bad in ("x", "nan", "inf", "-inf"):
+            self.assertEqual(self.client.get(url, {"cm": bad}).status_code, 400)
+            self.assertEqual(self.client.get(url, {"dpi": bad}).status_code, 400)
+        with self.settings(POSTER_SIZES_CM=[1, 5], POSTER_DPIS=[72, 300]):
+            response = self.client.get(url, {"cm": "5.3", "dpi": "1e9"})
+        self.assertEqual(
+            response["Content-Disposition"], "inline;filename=Poster-5cm-300dpi.png"
+        )
+        self.assertEqual(
+            os.listdir(os.path.join(settings.BASE_DIR, f"temp/qrcodes/{qrcode.id}")),
+            [f"poster-{qrcode.id}-5cm-300dpi.png"],
+        )
+
+        # the title never reaches the file system
+        qrcode.title = "../../Menu / Spring"
+        qrcode.save()
+        response = self.client.get(url, {"cm": "5"})
+        self.assertEqual(
+            response["Content-Disposition"], "inline;filename=Menu_Spring-5cm-300dpi.png"
+        )
+        self.assertEqual(
+            os.listdir(os.path.join(settings.BASE_DIR, f"temp/qrcodes/{qrcode.id}")),
+            [f"poster-{qrcode.id}-5cm-300dpi.png"],
+        )
+
+        # only for the owner
+        User.objects.create_user(username="other", password="pass")
+        other = Client()
+        other.login(username="other", password="pass")
+        self.assertEqual(other.get(url, {"cm": "5"}).status_code, 404)
+        self.assertEqual(Client().get(url, {"cm": "5"}).status_code, 404)
+
+    def test_poster_memory_is_one_row(self):
+        tracemalloc.start()
+        try:
+            side = rendering.write_large_png("https://example.com", NullWriter(), 20000, 600)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        self.assertGreaterEqual(side, 20000 - 33)
+        # the whole 1-bit image would be 50 MB
+        self.assertLess(peak, 2 * 1024 * 1024)
+
     # def test_download_view(self):
     #     # Create a temporary image file for testing
     #     with open("media/qrcodes/qrcode-1.png", "rb") as f:
@@ -300,3 +430,971 @@ class DownloadQrCodeTestCase(TestCase):
     #     # Assertions
     #     self.assertEqual(response.status_code, 200)
     #     self.assertEqual(response["Content-Type"], "application/adminupload")
+
+
+class MediaCachingTestCase(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.media_root, "qrcodes"))
+        with open(os.path.join(self.media_root, "qrcodes", "qrcode-1.png"), "wb") as f:
+            f.write(b"\x89PNG\r\n\x1a\n")
+        variant_settings = override_settings(
+            IMAGE_VARIANT_ROOT=os.path.join(self.media_root, ".variants")
+        )
+        variant_settings.enable()
+        self.addCleanup(variant_settings.disable)
+
+    def tearDown(self):
+        shutil.rmtree(self.media_root)
+
+    def write_code(self):
+        # an RGB png as PIL writes it for a branded code
+        image = rendering.render(
+            "https://example.com", rendering.Style(fill="#1d3557", back="#f1faee")
+        )
+        image.save(os.path.join(self.media_root, "qrcodes", "qrcode-2.png"))
+        return image
+
+    def test_png_is_sent_as_its_smallest_variant(self):
+        image = self.write_code()
+        path = os.path.join(self.media_root, "qrcodes", "qrcode-2.png")
+        original = os.path.getsize(path)
+        with self.settings(MEDIA_ROOT=self.media_root):
+            response = self.client.get("/media/qrcodes/qrcode-2.png")
+        self.assertEqual(response["Content-Type"], "image/png")
+        self.assertIn("Accept", response["Vary"])
+        body = b"".join(response.streaming_content)
+        self.assertLess(len(body), original / 2)
+        decoded = Image.open(io.BytesIO(body)).convert("RGB")
+        self.assertEqual(decoded.tobytes(), image.tobytes())
+
+    def test_webp_when_accepted(self):
+        image = self.write_code()
+        accept = "image/avif,image/webp,image/png,*/*;q=0.8"
+        with self.settings(MEDIA_ROOT=self.media_root):
+            png = self.client.get("/media/qrcodes/qrcode-2.png")
+            response = self.client.get(
+                "/media/qrcodes/qrcode-2.png", HTTP_ACCEPT=accept
+            )
+            self.assertIn(response["Content-Type"], ["image/webp", "image/avif"])
+            self.assertNotEqual(response["ETag"], png["ETag"])
+            body = b"".join(response.streaming_content)
+            if response["Content-Type"] == "image/webp":
+                decoded = Image.open(io.BytesIO(body)).convert("RGB")
+                self.assertEqual(decoded.tobytes(), image.tobytes())
+
+            # encoded once
+            with mock.patch("QRGenProject.variants.encode") as encode:
+                again = self.client.get(
+                    "/media/qrcodes/qrcode-2.png", HTTP_ACCEPT=accept
+                )
+                revalidated = self.client.get(
+                    "/media/qrcodes/qrcode-2.png",
+                    HTTP_ACCEPT=accept,
+                    HTTP_IF_NONE_MATCH=response["ETag"],
+                )
+            encode.assert_not_called()
+            self.assertEqual(b"".join(again.streaming_content), body)
+            self.assertEqual(revalidated.status_code, 304)
+
+            no_webp = self.client.get(
+                "/media/qrcodes/qrcode-2.png", HTTP_ACCEPT="image/webp;q=0"
+            )
+            self.assertEqual(no_webp["Content-Type"], "image/png")
+
+    def test_variants_can_be_turned_off(self):
+        self.write_code()
+        with self.settings(MEDIA_ROOT=self.media_root, IMAGE_VARIANTS_ENABLED=False):
+            response = self.client.get(
+                "/media/qrcodes/qrcode-2.png", HTTP_ACCEPT="image/webp"
+            )
+        self.assertEqual(response["Content-Type"], "image/png")
+        self.assertFalse(response.has_header("Vary"))
+
+    def test_generated_image_is_immutable_with_validators(self):
+        with self.settings(MEDIA_ROOT=self.media_root):
+            response = self.client.get("/media/qrcodes/qrcode-1.png")
+            self.assertEqual(response.status_code, 200)
+            self.assertIn("immutable", response["Cache-Control"])
+            self.assertIn("Last-Modified", response)
+            etag = response["ETag"]
+
+            response = self.client.get(
+                "/media/qrcodes/qrcode-1.png", HTTP_IF_NONE_MATCH=etag
+            )
+            self.assertEqual(response.status_code, 304)
+
+    def test_image_is_streamed_from_disk(self):
+        with self.settings(MEDIA_ROOT=self.media_root):
+            response = self.client.get("/media/qrcodes/qrcode-1.png")
+            self.assertTrue(response.streaming)
+            self.assertEqual(b"".join(response.streaming_content), b"\x89PNG\r\n\x1a\n")
+
+    def test_image_is_handed_to_the_proxy(self):
+        with self.settings(
+            MEDIA_ROOT=self.media_root,
+            MEDIA_DELIVERY_BACKEND="nginx",
+            MEDIA_ACCEL_LOCATIONS={self.media_root: "/internal/media/"},
+        ):
+            response = self.client.get("/media/qrcodes/qrcode-1.png")
+            self.assertEqual(
+                response["X-Accel-Redirect"], "/internal/media/qrcodes/qrcode-1.png"
+            )
+            self.assertEqual(response.content, b"")
+
+    def test_missing_image_is_not_found(self):
+        with self.settings(MEDIA_ROOT=self.media_root):
+            response = self.client.get("/media/qrcodes/missing.png")
+            self.assertEqual(response.status_code, 404)
+
+
+class BrokenStorage(FileSystemStorage):
+    def _save(self, name, content):
+        raise OSError("cold tier unavailable")
+
+
+class AutoFormatUrlTestCase(TestCase):
+    def test_image_urls_negotiate_the_format(self):
+        import cloudinary
+        from qrgen.cold_storage import (
+            AutoFormatMediaCloudinaryStorage,
+            ColdMediaCloudinaryStorage,
+        )
+
+        with mock.patch.object(cloudinary.config(), "cloud_name", "demo"):
+            for storage in (AutoFormatMediaCloudinaryStorage(), ColdMediaCloudinaryStorage()):
+                url = storage.url("qrcodes/qrcode-1.png")
+                self.assertIn("/image/upload/f_auto/", url)
+                self.assertTrue(url.endswith("qrcodes/qrcode-1.png"))
+
+
+class TieredStorageTestCase(TestCase):
+    def setUp(self):
+        self.hot_dir = tempfile.mkdtemp()
+        self.cold_dir = tempfile.mkdtemp()
+        # a local directory stands in for the remote tier
+        self.cold = FileSystemStorage(location=self.cold_dir, base_url="/cold/")
+        self.storage = TieredStorage(
+            cold_storage=self.cold,
+            location=self.hot_dir,
+            base_url="/media/",
+            max_hot_bytes=1000,
+            upload_async=False,
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.hot_dir)
+        shutil.rmtree(self.cold_dir)
+
+    def test_write_goes_to_both_tiers(self):
+        name = self.storage.save("qrcodes/a.png", ContentFile(b"a" * 10))
+        self.assertEqual(name, "qrcodes/a.png")
+        self.assertTrue(os.path.exists(os.path.join(self.hot_dir, name)))
+        self.assertTrue(self.cold.exists(name))
+        self.assertFalse(self.storage.is_pending(name))
+        self.assertEqual(self.storage.url(name), "/cold/qrcodes/a.png")
+        self.assertEqual(self.storage.path(name), os.path.join(self.hot_dir, name))
+
+    def test_failed_upload_stays_pending_and_local(self):
+        self.storage.cold = BrokenStorage(location=self.cold_dir)
+        name = self.storage.save("qrcodes/a.png", ContentFile(b"a" * 10))
+        self.assertTrue(self.storage.is_pending(name))
+        self.assertEqual(self.storage.url(name), "/media/qrcodes/a.png")
+        self.assertFalse(self.cold.exists(name))
+
+        self.storage.cold = self.cold
+        self.storage.upload_pending()
+        self.assertFalse(self.storage.is_pending(name))
+        self.assertTrue(self.cold.exists(name))
+
+    def test_eviction_keeps_pending_and_refetches_from_cold(self):
+        first = self.storage.save("qrcodes/first.png", ContentFile(b"1" * 600))
+        os.utime(os.path.join(self.hot_dir, first), (1, 1))
+        second = self.storage.save("qrcodes/second.png", ContentFile(b"2" * 600))
+
+        self.assertFalse(os.path.exists(os.path.join(self.hot_dir, first)))
+        self.assertTrue(os.path.exists(os.path.join(self.hot_dir, second)))
+        with self.assertRaises(NotImplementedError):
+            self.storage.path(first)
+
+        with self.storage.open(first) as f:
+            self.assertEqual(f.read(), b"1" * 600)
+        self.assertTrue(os.path.exists(os.path.join(self.hot_dir, first)))
+
+    def test_hot_tier_size_is_counted_not_walked(self):
+        self.storage.save("qrcodes/a.png", ContentFile(b"a" * 300))
+        self.assertEqual(self.storage.hot_bytes, 300)
+        with mock.patch.object(self.storage, "hot_entries") as hot_entries:
+            self.storage.save("qrcodes/b.png", ContentFile(b"b" * 300))
+            self.storage.delete("qrcodes/a.png")
+        hot_entries.assert_not_called()
+        self.assertEqual(self.storage.hot_bytes, 300)
+
+        # written by another worker, found by sync_storage's rescan
+        with open(os.path.join(self.hot_dir, "qrcodes", "c.png"), "wb") as f:
+            f.write(b"c" * 800)
+        self.assertEqual(self.storage.evict(), 0)
+        self.assertEqual(self.storage.evict(rescan=True), 1)
+        self.assertEqual(self.storage.hot_bytes, 800)
+
+    def test_delete_removes_both_tiers(self):
+        name = self.storage.save("user_files/a.pdf", ContentFile(b"pdf"))
+        self.storage.delete(name)
+        self.assertFalse(self.storage.exists(name))
+        self.assertFalse(self.cold.exists(name))
+
+    def test_names_are_unique_across_tiers(self):
+        name = self.storage.save("user_files/a.pdf", ContentFile(b"1" * 600))
+        os.remove(os.path.join(self.hot_dir, name))
+        other = self.storage.save("user_files/a.pdf", ContentFile(b"2"))
+        self.assertNotEqual(name, other)
+
+
+class UploadDedupeTestCase(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username="testuser", password="testpass")
+        self.client.login(username="testuser", password="testpass")
+        create_or_get_types()
+        # keep uploads local instead of going to the cloud
+        self.media_dir = tempfile.mkdtemp()
+        field = File._meta.get_field("file")
+        self.addCleanup(setattr, field, "storage", field.storage)
+        field.storage = FileSystemStorage(location=self.media_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.media_dir)
+
+    def create_code(self):
+        return QrCode.objects.create(
+            user=self.user,
+            action_type="pdf",
+            type=QrType.objects.get(name="dynamic"),
+        )
+
+    def upload(self, qrcode, name, content, content_type="application/pdf"):
+        return self.client.post(
+            reverse("qrgen:edit_qrcode", args=[qrcode.id]),
+            {
+                "change_content": "true",
+                "new_file": SimpleUploadedFile(name, content, content_type=content_type),
+            },
+        )
+
+    def test_identical_uploads_share_one_blob(self):
+        first, second = self.create_code(), self.create_code()
+        self.upload(first, "a.pdf", b"same content")
+        self.upload(second, "b.pdf", b"same content")
+        first.refresh_from_db()
+        second.refresh_from_db()
+
+        self.assertNotEqual(first.file_id, second.file_id)
+        self.assertEqual(first.file.file.name, second.file.file.name)
+        self.assertEqual(second.file.name, "b.pdf")
+        self.assertEqual(len(os.listdir(os.path.join(self.media_dir, "user_files"))), 1)
+
+    def test_upload_is_hashed(self):
+        qrcode = self.create_code()
+        self.upload(qrcode, "a.pdf", b"content")
+        qrcode.refresh_from_db()
+        self.assertEqual(
+            qrcode.file.sha256,
+            "ed7002b439e9ac845f22357d822bac1444730fbdb6016d3ec9432297b9ec9f73",
+        )
+
+    def test_oversized_upload_is_dropped(self):
+        qrcode = self.create_code()
+        with self.settings(UPLOAD_SIZE_LIMITS={"application/pdf": 10}):
+            response = self.upload(qrcode, "a.pdf", b"x" * 100)
+        self.assertRedirects(
+            response, reverse("qrgen:dashboard"), fetch_redirect_response=False
+        )
+        qrcode.refresh_from_db()
+        self.assertIsNone(qrcode.file)
+        self.assertFalse(File.objects.exists())
+
+    def test_size_limits_per_type(self):
+        with self.settings(
+            UPLOAD_SIZE_LIMITS={"application/pdf": 3, "image/": 2},
+            UPLOAD_DEFAULT_SIZE_LIMIT=1,
+        ):
+            self.assertEqual(size_limit("application/pdf"), 3)
+            self.assertEqual(size_limit("image/png"), 2)
+            self.assertEqual(size_limit("text/plain"), 1)
+
+
+class CollectOrphansTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpass")
+        create_or_get_types()
+        self.media_dir = tempfile.mkdtemp()
+        self.state = os.path.join(self.media_dir, "gc-state.json")
+        self.storage = FileSystemStorage(location=self.media_dir)
+        for model, name in ((File, "file"), (QrCode, "img")):
+            field = model._meta.get_field(name)
+            self.addCleanup(setattr, field, "storage", field.storage)
+            field.storage = self.storage
+
+        self.storage.save("user_files/live.pdf", ContentFile(b"live"))
+        self.storage.save("user_files/orphan.pdf", ContentFile(b"orphan"))
+        self.storage.save("qrcodes/orphan.png", ContentFile(b"png"))
+        live_file = File.objects.create(
+            user=self.user, name="live.pdf", file="user_files/live.pdf"
+        )
+        self.qrcode = QrCode.objects.create(
+            user=self.user,
+            type=QrType.objects.get(name="dynamic"),
+            file=live_file,
+        )
+
+        self.temp_root = os.path.join(settings.BASE_DIR, "temp", "qrcodes")
+        for code_id in (self.qrcode.id, 999999):
+            os.makedirs(os.path.join(self.temp_root, str(code_id)), exist_ok=True)
+            with open(os.path.join(self.temp_root, str(code_id), "a.png"), "wb") as f:
+                f.write(b"12345")
+
+    def tearDown(self):
+        shutil.rmtree(self.media_dir)
+        shutil.rmtree(os.path.join(settings.BASE_DIR, "temp"), ignore_errors=True)
+
+    def collect(self, *args):
+        out = StringIO()
+        call_command(
+            "collect_orphans",
+            "--rate=0",
+            f"--state={self.state}",
+            "--min-age=0",
+            *args,
+            stdout=out,
+        )
+        return out.getvalue()
+
+    def test_dry_run_reports_without_deleting(self):
+        output = self.collect("--dry-run")
+        self.assertIn("3 orphans, 14 bytes reclaimable", output)
+        self.assertTrue(self.storage.exists("user_files/orphan.pdf"))
+        self.assertTrue(os.path.exists(os.path.join(self.temp_root, "999999")))
+
+    def test_orphans_are_deleted(self):
+        self.collect()
+        self.assertTrue(self.storage.exists("user_files/live.pdf"))
+        self.assertFalse(self.storage.exists("user_files/orphan.pdf"))
+        self.assertFalse(self.storage.exists("qrcodes/orphan.png"))
+        self.assertTrue(os.path.exists(os.path.join(self.temp_root, str(self.qrcode.id))))
+        self.assertFalse(os.path.exists(os.path.join(self.temp_root, "999999")))
+
+    def test_interrupted_run_resumes(self):
+        output = self.collect("--batch-size=1", "--limit=1")
+        self.assertIn("files: 0 orphans", output)
+        self.assertTrue(self.storage.exists("user_files/orphan.pdf"))
+
+        output = self.collect("--batch-size=1")
+        self.assertIn("files: 1 orphans", output)
+        self.assertFalse(self.storage.exists("user_files/orphan.pdf"))
+
+
+    def test_recent_objects_are_kept(self):
+        output = self.collect("--min-age=60")
+        self.assertIn("0 orphans", output)
+        self.assertTrue(self.storage.exists("user_files/orphan.pdf"))
+        self.assertTrue(os.path.exists(os.path.join(self.temp_root, "999999")))
+
+        old = time.time() - 2 * 60 * 60
+        os.utime(self.storage.path("user_files/orphan.pdf"), (old, old))
+        output = self.collect("--min-age=60")
+        self.assertIn("files: 1 orphans", output)
+        self.assertFalse(self.storage.exists("user_files/orphan.pdf"))
+        self.assertTrue(self.storage.exists("qrcodes/orphan.png"))
+
+    def test_stale_variants_are_deleted(self):
+        from QRGenProject import variants
+
+        self.storage.save("qrcodes/live.png", ContentFile(b"png"))
+        self.qrcode.img = "qrcodes/live.png"
+        self.qrcode.save()
+        variant_root = os.path.join(self.media_dir, "variants")
+        with self.settings(MEDIA_ROOT=self.media_dir, IMAGE_VARIANT_ROOT=variant_root):
+            stat = os.stat(self.storage.path("qrcodes/live.png"))
+            current = variants.variant_path("qrcodes/live.png", stat, "webp")
+            # made before the original was rewritten, of a deleted original
+            stale = current.replace("-3.webp", "-4.avif")
+            orphan = variants.variant_path("qrcodes/gone.png", stat, "png")
+            for path in (current, stale, orphan):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, "wb") as f:
+                    f.write(b"variant")
+            output = self.collect("--dry-run")
+            self.assertIn("variants: 2 orphans, 14 bytes", output)
+            self.assertTrue(os.path.exists(stale))
+
+            self.collect()
+            self.assertTrue(os.path.exists(current))
+            self.assertFalse(os.path.exists(stale))
+            self.assertFalse(os.path.exists(orphan))
+
+    def test_listing_is_paged(self):
+        pages = list(list_pages(self.storage, "user_files", page_size=1))
+        self.assertEqual(
+            [(entries[0][0], cursor) for entries, cursor in pages],
+            [
+                ("user_files/live.pdf", "user_files/live.pdf"),
+                ("user_files/orphan.pdf", None),
+            ],
+        )
+        resumed = list(list_pages(self.storage, "user_files", "user_files/live.pdf"))
+        names = [name for name, modified in resumed[0][0]]
+        self.assertEqual(names, ["user_files/orphan.pdf"])
+
+
+class BulkQrCodeTestCase(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.bulk_url = reverse("qrgen:bulk")
+        self.user = User.objects.create_user(username="testuser", password="testpass")
+        self.other = User.objects.create_user(username="other", password="testpass")
+        self.client.login(username="testuser", password="testpass")
+        create_or_get_types()
+        qr_type = QrType.objects.get(name="dynamic")
+        self.codes = [
+            QrCode.objects.create(user=self.user, type=qr_type) for _ in range(3)
+        ]
+        self.foreign = QrCode.objects.create(user=self.other, type=qr_type)
+
+    def bulk(self, action, ids, **extra):
+        return self.client.post(
+            self.bulk_url,
+            {"action": action, "ids": ids, **extra},
+            HTTP_X_REQUESTED_WITH="XMLHttpRequest",
+        )
+
+    def test_deactivate_and_activate(self):
+        ids = [code.id for code in self.codes[:2]]
+        response = self.bulk("deactivate", ids)
+        self.assertEqual(response.json(), {"action": "deactivate", "count": 2})
+        self.assertEqual(
+            QrCode.objects.filter(user=self.user, is_active=False).count(), 2
+        )
+
+        self.bulk("activate", ids)
+        self.assertFalse(QrCode.objects.filter(is_active=False).exists())
+
+    def test_retitle(self):
+        response = self.bulk("retitle", [self.codes[0].id], title="Menu")
+        self.assertEqual(response.json()["count"], 1)
+        self.codes[0].refresh_from_db()
+        self.assertEqual(self.codes[0].title, "Menu")
+
+        response = self.bulk("retitle", [self.codes[0].id], title="x" * 51)
+        self.assertEqual(response.status_code, 400)
+
+    def test_delete_is_set_based(self):
+        ids = [code.id for code in self.codes] + [self.foreign.id]
+        # user (the session is cached), owned codes, codes collected for
+        # the delete signals, delete, then one delete from the search index
+        with self.assertNumQueries(5), self.captureOnCommitCallbacks(execute=True):
+            response = self.bulk("delete", ids)
+        self.assertEqual(response.json()["count"], 3)
+        self.assertFalse(QrCode.objects.filter(user=self.user).exists())
+        self.assertTrue(QrCode.objects.filter(id=self.foreign.id).exists())
+
+    def test_delete_removes_unshared_files(self):
+        field = File._meta.get_field("file")
+        self.addCleanup(setattr, field, "storage", field.storage)
+        media_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_dir, True)
+        field.storage = FileSystemStorage(location=media_dir)
+        own = File.objects.create(user=self.user, name="a.pdf", file="user_files/a.pdf")
+        shared = File.objects.create(
+            user=self.other, name="b.pdf", file="user_files/a.pdf"
+        )
+        self.codes[0].file = own
+        self.codes[0].save()
+
+        self.bulk("delete", [self.codes[0].id])
+        self.assertFalse(File.objects.filter(id=own.id).exists())
+        self.assertTrue(File.objects.filter(id=shared.id).exists())
+
+    def test_other_users_codes_are_untouched(self):
+        response = self.bulk("deactivate", [self.foreign.id])
+        self.assertEqual(response.json()["count"], 0)
+        self.foreign.refresh_from_db()
+        self.assertTrue(self.foreign.is_active)
+
+    def test_unknown_action(self):
+        response = self.bulk("explode", [self.codes[0].id])
+        self.assertEqual(response.status_code, 400)
+
+    def test_form_post_redirects_to_dashboard(self):
+        response = self.client.post(
+            self.bulk_url, {"action": "deactivate", "ids": [self.codes[0].id]}
+        )
+        self.assertRedirects(
+            response, reverse("qrgen:dashboard"), fetch_redirect_response=False
+        )
+
+
+class SearchTestCase(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username="testuser", password="testpass")
+        self.other = User.objects.create_user(username="other", password="testpass")
+        self.client.login(username="testuser", password="testpass")
+        create_or_get_types()
+        self.qr_type = QrType.objects.get(name="dynamic")
+
+    def create_code(self, user, title, input_url="https://example.com", file=None):
+        # the index is written once the transaction commits
+        with self.captureOnCommitCallbacks(execute=True):
+            return QrCode.objects.create(
+                user=user,
+                type=self.qr_type,
+                title=title,
+                input_url=input_url,
+                action_type="web",
+                file=file,
+            )
+
+    def test_search_is_ranked_and_scoped_to_the_user(self):
+        in_url = self.create_code(self.user, "Flyer", "https://menu.example.com")
+        in_title = self.create_code(self.user, "Lunch menu")
+        self.create_code(self.other, "Dinner menu")
+        self.create_code(self.user, "Business card")
+        self.assertEqual(search(self.user, "menu", 10), [in_title.id, in_url.id])
+
+    def test_prefix_and_file_name(self):
+        upload = File.objects.create(user=self.user, name="price-list.pdf")
+        code = self.create_code(self.user, "Untitled", file=upload)
+        self.assertEqual(search(self.user, "pric", 10), [code.id])
+        self.assertEqual(search(self.user, "price list", 10), [code.id])
+        self.assertEqual(search(self.user, "  ", 10), [])
+
+    def test_index_follows_saves_and_deletes(self):
+        code = self.create_code(self.user, "Old title")
+        code.title = "New title"
+        with self.captureOnCommitCallbacks(execute=True):
+            code.save()
+        self.assertEqual(search(self.user, "old", 10), [])
+        self.assertEqual(search(self.user, "new", 10), [code.id])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            code.delete()
+        self.assertEqual(search(self.user, "new", 10), [])
+
+    def test_index_failures_dont_fail_saves(self):
+        code = self.create_code(self.user, "Menu")
+        broken = mock.patch.multiple(
+            backend,
+            index=mock.Mock(side_effect=ConnectionError),
+            remove=mock.Mock(side_effect=ConnectionError),
+        )
+        with broken, self.assertLogs("qrgen.search", "ERROR") as logs:
+            code.title = "Flyer"
+            with self.captureOnCommitCallbacks(execute=True):
+                code.save()
+            self.create_code(self.user, "Poster")
+            with self.captureOnCommitCallbacks(execute=True):
+                code.delete()
+        self.assertEqual(len(logs.records), 3)
+        self.assertEqual(QrCode.objects.get().title, "Poster")
+
+    def test_bulk_retitle_is_reindexed(self):
+        code = self.create_code(self.user, "Poster")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                reverse("qrgen:bulk"),
+                {"action": "retitle", "ids": [code.id], "title": "Banner"},
+                HTTP_X_REQUESTED_WITH="XMLHttpRequest",
+            )
+        self.assertEqual(search(self.user, "banner", 10), [code.id])
+
+    def test_pagination(self):
+        codes = [self.create_code(self.user, f"menu {i}") for i in range(5)]
+        first = search(self.user, "menu", 3)
+        second = search(self.user, "menu", 3, offset=3)
+        self.assertEqual(len(first), 3)
+        self.assertEqual(sorted(first + second), [code.id for code in codes])
+
+    def test_rebuild_search_index(self):
+        code = self.create_code(self.user, "Flyer")
+        backend.clear()
+        self.assertEqual(search(self.user, "flyer", 10), [])
+        out = StringIO()
+        call_command("rebuild_search_index", stdout=out)
+        self.assertIn("1 codes indexed", out.getvalue())
+        self.assertEqual(search(self.user, "flyer", 10), [code.id])
+
+
+class ExportQrCodesTestCase(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.export_url = reverse("qrgen:export")
+        self.user = User.objects.create_user(username="testuser", password="testpass")
+        other = User.objects.create_user(username="other", password="testpass")
+        self.client.login(username="testuser", password="testpass")
+        create_or_get_types()
+        qr_type = QrType.objects.get(name="dynamic")
+        self.codes = [
+            QrCode.objects.create(
+                user=self.user,
+                type=qr_type,
+                title=f"code, {i}",
+                input_url="https://example.com",
+                action_type="web",
+                scan_count=i,
+            )
+            for i in range(3)
+        ]
+        QrCode.objects.create(user=other, type=qr_type, action_type="web")
+
+    def test_csv(self):
+        response = self.client.get(self.export_url)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["Content-Type"], "text/csv")
+        self.assertIn('filename="qrcodes.csv"', response["Content-Disposition"])
+        content = b"".join(response.streaming_content).decode()
+        rows = list(csv.DictReader(content.splitlines()))
+        self.assertEqual([row["title"] for row in rows], ["code, 0", "code, 1", "code, 2"])
+        self.assertEqual(rows[2]["scan_count"], "2")
+        self.assertEqual(rows[0]["type"], "dynamic")
+
+    def test_jsonl_gzipped(self):
+        response = self.client.get(self.export_url, {"format": "jsonl", "gzip": "1"})
+        self.assertEqual(response["Content-Type"], "application/gzip")
+        content = gzip.decompress(b"".join(response.streaming_content)).decode()
+        rows = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual([row["id"] for row in rows], [code.id for code in self.codes])
+
+    def test_unknown_format(self):
+        response = self.client.get(self.export_url, {"format": "xlsx"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_rows_are_buffered_into_chunks(self):
+        chunks = list(export.buffered(["a" * 10] * 10, size=25))
+        self.assertEqual([len(chunk) for chunk in chunks], [30, 30, 30, 10])
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    # destinations with every behaviour the link checker has to handle
+    def respond(self, method):
+        self.server.requests.append((method, self.path, dict(self.headers)))
+        if self.path == "/ok":
+            if self.headers.get("If-None-Match") == '"v1"':
+                self.send_response(304)
+            else:
+                self.send_response(200)
+                self.send_header("ETag", '"v1"')
+        elif self.path == "/nohead":
+            self.send_response(405 if method == "HEAD" else 200)
+        elif self.path == "/moved":
+            self.send_response(301)
+            self.send_header("Location", "/ok")
+        elif self.path == "/slow":
+            time.sleep(1)
+            self.send_response(200)
+        else:
+            self.send_response(404)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_HEAD(self):
+        self.respond("HEAD")
+
+    def do_GET(self):
+        self.respond("GET")
+
+    def log_message(self, *args):
+        pass
+
+
+@override_settings(LINK_CHECK_TIMEOUT=0.5)
+# the stand-in server listens on loopback
+@override_settings(LINK_CHECK_ALLOW_PRIVATE=True)
+class LinkCheckTestCase(TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+        self.server.requests = []
+        thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.base = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def results(self, *paths, etag=""):
+        targets = [(self.base + path, etag, "") for path in paths]
+        results = asyncio.run(linkcheck.check_all(targets))
+        return {result.url[len(self.base) :]: result for result in results}
+
+    def test_statuses(self):
+        results = self.results("/ok", "/nohead", "/moved", "/gone", "/slow")
+        self.assertEqual(results["/ok"].status, 200)
+        self.assertEqual(results["/ok"].etag, '"v1"')
+        self.assertEqual(results["/nohead"].status, 200)
+        self.assertEqual(results["/moved"].status, 200)
+        self.assertEqual(results["/gone"].status, 404)
+        self.assertEqual((results["/slow"].status, results["/slow"].error), (0, "timeout"))
+        methods = [method for method, path, _ in self.server.requests if path == "/nohead"]
+        self.assertEqual(methods, ["HEAD", "GET"])
+
+    def test_refused_connection(self):
+        result = asyncio.run(linkcheck.check_all([("http://127.0.0.1:1/", "", "")]))[0]
+        self.assertEqual((result.status, result.error), (0, "connection failed"))
+
+    def test_request_line_is_quoted(self):
+        self.results("/q?name=caf\u00e9&x=%20y", "/p\u00e4th")
+        paths = {path for _, path, _ in self.server.requests}
+        self.assertEqual(paths, {"/p%C3%A4th", "/q?name=caf%C3%A9&x=%20y"})
+
+    def test_unusable_urls(self):
+        targets = [
+            ("http:///x", "", ""),
+            ("http://[::1/", "", ""),
+            (self.base + "/ok?a=1\r\nX-Injected: 1", "", ""),
+            (self.base + "/ok?a=b c", "", ""),
+        ]
+        with override_settings(LINK_CHECK_ALLOW_PRIVATE=False):
+            targets.append((self.base + "/ok", "", ""))
+            results = asyncio.run(linkcheck.check_all(targets))
+        errors = {result.url: result.error for result in results}
+        self.assertEqual(
+            errors,
+            {
+                "http:///x": "no host",
+                "http://[::1/": "connection failed",
+                self.base + "/ok?a=1\r\nX-Injected: 1": "invalid url",
+                self.base + "/ok?a=b c": "invalid url",
+                self.base + "/ok": "private address",
+            },
+        )
+        self.assertEqual(self.server.requests, [])
+
+    def test_unexpected_errors_stay_with_their_url(self):
+        check = linkcheck.check
+
+        async def flaky(url, *args):
+            if url.endswith("/gone"):
+                raise RuntimeError("boom")
+            return await check(url, *args)
+
+        with mock.patch.object(linkcheck, "check", flaky), self.assertLogs(
+            "qrgen.linkcheck", "ERROR"
+        ):
+            results = self.results("/ok", "/gone")
+        self.assertEqual(results["/ok"].status, 200)
+        self.assertEqual((results["/gone"].status, results["/gone"].error), (0, "check failed"))
+
+    def test_conditional_request(self):
+        result = self.results("/ok", etag='"v1"')["/ok"]
+        self.assertEqual((result.status, result.etag), (304, '"v1"'))
+        self.assertEqual(self.server.requests[0][2]["If-None-Match"], '"v1"')
+
+    def test_command_and_dashboard(self):
+        user = User.objects.create_user(username="testuser", password="testpass")
+        create_or_get_types()
+        field = QrCode._meta.get_field("img")
+        self.addCleanup(setattr, field, "storage", field.storage)
+        field.storage = FileSystemStorage(location=tempfile.gettempdir())
+        for path in ("/ok", "/gone", "/gone"):
+            QrCode.objects.create(
+                user=user,
+                type=QrType.objects.get(name="dynamic"),
+                input_url=self.base + path,
+                action_type="web",
+                img="qrcodes/code.png",
+            )
+        LinkCheck.objects.create(url_hash=1, checked="2020-01-01T00:00Z")
+
+        out = StringIO()
+        call_command("check_destinations", stdout=out)
+        self.assertIn("2 urls checked", out.getvalue())
+        self.assertIn("1 unreachable, 1 stale results removed", out.getvalue())
+        self.assertEqual(LinkCheck.objects.count(), 2)
+        gone = LinkCheck.objects.get(url_hash=linkcheck.url_hash(self.base + "/gone"))
+        self.assertEqual((gone.status, gone.failures), (404, 1))
+
+        call_command("check_destinations", stdout=out)
+        gone.refresh_from_db()
+        self.assertEqual(gone.failures, 2)
+        # the etag of the first check was sent along
+        ok = [headers for _, path, headers in self.server.requests if path == "/ok"]
+        self.assertEqual(ok[-1].get("If-None-Match"), '"v1"')
+
+        self.client.login(username="testuser", password="testpass")
+        response = self.client.get(reverse("qrgen:dashboard"))
+        self.assertContains(response, "Destination unreachable (404)", count=2)
+
+
+class RenderingTestCase(TestCase):
+    def setUp(self):
+        rendering.forget_logos()
+        self.addCleanup(rendering.forget_logos)
+        logo = io.BytesIO()
+        Image.new("RGB", (200, 100), "red").save(logo, "PNG")
+        self.logo = logo.getvalue()
+
+    def test_make_style_validates(self):
+        self.assertEqual(rendering.make_style(), rendering.Style())
+        for kwargs in (
+            {"fill": "black"},
+            {"fill": "#777777", "back": "#888888"},
+            {"fill": "#ffffff", "back": "#000000"},
+            {"shape": "star"},
+            {"logo": b"not an image"},
+        ):
+            with self.assertRaises(rendering.InvalidStyle):
+                rendering.make_style(**kwargs)
+
+    def test_logo_pixel_size_is_limited(self):
+        # a few kilobytes of PNG for 40 million pixels
+        out = io.BytesIO()
+        Image.new("1", (8000, 5000)).save(out, "PNG")
+        self.assertLess(len(out.getvalue()), rendering.LOGO_MAX_BYTES)
+        with self.assertRaisesMessage(rendering.InvalidStyle, "4096x4096"):
+            rendering.make_style(logo=out.getvalue())
+
+    def test_error_correction_follows_the_style(self):
+        constants = qrcode.constants
+        self.assertEqual(
+            rendering.error_correction(rendering.make_style()), constants.ERROR_CORRECT_M
+        )
+        self.assertEqual(
+            rendering.error_correction(rendering.make_style(shape="circle")),
+            constants.ERROR_CORRECT_Q,
+        )
+        self.assertEqual(
+            rendering.error_correction(rendering.make_style(logo=self.logo)),
+            constants.ERROR_CORRECT_H,
+        )
+
+    def test_plain_style_is_plain_qrcode(self):
+        image = rendering.render("https://example.com", rendering.make_style())
+        self.assertEqual(image.mode, "1")
+        self.assertEqual(image.size, qrcode.make("https://example.com").size)
+
+    def test_colours_and_logo(self):
+        style = rendering.make_style(fill="#1d3557", back="#f1faee", logo=self.logo)
+        image = rendering.render("https://example.com", style)
+        self.assertEqual(image.getpixel((0, 0)), (0xF1, 0xFA, 0xEE))
+        # the top left finder pattern, dark
+        self.assertEqual(image.getpixel((45, 45)), (0x1D, 0x35, 0x57))
+        center = image.getpixel((image.width // 2, image.height // 2))
+        self.assertEqual(center, (255, 0, 0))
+
+    def test_logo_assets_are_cached(self):
+        first = rendering.logo_asset(self.logo, 100, "#ffffff")
+        self.assertIs(rendering.logo_asset(self.logo, 100, "#ffffff"), first)
+        self.assertIsNot(rendering.logo_asset(self.logo, 120, "#ffffff"), first)
+        self.assertEqual(first.size, (100, 100))
+
+    def test_generation_form_with_style(self):
+        User.objects.create_user(username="brand", password="pass")
+        self.client.login(username="brand", password="pass")
+        field = QrCode._meta.get_field("img")
+        self.addCleanup(setattr, field, "storage", field.storage)
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        self.addCleanup(shutil.rmtree, os.path.join(settings.BASE_DIR, "temp"), True)
+        field.storage = FileSystemStorage(location=media_root)
+
+        create_or_get_types()
+        url = reverse("qrgen:generate")
+        data = {
+            "generate": "true",
+            "qrcode_type": "dynamic",
+            "action_type": "url",
+            "url": "https://example.com",
+            "module_shape": "star",
+        }
+        response = self.client.post(url, data)
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(QrCode.objects.exists())
+
+        data.update(module_shape="circle", fill_color="#264653")
+        data["logo"] = SimpleUploadedFile("logo.png", self.logo, "image/png")
+        response = self.client.post(url, data)
+        self.assertEqual(response.status_code, 200)
+        with QrCode.objects.get().img.open() as f:
+            self.assertEqual(Image.open(f).mode, "RGB")
+
+
+def png_chunks(data):
+    # chunk types of a png, in order
+    types, position = [], 8
+    while position < len(data):
+        length = int.from_bytes(data[position : position + 4], "big")
+        types.append(data[position + 4 : position + 8])
+        position += length + 12
+    return types
+
+
+class EncodingTestCase(TestCase):
+    def setUp(self):
+        self.plain = qrcode.make("https://example.com").get_image()
+        self.branded = rendering.render(
+            "https://example.com", rendering.Style(fill="#1d3557", back="#f1faee")
+        )
+
+    def assertLossless(self, data, image):
+        decoded = Image.open(io.BytesIO(data)).convert("RGB")
+        self.assertEqual(decoded.tobytes(), image.convert("RGB").tobytes())
+
+    def test_black_on_white_is_1_bit_greyscale(self):
+        for image in (self.plain, self.plain.convert("RGB")):
+            data = encoding.encode_png(image)
+            self.assertLossless(data, image)
+            self.assertEqual(Image.open(io.BytesIO(data)).mode, "1")
+            self.assertEqual(png_chunks(data), [b"IHDR", b"IDAT", b"IEND"])
+            out = io.BytesIO()
+            image.save(out, "PNG")
+            self.assertLess(len(data), len(out.getvalue()) * 0.75)
+
+    def test_two_colours_are_a_1_bit_palette(self):
+        data = encoding.encode_png(self.branded)
+        self.assertLossless(data, self.branded)
+        self.assertEqual(png_chunks(data), [b"IHDR", b"PLTE", b"IDAT", b"IEND"])
+        # bit depth
+        self.assertEqual(data[24], 1)
+
+    def test_other_images_are_left_to_pil(self):
+        shaped = rendering.render(
+            "https://example.com", rendering.make_style(shape="circle", fill="#1d3557")
+        )
+        data = encoding.encode_png(shaped)
+        self.assertLossless(data, shaped)
+        self.assertEqual(Image.open(io.BytesIO(data)).mode, "RGB")
+
+    def test_reencode_images_command(self):
+        user = User.objects.create_user(username="backfill")
+        create_or_get_types()
+        field = QrCode._meta.get_field("img")
+        self.addCleanup(setattr, field, "storage", field.storage)
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        field.storage = FileSystemStorage(location=media_root)
+        code = QrCode.objects.create(user=user, type=QrType.objects.get(name="dynamic"))
+        out = io.BytesIO()
+        self.branded.save(out, "PNG")
+        code.img.save("qrcode-1.png", ContentFile(out.getvalue()))
+        old_name = code.img.name
+
+        stdout = StringIO()
+        call_command("reencode_images", "--dry-run", stdout=stdout)
+        self.assertIn("1 images read, 1 smaller re-encoded (dry run", stdout.getvalue())
+        code.refresh_from_db()
+        self.assertEqual(code.img.name, old_name)
+
+        stdout = StringIO()
+        with mock.patch(
+            "qrgen.management.commands.reencode_images.cleanup_in_background"
+        ) as cleanup:
+            call_command("reencode_images", stdout=stdout)
+        self.assertIn("bytes saved per ms", stdout.getvalue())
+        code.refresh_from_db()
+        self.assertNotEqual(code.img.name, old_name)
+        cleanup.assert_called_once_with([(field.storage, old_name)])
+        with code.img.open("rb") as f:
+            self.assertLossless(f.read(), self.branded)
+
+        # already minimal
+        stdout = StringIO()
+        call_command("reencode_images", stdout=stdout)
+        self.assertIn("1 images read, 0 smaller re-encoded", stdout.getvalue())
@@ -0,0 +1,86 @@
+import hashlib
+
+from django.conf import settings
+from django.core.files.uploadhandler import SkipFile, TemporaryFileUploadHandler
+
+from .models import File
+
+MB = 1024 * 1024
+
+
+def size_limit(content_type):
+    # most specific entry of UPLOAD_SIZE_LIMITS matching the content type
+    limits = getattr(settings, "UPLOAD_SIZE_LIMITS", {})
+    content_type = (content_type or "").lower()
+    if content_type in limits:
+        return limits[content_type]
+    main_type = content_type.split("/")[0] + "/"
+    if main_type in limits:
+        return limits[main_type]
+    return getattr(settings, "UPLOAD_DEFAULT_SIZE_LIMIT", 10 * MB)
+
+
+class HashingUploadHandler(TemporaryFileUploadHandler):
+    """
+    Streams uploads to a temporary file in chunks while computing their
+    SHA-256, and drops a file as soon as it grows past the size limit of
+    its type. The digest is exposed as ``uploaded_file.sha256``.
+    """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.hasher = hashlib.sha256()
+        self.limit = size_limit(self.content_type)
+        if self.content_length is not None and self.content_length > self.limit:
+            self.reject()
+
+    def receive_data_chunk(self, raw_data, start):
+        if start + len(raw_data) > self.limit:
+            self.reject()
+        self.hasher.update(raw_data)
+        self.file.write(raw_data)
+
+    def file_complete(self, file_size):
+        uploaded_file = super().file_complete(file_size)
+        uploaded_file.sha256 = self.hasher.hexdigest()
+        return uploaded_file
+
+    def reject(self):
+        rejected = getattr(self.request, "rejected_uploads", [])
+        rejected.append(self.field_name)
+        self.request.rejected_uploads = rejected
+        raise SkipFile
+
+
+def file_digest(uploaded_file):
+    digest = getattr(uploaded_file, "sha256", None)
+    if digest is None:
+        # in-memory uploads or files that didn't go through the handler
+        hasher = hashlib.sha256()
+        for chunk in uploaded_file.chunks():
+            hasher.update(chunk)
+        uploaded_file.seek(0)
+        digest = hasher.hexdigest()
+    return digest
+
+
+def store_upload(user, uploaded_file):
+    """
+    Create the File row for an upload, pointing it at an already stored
+    blob with the same content when there is one instead of storing and
+    transferring the bytes again.
+    """
+    digest = file_digest(uploaded_file)
+    existing = (
+        File.objects.filter(sha256=digest)
+        .exclude(file="")
+        .values_list("file", flat=True)
+        .first()
+    )
+    if existing is not None:
+        return File.objects.create(
+            user=user, name=uploaded_file.name, file=existing, sha256=digest
+        )
+    return File.objects.create(
+        user=user, name=uploaded_file.name, file=uploaded_file, sha256=digest
+    )
@@ -1,5 +1,5 @@
 from django.urls import path
-from .views import GenerationDashboardView, MainDashboardView, DeleteQrCode, EditQrCode, download
+from .views import GenerationDashboardView, MainDashboardView, DeleteQrCode, EditQrCode, BulkQrCodeView, ExportQrCodesView, download
 from . import views
 app_name = 'qrgen'
 
@@ -8,5 +8,7 @@ urlpatterns = [
     path('', MainDashboardView.as_view(), name='dashboard'),
     path('delete/<int:code_id>/', DeleteQrCode.as_view(), name='delete_qrcode'),
     path('edit/<int:code_id>/', EditQrCode.as_view(), name='edit_qrcode'),
+    path('bulk/', BulkQrCodeView.as_view(), name='bulk'),
+    path('export/', ExportQrCodesView.as_view(), name='export'),
     path('download/<int:code_id>/<str:type>/', download, name='download_qrcode'),    
 ]
@@ -1,25 +1,32 @@
 from django.shortcuts import render
 from django.views import View
-import qrcode
 from django.contrib.auth.mixins import LoginRequiredMixin
 
-from django.http import HttpResponseRedirect, HttpResponse
+from django.http import Http404, HttpResponseRedirect, HttpResponse, StreamingHttpResponse
 from django.urls import reverse
 
 # for manipulating our models
 from .models import QrCode, QrType, File
+from handlescan import lookup
+from .uploads import store_upload
+from .storage import cleanup_in_background
+from .search import bulk_delete, reindex, search_codes, unindex
+from .export import FORMATS, export
+from .linkcheck import NOT_REDIRECTED, UNSAFE, dead_links
 
 # for the ajax request
 from django.http import JsonResponse
-from django.core import serializers
 
 # for manipulating folders
+from django.conf import settings
 from QRGenProject.settings import BASE_DIR
+from QRGenProject.media import send_file
+import math
 import os
+import re
 
-# for qrcode image manipulations
-from PIL import Image
-import urllib.request, urllib.parse, urllib.error
+# qrcode, PIL and urllib are imported where they are used, the scan path
+# and a cold start don't need them
 
 
 def create_or_get_types():
@@ -32,6 +39,48 @@ def create_or_get_types():
     return QrType.objects.all()
 
 
+def style_from_request(request):
+    # the optional brand style fields of a generation form, InvalidStyle if
+    # one of them is unusable
+    from .rendering import make_style
+
+    logo = request.FILES.get("logo")
+    return make_style(
+        fill=request.POST.get("fill_color"),
+        back=request.POST.get("back_color"),
+        shape=request.POST.get("module_shape"),
+        logo=logo.read() if logo is not None else None,
+    )
+
+
+def save_qrcode_image(this_qrcode, style=None):
+    from .encoding import encode_png
+    from .rendering import render
+
+    # create a temporary folder to store all the qrcode images if it doesn't exist
+
+    folder_path = BASE_DIR / "temp/qrcodes/"
+    if not os.path.exists(folder_path):
+        os.makedirs(folder_path)
+
+    qr_img = render(this_qrcode.action_url, style)
+
+    # folder for the qrcode being created
+
+    qr_folder_path = BASE_DIR / f"temp/qrcodes/{this_qrcode.id}/"
+
+    if not os.path.exists(qr_folder_path):
+        os.makedirs(qr_folder_path)
+    img_path = f"temp/qrcodes/{this_qrcode.id}/qrcode-{this_qrcode.id}.png"
+    with open(img_path, "wb") as f:
+        f.write(encode_png(qr_img))
+
+    # add and save the qr_img to the QrCode object
+    image = open(img_path, "r+b")
+    this_qrcode.img.save(f"qrcode-{this_qrcode.id}.png", image, save=True)
+    image.close()
+
+
 # @login_required(login_url='/admin/login/')
 # this should be the default user login (i.e. /accounts/login/)
 # note: this is for FBV, for CBV, we use LoginRequiredMixin
@@ -61,6 +110,29 @@ class GenerationDashboardView(LoginRequiredMixin, View):
 
             type = QrType.objects.get(name=request.POST["qrcode_type"])
 
+            uploads = ["pdf", "img", "biz"]
+
+            if form_data["action_type"] in uploads and "upload_file" not in request.FILES:
+                # missing, or dropped by the upload handler for being too large
+                return JsonResponse(
+                    {"error": "the file is missing or too large"}, status=400
+                )
+
+            from .rendering import InvalidStyle
+
+            try:
+                style = style_from_request(request)
+            except InvalidStyle as e:
+                return JsonResponse({"error": str(e)}, status=400)
+
+            if form_data["action_type"] not in NOT_REDIRECTED and UNSAFE.search(
+                form_data.get("url", "")
+            ):
+                return JsonResponse(
+                    {"error": "the url can't contain spaces or control characters"},
+                    status=400,
+                )
+
             # partially create a qrcode object
 
             QrCode.objects.create(
@@ -69,8 +141,6 @@ class GenerationDashboardView(LoginRequiredMixin, View):
                 action_type=form_data["action_type"],
             )
 
-            uploads = ["pdf", "img", "biz"]
-
             # add the qrcode object's action url
 
             # - get the last added qrcode object
@@ -83,15 +153,8 @@ class GenerationDashboardView(LoginRequiredMixin, View):
 
             else:
                 # it is either a pdf or image upload
-                # create a File object
-                File.objects.create(
-                    user=request.user,
-                    name=request.FILES["upload_file"].name,
-                    file=request.FILES["upload_file"],
-                )
-
-                # get the created file
-                created_file = File.objects.all().last()
+                # create a File object (sharing the blob of an identical upload)
+                created_file = store_upload(request.user, request.FILES["upload_file"])
 
                 # add the created file to the QrCode object
                 this_qrcode.file = created_file
@@ -119,28 +182,7 @@ class GenerationDashboardView(LoginRequiredMixin, View):
 
             # having saved the QrCode object, (and a File object (if it was and uploaded file)),
             # we now generate a qrcode image with the QrCode's action_url
-            # create a temporary folder to store all the qrcode images if it doesn't exist
-
-            folder_path = BASE_DIR / "temp/qrcodes/"
-            if not os.path.exists(folder_path):
-                os.makedirs(folder_path)
-
-            # print(folder_path)
-            qr_img = qrcode.make(this_qrcode.action_url)
-
-            # folder for the qrcode being created
-
-            qr_folder_path = BASE_DIR / f"temp/qrcodes/{this_qrcode.id}/"
-
-            if not os.path.exists(qr_folder_path):
-                os.makedirs(qr_folder_path)
-            img_path = f"temp/qrcodes/{this_qrcode.id}/qrcode-{this_qrcode.id}.png"
-            qr_img.save(img_path)
-
-            # add and save the qr_img to the QrCode object
-            image = open(img_path, "r+b")
-            this_qrcode.img.save(f"qrcode-{this_qrcode.id}.png", image, save=True)
-            image.close()
+            save_qrcode_image(this_qrcode, style)
             # print(this_qrcode)
             # serialize the new qrcode object
             # ser_qrcode = serializers.serialize('json', [this_qrcode, ])
@@ -158,7 +200,7 @@ class MainDashboardView(LoginRequiredMixin, View):
         user_codes = (
             QrCode.objects.all().filter(user_id=request.user.id).order_by("-date_gen")
         )
-        download_options = {1: "png", 2: "jpeg", 3: "pdf"}
+        download_options = {1: "png", 2: "jpeg", 3: "pdf", 4: "poster"}
         active_codes = user_codes.filter(is_active=True)
 
         context = {
@@ -169,6 +211,29 @@ class MainDashboardView(LoginRequiredMixin, View):
             "download_options": download_options,
             "upload_types": ["pdf", "img", "biz"],
         }
+
+        query = request.GET.get("q", "").strip()
+        if query:
+            # ranked search results, a page at a time
+            page_size = settings.SEARCH_PAGE_SIZE
+            page = request.GET.get("page", "1")
+            page = max(int(page), 1) if page.isdigit() else 1
+            results = search_codes(
+                request.user, query, page_size + 1, (page - 1) * page_size
+            )
+            context.update(
+                {
+                    "qrcodes": results[:page_size],
+                    "query": query,
+                    "page": page,
+                    "has_next": len(results) > page_size,
+                }
+            )
+        # destinations that failed their last health check (qrgen.linkcheck)
+        codes = [code for code in context["qrcodes"] if code.is_dynamic and code.input_url]
+        dead = dead_links({code.input_url for code in codes})
+        for code in codes:
+            code.dead_link = dead.get(code.input_url)
         return render(request, "qrgen/dashboard.html", context)
 
     def post(request):
@@ -186,17 +251,17 @@ class EditQrCode(LoginRequiredMixin, View):
         if "change_content" in request.POST:
             if "new_content" in request.POST:
                 new_url = request.POST["new_content"]
+                if qrcode.action_type not in NOT_REDIRECTED and UNSAFE.search(new_url):
+                    return JsonResponse(
+                        {"error": "the url can't contain spaces or control characters"},
+                        status=400,
+                    )
                 qrcode.input_url = new_url
             elif (
                 "new_file" in request.FILES
             ):  # Vérifier si le champ de fichier new_file existe
                 old_file = qrcode.file
-                File.objects.create(
-                    user=request.user,
-                    name=request.FILES["new_file"].name,
-                    file=request.FILES["new_file"],
-                )
-                created_file = File.objects.all().last()
+                created_file = store_upload(request.user, request.FILES["new_file"])
                 qrcode.file = created_file
                 if old_file is not None:
                     old_file.delete()
@@ -222,10 +287,156 @@ class DeleteQrCode(LoginRequiredMixin, View):
         return HttpResponseRedirect(reverse("qrgen:dashboard"))
 
 
+def delete_codes(codes):
+    """
+    Delete a queryset of codes with set-based queries, storage cleanup
+    happens in the background. Returns the number of deleted codes.
+    """
+    rows = list(codes.values_list("id", "img", "file_id"))
+    if not rows:
+        return 0
+    code_ids = [code_id for code_id, img, file_id in rows]
+    with bulk_delete():
+        QrCode.objects.filter(id__in=code_ids).delete()
+    unindex(code_ids)
+
+    # files only used by the deleted codes go too, their blobs unless an
+    # identical upload still shares them
+    file_ids = [file_id for code_id, img, file_id in rows if file_id]
+    files = File.objects.filter(id__in=file_ids, qrcode__isnull=True)
+    blob_names = set(files.values_list("file", flat=True))
+    files.delete()
+    blob_names -= set(
+        File.objects.filter(file__in=blob_names).values_list("file", flat=True)
+    )
+
+    file_storage = File._meta.get_field("file").storage
+    image_storage = QrCode._meta.get_field("img").storage
+    cleanup_in_background(
+        blobs=[(image_storage, img) for code_id, img, file_id in rows if img]
+        + [(file_storage, name) for name in blob_names if name],
+        folders=[BASE_DIR / f"temp/qrcodes/{code_id}" for code_id in code_ids],
+    )
+    return len(rows)
+
+
+class BulkQrCodeView(LoginRequiredMixin, View):
+    """
+    Applies one action to a selection of codes with a single set-based
+    query; the ownership check is part of that query so ids of other
+    users are silently ignored.
+    """
+
+    login_url = "/accounts/login"
+    actions = ["delete", "activate", "deactivate", "retitle"]
+
+    def post(self, request):
+        action = request.POST.get("action")
+        ids = [code_id for code_id in request.POST.getlist("ids") if code_id.isdigit()]
+        if action not in self.actions or not ids:
+            return self.respond(request, {"error": "invalid action or selection"}, 400)
+
+        codes = QrCode.objects.filter(user=request.user, id__in=ids)
+
+        if action in ("activate", "deactivate"):
+            count = codes.update(is_active=action == "activate")
+            # update() doesn't send the signals that clear cached scan targets,
+            # the other workers follow within SCAN_LOOKUP_CACHE_TTL
+            lookup.forget([int(code_id) for code_id in ids])
+        elif action == "retitle":
+            title = request.POST.get("title", "").strip()
+            if not title or len(title) > QrCode._meta.get_field("title").max_length:
+                return self.respond(request, {"error": "invalid title"}, 400)
+            count = codes.update(title=title)
+            # update() doesn't send the signals that maintain the index
+            reindex(ids)
+        else:
+            count = delete_codes(codes)
+
+        return self.respond(request, {"action": action, "count": count}, 200)
+
+    def respond(self, request, data, status):
+        if request.headers.get("x-requested-with") == "XMLHttpRequest":
+            return JsonResponse(data, status=status)
+        return HttpResponseRedirect(reverse("qrgen:dashboard"))
+
+
+class ExportQrCodesView(LoginRequiredMixin, View):
+    """
+    Streams all the user's codes, with their scan counts, as CSV or JSON
+    lines (?format=csv|jsonl), gzipped with ?gzip=1.
+    """
+
+    login_url = "/accounts/login"
+
+    def get(self, request):
+        format = request.GET.get("format", "csv")
+        if format not in FORMATS:
+            return JsonResponse({"error": "format must be csv or jsonl"}, status=400)
+        gzip = request.GET.get("gzip") == "1"
+
+        chunks, content_type = export(request.user, format, gzip)
+        response = StreamingHttpResponse(chunks, content_type=content_type)
+        filename = f"qrcodes.{format}" + (".gz" if gzip else "")
+        response["Content-Disposition"] = f'attachment; filename="{filename}"'
+        return response
+
+
+def _nearest(value, allowed):
+    return min(allowed, key=lambda option: abs(option - value))
+
+
+def download_poster(request, qrcode):
+    # large-format png of ?cm=<side in centimetres>&dpi=<resolution>, written
+    # row by row from the module matrix (qrgen.rendering.write_large_png).
+    # Only the owner gets one, and sizes snap to POSTER_SIZES_CM and
+    # POSTER_DPIS so a code has a handful of posters on disk at most
+    from .rendering import INCH, write_large_png
+
+    if qrcode.user_id is None or qrcode.user_id != request.user.id:
+        raise Http404
+    try:
+        cm = float(request.GET.get("cm", getattr(settings, "POSTER_SIZE_CM", 100)))
+        dpi = float(request.GET.get("dpi", getattr(settings, "POSTER_DPI", 300)))
+    except ValueError:
+        return JsonResponse({"error": "cm and dpi must be numbers"}, status=400)
+    if not (math.isfinite(cm) and math.isfinite(dpi)):
+        return JsonResponse({"error": "cm and dpi must be numbers"}, status=400)
+    cm = _nearest(cm, getattr(settings, "POSTER_SIZES_CM", [5, 10, 20, 50, 100]))
+    dpi = _nearest(dpi, getattr(settings, "POSTER_DPIS", [150, 300, 600]))
+    side = round(cm / 100 / INCH * dpi)
+    max_side = getattr(settings, "POSTER_MAX_SIDE", 60000)
+    if side > max_side:
+        return JsonResponse({"error": "the poster is too large"}, status=400)
+
+    # the title is the user's, only the download name is made from it
+    name = f"{cm:g}cm-{dpi}dpi.png"
+    folder = BASE_DIR / f"temp/qrcodes/{qrcode.id}"
+    file_path = folder / f"poster-{qrcode.id}-{name}"
+    if not os.path.exists(file_path):
+        os.makedirs(folder, exist_ok=True)
+        # written aside and renamed, a concurrent download never sees half of it
+        partial = f"{file_path}.{os.getpid()}.part"
+        with open(partial, "wb") as f:
+            write_large_png(qrcode.action_url, f, side, dpi)
+        os.replace(partial, file_path)
+
+    title = re.sub(r"[^\w.-]+", "_", qrcode.title or "").strip("._") or "qrcode"
+    response = send_file(file_path, content_type="application/adminupload")
+    response["Content-Disposition"] = f"inline;filename={title}-{name}"
+    return response
+
+
 def download(request, code_id, type):
+    import urllib.request
+    from PIL import Image
+
     # the the qrcode object
     qrcode = QrCode.objects.get(id=code_id)
 
+    if type == "poster":
+        return download_poster(request, qrcode)
+
     # check for the qrcode locally
     file_path = f"temp/qrcodes/{code_id}/{qrcode.title}.png"
 
@@ -259,9 +470,6 @@ def download(request, code_id, type):
             new_img.save(BASE_DIR / f"temp/qrcodes/{code_id}/{qrcode.title}.jpg")
 
     # downloading it to the user's device
-    with open(file_path, "rb") as fh:
-        response = HttpResponse(fh.read(), content_type="application/adminupload")
-        response["Content-Disposition"] = "inline;filename=" + os.path.basename(
-            file_path
-        )
-        return response
+    response = send_file(file_path, content_type="application/adminupload")
+    response["Content-Disposition"] = "inline;filename=" + os.path.basename(file_path)
+    return response